@@ -0,0 +1,331 @@
+"""
+Benchmarks for stubalyzer.
+
+Run them from the project root, e.g.:
+
+    python dev/benchmark.py build --modules 1000
+    python dev/benchmark.py compare --modules 300
+    python dev/benchmark.py batch --pairs 100000
+    python dev/benchmark.py memory --modules 10000 --packages 100
+"""
+import sys
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ProcessPoolExecutor
+from itertools import cycle, islice
+from pathlib import Path
+from resource import RUSAGE_SELF, getrusage
+from statistics import median
+from tempfile import TemporaryDirectory
+from textwrap import dedent
+from time import perf_counter
+from typing import Callable, List, Tuple
+
+# Benchmark the working tree, not an installed version of stubalyzer
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from stubalyzer.analyze import COMPARE_BATCH_SIZE, analyze_stubs, compare  # noqa
+from stubalyzer.collect import get_stub_types  # noqa: E402
+from stubalyzer.compare import subtype_cache  # noqa: E402
+from stubalyzer.compare import compare_many, compare_symbols  # noqa: E402
+from stubalyzer.types import RelevantSymbolNode  # noqa: E402
+
+TESTING_STUBS_PATH = BASE_DIR / "testing" / "stubs-handwritten"
+TESTING_MYPY_CONFIG_PATH = BASE_DIR / "testing" / "mypy.ini"
+
+SYNTHETIC_MODULE = dedent(
+    """\
+    from typing import Any, Callable, Dict, List, Optional, TypeVar, Union, overload
+    {imports}
+    T = TypeVar("T", bound="Class{index}")
+    Alias{index} = Union[int, str, List[Dict[str, Optional[float]]]]
+    CONSTANT_{index}: int
+
+    class Class{index}{base}:
+        attribute: Alias{index}
+        def __init__(self, value: int, *args: Any, flag: bool = ...) -> None: ...
+        def method(self, a: int, b: str = ...) -> Dict[str, int]: ...
+        @overload
+        def overloaded(self, a: int) -> int: ...
+        @overload
+        def overloaded(self, a: str) -> str: ...
+        @classmethod
+        def create(cls, value: Callable[[int], str]) -> Class{index}: ...
+        @property
+        def value(self) -> Optional[int]: ...
+
+    def function_{index}(a: T, b: Alias{index}, *, c: int = ...) -> T: ...
+    """
+)
+
+
+def write_synthetic_stubs(
+    path: Path, modules: int, package_name: str = "synthetic"
+) -> Path:
+    """
+    Write a package of synthetic stubs, in which every module imports and subclasses
+    a class of the previous one.
+
+    :param path: directory to write the package to
+    :param modules: number of modules to write
+    :param package_name: name of the package
+    :return: path of the directory containing the package
+    """
+    package = path / package_name
+    package.mkdir(parents=True, exist_ok=True)
+    (package / "__init__.pyi").write_text("")
+    for index in range(modules):
+        imports = base = ""
+        if index:
+            imports = f"from .module{index - 1} import Class{index - 1}"
+            base = f"(Class{index - 1})"
+        (package / f"module{index}.pyi").write_text(
+            SYNTHETIC_MODULE.format(index=index, imports=imports, base=base)
+        )
+    return path
+
+
+def measure(name: str, function: Callable[[], object], repeat: int) -> float:
+    """
+    Print and return the median wall-clock time of calling function.
+
+    :param name: name of the measurement to print
+    :param function: function to measure
+    :param repeat: number of measurements to take
+    """
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        timings.append(perf_counter() - start)
+    result = median(timings)
+    print(f"{name:<40} {result:8.3f}s")
+    return result
+
+
+def benchmark_build(args: Namespace) -> None:
+    """Compare full mypy builds to builds that stop after semantic analysis."""
+    config = str(TESTING_MYPY_CONFIG_PATH)
+
+    def collect(stubs_path: Path, semantic_analysis_only: bool) -> Callable[[], int]:
+        return lambda: len(
+            list(
+                get_stub_types(
+                    str(stubs_path),
+                    config,
+                    semantic_analysis_only=semantic_analysis_only,
+                )
+            )
+        )
+
+    with TemporaryDirectory() as tmp_dir:
+        synthetic_path = write_synthetic_stubs(Path(tmp_dir), args.modules)
+        for name, path in [
+            ("testing stubs", TESTING_STUBS_PATH),
+            (f"synthetic stubs ({args.modules} modules)", synthetic_path),
+        ]:
+            print(name)
+            full = measure("  full build", collect(path, False), args.repeat)
+            semanal = measure(
+                "  semantic analysis only", collect(path, True), args.repeat
+            )
+            print(f"  speedup: {full / semanal:.2f}x")
+
+
+def collect_symbols(stubs_path: Path) -> List[RelevantSymbolNode]:
+    """Collect the symbols of the given stubs, without duplicates."""
+    return list(
+        dict.fromkeys(
+            symbol
+            for symbol, _ in get_stub_types(
+                str(stubs_path),
+                str(TESTING_MYPY_CONFIG_PATH),
+                semantic_analysis_only=True,
+            )
+        )
+    )
+
+
+def benchmark_compare(args: Namespace) -> None:
+    """Measure the throughput of comparing symbols, without building the stubs."""
+
+    def run(
+        handwritten: List[RelevantSymbolNode], reference: List[RelevantSymbolNode]
+    ) -> Callable[[], Tuple[int, int]]:
+        def compare_all() -> Tuple[int, int]:
+            # Every run starts with an empty cache, like analyze_stubs does
+            subtype_cache.clear()
+            # Messages are only read for failures, like analyze_stubs does
+            total = failed = 0
+            for result in compare(handwritten, reference):
+                total += 1
+                if result.match_result.value != "match":
+                    failed += 1
+                    len(result.message)
+            return total, failed
+
+        return compare_all
+
+    with TemporaryDirectory() as tmp_dir:
+        synthetic_path = write_synthetic_stubs(Path(tmp_dir, "a"), args.modules)
+        # A separate build of the same stubs, so all symbols match
+        reference_path = write_synthetic_stubs(Path(tmp_dir, "b"), args.modules)
+        for name, handwritten, reference in [
+            (
+                "testing stubs",
+                collect_symbols(TESTING_STUBS_PATH),
+                collect_symbols(TESTING_STUBS_PATH.parent / "stubs-generated"),
+            ),
+            (
+                f"synthetic stubs ({args.modules} modules)",
+                collect_symbols(synthetic_path),
+                collect_symbols(reference_path),
+            ),
+        ]:
+            total, failed = run(handwritten, reference)()
+            print(f"{name}: {total} symbols, {failed} failed")
+            result = measure("  compare", run(handwritten, reference), args.repeat)
+            print(f"  throughput: {total / result:,.0f} symbols/s")
+            stats = subtype_cache.stats()
+            print(f"  identical types: {stats.identical}")
+            print(
+                f"  subtype checks: {stats.hits + stats.misses}"
+                f" ({stats.hit_rate:.1%} cached)"
+            )
+
+
+def benchmark_batch(args: Namespace) -> None:
+    """
+    Measure the throughput of comparing symbol pairs one by one and in batches, on
+    the pairs of synthetic stubs repeated to the given number.
+    """
+    with TemporaryDirectory() as tmp_dir:
+        handwritten = collect_symbols(write_synthetic_stubs(Path(tmp_dir, "a"), 100))
+        reference = {
+            symbol.fullname: symbol
+            for symbol in collect_symbols(
+                write_synthetic_stubs(Path(tmp_dir, "b"), 100)
+            )
+        }
+    symbol_pairs = [(symbol, reference[symbol.fullname]) for symbol in handwritten]
+    pairs = list(islice(cycle(symbol_pairs), args.pairs))
+
+    def one_by_one() -> None:
+        subtype_cache.clear()
+        for symbol, reference_symbol in pairs:
+            compare_symbols(symbol, reference_symbol)
+
+    def batches() -> None:
+        # In batches like stubalyzer.analyze.compare, without keeping the results
+        subtype_cache.clear()
+        for start in range(0, len(pairs), COMPARE_BATCH_SIZE):
+            end = start + COMPARE_BATCH_SIZE
+            for _ in compare_many(pairs[start:end]):
+                pass
+
+    print(f"{len(pairs):,} pairs of {len(symbol_pairs):,} synthetic symbols")
+    for name, function in [
+        ("  compare_symbols", one_by_one),
+        (f"  compare_many ({COMPARE_BATCH_SIZE} per batch)", batches),
+    ]:
+        result = measure(name, function, args.repeat)
+        print(f"  throughput: {len(pairs) / result:,.0f} pairs/s")
+
+
+def analyze_peak_memory(
+    stubs_path: Path, reference_path: Path, single_build: bool
+) -> Tuple[bool, int]:
+    """
+    Analyze the given stubs and return the result and the peak memory of the
+    process in MiB.
+    """
+    success = analyze_stubs(
+        str(TESTING_MYPY_CONFIG_PATH),
+        str(stubs_path),
+        str(reference_path),
+        silent=True,
+        single_build=single_build,
+        semantic_analysis_only=True,
+    )
+    # Kilobytes on Linux
+    return success, getrusage(RUSAGE_SELF).ru_maxrss // 1024
+
+
+def benchmark_memory(args: Namespace) -> None:
+    """
+    Measure the peak memory of analyzing synthetic stubs split into packages, with
+    the default options (a build for each package) and with --single-build, for
+    all packages and for a tenth of them.
+    """
+    modules_per_package = args.modules // args.packages
+
+    def write_packages(path: Path, packages: int) -> Path:
+        for index in range(packages):
+            write_synthetic_stubs(path, modules_per_package, f"synthetic{index}")
+        return path
+
+    for packages in [max(args.packages // 10, 1), args.packages]:
+        with TemporaryDirectory() as tmp_dir:
+            stubs_path = write_packages(Path(tmp_dir, "a"), packages)
+            # A separate copy of the same stubs, so all symbols match
+            reference_path = write_packages(Path(tmp_dir, "b"), packages)
+            print(
+                f"synthetic stubs ({packages} packages of"
+                f" {modules_per_package} modules)"
+            )
+            for name, single_build in [("  default", False), ("  single build", True)]:
+                # In a new process each, so the peak memory is only that of the
+                # analysis
+                with ProcessPoolExecutor(1) as executor:
+                    start = perf_counter()
+                    success, peak_memory = executor.submit(
+                        analyze_peak_memory, stubs_path, reference_path, single_build
+                    ).result()
+                    duration = perf_counter() - start
+                assert success
+                print(f"{name:<40} {duration:8.3f}s {peak_memory:8,} MiB peak")
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Run stubalyzer benchmarks")
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Number of measurements per benchmark"
+    )
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    build_parser = subparsers.add_parser("build", help=benchmark_build.__doc__)
+    build_parser.add_argument(
+        "--modules", type=int, default=500, help="Number of synthetic modules"
+    )
+    build_parser.set_defaults(run=benchmark_build)
+
+    compare_parser = subparsers.add_parser("compare", help=benchmark_compare.__doc__)
+    compare_parser.add_argument(
+        "--modules", type=int, default=300, help="Number of synthetic modules"
+    )
+    compare_parser.set_defaults(run=benchmark_compare)
+
+    batch_parser = subparsers.add_parser("batch", help=benchmark_batch.__doc__)
+    batch_parser.add_argument(
+        "--pairs", type=int, default=100000, help="Number of symbol pairs"
+    )
+    batch_parser.set_defaults(run=benchmark_batch)
+
+    memory_parser = subparsers.add_parser("memory", help=benchmark_memory.__doc__)
+    memory_parser.add_argument(
+        "--modules", type=int, default=10000, help="Number of synthetic modules"
+    )
+    memory_parser.add_argument(
+        "--packages",
+        type=int,
+        default=100,
+        help="Number of packages the modules are split into, one shard each",
+    )
+    memory_parser.set_defaults(run=benchmark_memory)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,81 @@
+import gc
+import pickle
 import re
 import sys
 from argparse import ArgumentParser, Namespace, RawTextHelpFormatter
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from enum import Enum
+from functools import partial
+from heapq import heappush, heappushpop
 from importlib.util import find_spec
 from io import StringIO
 from json import loads as json_loads
 from json.decoder import JSONDecodeError
-from os import linesep, scandir
+from os import SEEK_END, linesep
 from pathlib import Path
-from tempfile import TemporaryDirectory
+from tempfile import TemporaryDirectory, TemporaryFile
 from textwrap import dedent
+from time import perf_counter
 from traceback import format_exception
 from typing import (
+    IO,
     Callable,
+    Container,
     Dict,
     Generator,
     Iterable,
+    Iterator,
     List,
     NamedTuple,
     Optional,
     Set,
+    TextIO,
     Tuple,
+    Union,
 )
-from xml.etree.ElementTree import Element, ElementTree, SubElement
+from xml.etree.ElementTree import Element, SubElement, tostring
 
-from mypy.nodes import TypeAlias, TypeVarExpr, Var
+from mypy.errors import CompileError
+from mypy.nodes import MypyFile, TypeAlias, TypeInfo, TypeVarExpr, Var
 from mypy.stubgen import generate_stubs, parse_options
 from schema import Or, Schema, SchemaError, Use
 
-from .collect import get_stub_types
-from .compare import ComparisonResult, MatchResult, compare_symbols
-from .lookup import lookup_symbol
+from .collect import (
+    COMBINED_CACHE_NAMESPACE,
+    HANDWRITTEN_CACHE_NAMESPACE,
+    REFERENCE_CACHE_NAMESPACE,
+    get_cache_dir,
+    get_combined_stub_types,
+    get_generated_stub_types,
+    get_stub_types,
+    get_stub_types_and_modules,
+    get_stubbed_modules,
+)
+from .compare import (
+    ComparisonResult,
+    MatchResult,
+    compare_class_members,
+    compare_many,
+    subtype_cache,
+)
+from .index import SymbolIndex
+from .lookup import is_top_level, lookup_symbol
+from .signatures import clear_argument_signatures
+from .snapshot import (
+    ComparableSymbol,
+    SymbolSnapshot,
+    TypeAliasSnapshot,
+    TypeVarExprSnapshot,
+    VarSnapshot,
+    clear_formatted_types,
+    read_snapshots,
+    take_snapshots,
+    write_snapshots,
+)
+from .stubcache import StubCache
+from .subtypes import SubtypeCacheStats
 from .types import RelevantSymbolNode
 
 EXPECTED_MISMATCH_SCHEMA = Schema(Or({}, {str: Use(MatchResult.declare_mismatch)}))
@@ -59,6 +103,17 @@ IGNORE_MESSAGE = (
     "{ignored} fail(s) were ignored, "
     "because they were defined to be expected mismatches."
 )
+TIMINGS_MESSAGE = (
+    f"Timings:{linesep}"
+    f"    collecting symbols: {{collect:.3f}}s{linesep}"
+    f"    comparing symbols : {{compare:.3f}}s{linesep}"
+    f"    identical types   : {{identical}}{linesep}"
+    "    subtype checks    : {checks} ({hit_rate:.1%} cached)"
+)
+COMPARE_BATCH_SIZE = 1024
+"""Number of symbol pairs compared at once by compare"""
+SLOWEST_MESSAGE = "Slowest symbols:"
+SLOWEST_SYMBOL_MESSAGE = "    {milliseconds:.3f}ms {symbol} ({kind} in {module})"
 
 
 class EvaluationResult(Enum):
@@ -67,8 +122,21 @@ class EvaluationResult(Enum):
     EXPECTED_FAILURE = "expected_failure"
 
 
+class ShardComparison(NamedTuple):
+    """
+    Picklable record of a comparison result made in a shard worker, with the
+    attributes needed to evaluate and report it.
+    """
+
+    symbol: SymbolSnapshot
+    symbol_name: str
+    match_result: MatchResult
+    message: str
+    duration: float
+
+
 def write_error(
-    *messages: str, sep: str = "", symbol: Optional[RelevantSymbolNode] = None
+    *messages: str, sep: str = "", symbol: Optional[ComparableSymbol] = None
 ) -> None:
     sys.stderr.write(sep.join(messages))
     sys.stderr.write(linesep)
@@ -175,38 +243,304 @@ def parse_command_line() -> Namespace:
         """
         ),
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--cache-dir",
+        required=False,
+        default=None,
+        help=dedent(
+            """
+        Store mypy's incremental cache and the reference stubs
+        generated by stubgen in the given directory, to speed
+        up subsequent runs. The handwritten and the reference
+        stubs use separate caches. Use "python -m
+        stubalyzer.stubcache" to inspect and prune the cached
+        reference stubs.
+        """
+        ),
+    )
+    parser.add_argument(
+        "--single-build",
+        required=False,
+        default=False,
+        action="store_true",
+        help=dedent(
+            """
+        Analyze the handwritten and the reference stubs in a
+        single mypy build, which is faster and uses less memory
+        for small to medium sized stub sets, instead of
+        separate builds for each shard (see --workers).
+        """
+        ),
+    )
+    parser.add_argument(
+        "--semantic-analysis-only",
+        required=False,
+        default=False,
+        action="store_true",
+        help=dedent(
+            """
+        Stop the mypy builds after semantic analysis, instead
+        of type checking all modules. This is faster, but types
+        mypy would infer for variables without annotation are
+        missing.
+        """
+        ),
+    )
+    parser.add_argument(
+        "--jobs",
+        required=False,
+        default=1,
+        type=int,
+        help=dedent(
+            """
+        Number of processes to run stubgen in, when generating
+        the reference stubs with --single-build or
+        --export-reference. Each package is generated by a
+        single process.
+        """
+        ),
+    )
+    parser.add_argument(
+        "--workers",
+        required=False,
+        default=None,
+        type=int,
+        help=dedent(
+            """
+        Analyze the shards of the handwritten stubs in the
+        given number of worker processes. By default the
+        handwritten stubs are split into shards, which are
+        analyzed one after another with separate mypy builds
+        for each shard. The results of each shard are reported
+        as soon as it is analyzed, so the memory needed is
+        bounded by the largest shard instead of the whole stub
+        set. Only --single-build, --export-reference and
+        --reference-snapshot build the whole stub sets at once.
+        """
+        ),
+    )
+    parser.add_argument(
+        "--shard-depth",
+        required=False,
+        default=1,
+        type=int,
+        help=dedent(
+            """
+        Number of leading components of the module names that
+        group modules into a shard (see --workers). By default
+        every top-level package is a shard.
+        """
+        ),
+    )
+    parser.add_argument(
+        "--export-reference",
+        required=False,
+        default=None,
+        metavar="FILE",
+        help=dedent(
+            """
+        Write the symbols collected from the reference stubs
+        to the given file, so they can be used again with
+        --reference-snapshot.
+        """
+        ),
+    )
+    parser.add_argument(
+        "--reference-snapshot",
+        required=False,
+        default=None,
+        metavar="FILE",
+        help=dedent(
+            """
+        Compare against the reference symbols in the given
+        file, written with --export-reference, instead of
+        generating and analyzing reference stubs. The file has
+        to be written with the same version of mypy.
+        """
+        ),
+    )
+    parser.add_argument(
+        "--timings",
+        required=False,
+        default=False,
+        action="store_true",
+        help=dedent(
+            """
+        Print how long collecting and comparing the symbols
+        took, how many types were identical to the reference
+        types and how many subtype checks were answered from
+        the cache. When analyzing shards, the symbols are
+        compared while they are collected.
+        """
+        ),
+    )
+    parser.add_argument(
+        "--time-budget",
+        required=False,
+        default=None,
+        type=float,
+        metavar="SECONDS",
+        help=dedent(
+            """
+        Report symbols which take longer than the given number
+        of seconds to compare as "timeout" instead of their
+        result. Like other results, "timeout" can be declared
+        in the file of expected mismatches.
+        """
+        ),
+    )
+    parser.add_argument(
+        "--slowest",
+        required=False,
+        default=0,
+        type=int,
+        metavar="N",
+        help=dedent(
+            """
+        Print the N symbols which took the longest to compare,
+        with their kind and module.
+        """
+        ),
+    )
+    args = parser.parse_args()
+    if args.workers and args.single_build:
+        parser.error("--single-build can not be combined with --workers")
+    if args.reference_snapshot and (args.reference or args.single_build):
+        parser.error(
+            "--reference-snapshot can not be combined with -r or --single-build"
+        )
+    if args.workers and (args.reference_snapshot or args.export_reference):
+        parser.error(
+            "--reference-snapshot and --export-reference can not be combined with "
+            "--workers"
+        )
+    return args
+
+
+def _compare_batch(
+    pending: List[Union[ComparisonResult, float]],
+    pairs: List[Tuple[ComparableSymbol, ComparableSymbol]],
+    modules: Optional[Dict[str, MypyFile]],
+    time_budget: Optional[float],
+) -> Iterator[ComparisonResult]:
+    """
+    Compare a batch of symbols and yield the results of the batch in order.
+
+    :param pending: results that are known already, and for each pair the seconds
+        spent on it before it is compared
+    :param pairs: symbols to compare with their reference symbols
+    :param modules: see :py:func:`compare`
+    :param time_budget: see :py:func:`compare`
+    """
+    compared = compare_many(pairs, modules)
+    for entry in pending:
+        if isinstance(entry, ComparisonResult):
+            yield entry
+            continue
+        result = next(compared)
+        duration = entry + result.duration
+        if time_budget is not None and duration > time_budget:
+            assert result.reference is not None
+            result = ComparisonResult.create_timeout(
+                result.symbol, result.reference, duration, time_budget
+            )
+        result.duration = duration
+        yield result
 
 
 def compare(
-    hand_written: Iterable[RelevantSymbolNode], generated: Iterable[RelevantSymbolNode]
+    hand_written: Iterable[ComparableSymbol],
+    generated: Union[SymbolIndex, Iterable[ComparableSymbol]],
+    modules: Optional[Dict[str, MypyFile]] = None,
+    time_budget: Optional[float] = None,
 ) -> Generator[ComparisonResult, None, None]:
-    """Compare hand written to generated stubs."""
-    gen_map: Dict[str, RelevantSymbolNode] = {
-        symbol.fullname: symbol for symbol in generated
-    }
+    """
+    Compare hand written to generated stubs.
+
+    The generated stubs are looked up in their :py:func:`stubalyzer.index.SymbolIndex`,
+    which is built from them if they are not given as one.
+
+    The stubs may be given as snapshots (see :py:func:`stubalyzer.snapshot`), the
+    modules to resolve their types against are needed then (see
+    :py:func:`stubalyzer.compare.compare_symbols`).
+
+    The symbols are compared in batches of ``COMPARE_BATCH_SIZE`` (see
+    :py:func:`stubalyzer.compare.compare_many`), the results are yielded in the order
+    of the hand written symbols. The members of classes whose members are the same as
+    in the generated class are not compared one by one (see
+    :py:func:`stubalyzer.compare.compare_class_members`).
+
+    The time it takes to compare each symbol is recorded in the ``duration`` of its
+    result. If a time budget in seconds is given, symbols which take longer to
+    compare get a ``timeout`` result instead. The comparison is not interrupted,
+    since that could leave the state of mypy inconsistent.
+    """
+    if not isinstance(generated, SymbolIndex):
+        generated = SymbolIndex.from_symbols(generated)
+    gen_map = generated.symbols
+    member_index = generated.member_index
+    # Results of the members of matching classes that are yet to be collected
+    member_results: Dict[str, ComparisonResult] = {}
+    pending: List[Union[ComparisonResult, float]] = []
+    pairs: List[Tuple[ComparableSymbol, ComparableSymbol]] = []
 
     for symbol in hand_written:
         name = symbol.fullname
         if name in gen_map:
-            yield compare_symbols(symbol, gen_map[name])
-        elif isinstance(symbol, (TypeAlias, TypeVarExpr, Var)) and re.match(
-            r"_[^_].*", name.split(".")[-1]
-        ):
+            reference = gen_map[name]
+            member_result = member_results.pop(name, None)
+            if (
+                member_result is not None
+                and member_result.symbol is symbol
+                and member_result.reference is reference
+            ):
+                pending.append(member_result)
+                continue
+            start_time = perf_counter()
+            if isinstance(symbol, TypeInfo) and isinstance(reference, TypeInfo):
+                member_results.update(compare_class_members(symbol, reference) or {})
+            pending.append(perf_counter() - start_time)
+            pairs.append((symbol, reference))
+            if len(pairs) >= COMPARE_BATCH_SIZE:
+                yield from _compare_batch(pending, pairs, modules, time_budget)
+                pending, pairs = [], []
+        elif isinstance(
+            symbol,
+            (
+                TypeAlias,
+                TypeVarExpr,
+                Var,
+                TypeAliasSnapshot,
+                TypeVarExprSnapshot,
+                VarSnapshot,
+            ),
+        ) and re.match(r"_[^_].*", name.split(".")[-1]):
             # Ignore symbols that begin with (exactly) one _,
             # since we assume they are private
             continue
         else:
-            lookup_result = lookup_symbol(gen_map, symbol)
+            lookup_result = lookup_symbol(gen_map, symbol, member_index)
             generated_symbol = lookup_result.symbol
             if generated_symbol:
-                yield ComparisonResult.create_mislocated_symbol(
-                    symbol=symbol,
-                    reference=generated_symbol,
-                    data={"containing_class": lookup_result.containing_class},
+                pending.append(
+                    ComparisonResult.create_mislocated_symbol(
+                        symbol=symbol,
+                        reference=generated_symbol,
+                        data={"containing_class": lookup_result.containing_class},
+                    )
+                )
+            elif is_top_level(symbol):
+                # The name index is only built once a top level symbol is not found
+                candidates = generated.name_index.candidates(symbol)
+                pending.append(
+                    ComparisonResult.create_not_found(
+                        symbol, data={"candidates": candidates} if candidates else None
+                    )
                 )
             else:
-                yield ComparisonResult.create_not_found(symbol)
+                pending.append(ComparisonResult.create_not_found(symbol))
+
+    yield from _compare_batch(pending, pairs, modules, time_budget)
 
 
 def setup_expected_mismatches(
@@ -228,7 +562,7 @@ def setup_expected_mismatches(
 
 
 def evaluate_compare_result(
-    compare_result: ComparisonResult,
+    compare_result: Union[ComparisonResult, ShardComparison],
     mismatches: Dict[str, MatchResult],
     mismatches_left: Set[str],
     expected_mismatches_path: Optional[str] = None,
@@ -284,121 +618,840 @@ def evaluate_compare_result(
     return evaluation_result
 
 
-def call_stubgen(command_line_args: List[str]) -> None:
+def call_stubgen(command_line_args: List[str]) -> Dict[str, str]:
     """
-    Call stubgen like the command line tool.
+    Call stubgen like the command line tool, and read the generated stubs back from
+    a temporary output directory instead of keeping them in the output directory.
 
-    :param command_line_args: list of command line args
+    :param command_line_args: list of command line args, an output directory given
+        in them is not used
+    :return: the text of the generated stubs by their path relative to the output
+        directory
     """
+    with TemporaryDirectory() as output_path:
+        generate_stubs(parse_options(command_line_args + ["-o", output_path]))
+        return {
+            path.relative_to(output_path).as_posix(): path.read_text()
+            for path in sorted(Path(output_path).rglob("*.pyi"))
+        }
+
 
-    generate_stubs(parse_options(command_line_args))
+_silenced_output: List[Tuple[TextIO, TextIO]] = []
 
 
 def silence_output() -> Tuple[StringIO, StringIO]:
     """Redirect all output to in-memory buffers instead of stdout and stderr."""
-    sys.stdout = StringIO()
-    sys.stderr = StringIO()
-    return (sys.stdout, sys.stderr)
+    _silenced_output.append((sys.stdout, sys.stderr))
+    stdout, stderr = StringIO(), StringIO()
+    sys.stdout, sys.stderr = stdout, stderr
+    return (stdout, stderr)
 
 
 def restore_output() -> None:
-    """Restore output of stdout and stderr to defaults."""
-    sys.stdout = sys.__stdout__
-    sys.stderr = sys.__stderr__
+    """
+    Restore output of stdout and stderr to what it was before the last call of
+    :py:func:`silence_output`.
+    """
+    if _silenced_output:
+        sys.stdout, sys.stderr = _silenced_output.pop()
 
 
-def generate_stub_types(
+def check_packages_installed(packages: Iterable[str]) -> None:
+    """
+    Exit if any of the given packages is not installed, since stubgen can't generate
+    stubs for it then.
+
+    :param packages: names of top-level packages
+    """
+    for package in packages:
+        if find_spec(package) is None:
+            print(
+                f'Error: The package "{package}" is not installed. Therefore no '
+                f"reference stubs can be generated for it automatically. Use the "
+                f"option -r to provide the reference stubs manually, or install "
+                f"the package."
+            )
+            sys.exit(1)
+
+
+def _stubgen_parameters(modules: List[str], include_private: bool) -> List[str]:
+    """
+    Build the stubgen command line for generating stubs of the given modules.
+
+    :param modules: names of the modules to generate stubs for
+    :param include_private: include definitions stubgen considers private
+    """
+    # Only generate the stubbed modules (and their parent packages) instead
+    # of the whole package
+    parameters = ["--ignore-errors", "-q"]
+    for module in modules:
+        parameters += ["-m", module]
+    return ["--include-private"] + parameters if include_private else parameters
+
+
+def _generate_package_stubs(
+    modules: List[str], include_private: bool
+) -> Tuple[str, str, Optional[str], Dict[str, str]]:
+    """
+    Generate the stubs of the modules of one package in a worker process.
+
+    All output of stubgen is captured, so the main process can write it in order.
+
+    :param modules: names of the modules to generate stubs for
+    :param include_private: include definitions stubgen considers private
+    :return: the captured stdout and stderr, the formatted exception if stubgen
+        failed and the generated stubs
+    """
+    stdout, stderr = silence_output()
+    error = None
+    stubs: Dict[str, str] = {}
+    try:
+        stubs = call_stubgen(_stubgen_parameters(modules, include_private))
+    except Exception as ex:
+        error = "".join(format_exception(type(ex), ex, ex.__traceback__))
+    finally:
+        restore_output()
+    return stdout.getvalue(), stderr.getvalue(), error, stubs
+
+
+def generate_reference_stub_texts(
     base_stubs_path: str,
-    mypy_conf_path: str,
     silent: bool = False,
     include_private: bool = False,
-) -> Iterable[Tuple[RelevantSymbolNode, str]]:
+    jobs: int = 1,
+    cache_dir: Optional[str] = None,
+    modules: Optional[List[str]] = None,
+) -> Dict[str, str]:
     """
-    Use stubgen to generate reference stub types of the modules stubbed in
-    base_stubs_path. For this to work the modules need to be installed.
+    Use stubgen to generate reference stubs of the modules stubbed in base_stubs_path.
+    For this to work the modules need to be installed.
 
     :param base_stubs_path: path to directory with (handwritten) stubs
-    :param mypy_conf_path: path to mypy.ini
-    :return: returns the reference stub types
-    """
-    with TemporaryDirectory() as reference_stubs_path:
-        packages = [
-            entry.name.replace(".pyi", "")
-            for entry in scandir(base_stubs_path)
-            if entry.is_dir() or entry.name.endswith(".pyi")
-        ]
-        for package in packages:
-            if find_spec(package) is None:
-                print(
-                    f'Error: The package "{package}" is not installed. Therefore no '
-                    f"reference stubs can be generated for it automatically. Use the "
-                    f"option -r to provide the reference stubs manually, or install "
-                    f"the package."
-                )
-                sys.exit(1)
+    :param jobs: number of processes to run stubgen for different packages in
+        parallel
+    :param cache_dir: cache directory of stubalyzer, the stubs of packages that have
+        not changed since the last run are taken from there instead of running stubgen
+        (see :py:func:`stubalyzer.stubcache.StubCache`)
+    :param modules: generate stubs for these modules only, instead of all modules
+        stubbed in base_stubs_path
+    :return: the text of the reference stubs by their path relative to the stubs
+        directory
+    """
+    modules_by_package: Dict[str, List[str]] = defaultdict(list)
+    for module in get_stubbed_modules(base_stubs_path) if modules is None else modules:
+        modules_by_package[module.split(".")[0]].append(module)
+    check_packages_installed(modules_by_package)
+
+    stubs_by_package: Dict[str, Dict[str, str]] = {}
+    stub_cache = StubCache(cache_dir) if cache_dir else None
+    if stub_cache is not None:
+        for package, package_modules in modules_by_package.items():
+            cached_stubs = stub_cache.load(package, package_modules, include_private)
+            if cached_stubs is not None:
+                stubs_by_package[package] = cached_stubs
+
+    missing_modules_by_package = {
+        package: package_modules
+        for package, package_modules in modules_by_package.items()
+        if package not in stubs_by_package
+    }
+    if jobs > 1 and len(missing_modules_by_package) > 1:
+        generated_stubs_by_package = _generate_reference_stub_texts_parallel(
+            missing_modules_by_package, silent, include_private, jobs
+        )
+    else:
+        generated_stubs_by_package = {}
+        for package, package_modules in missing_modules_by_package.items():
             try:
                 if silent:
                     silence_output()
-                default_parameters = [
-                    "--ignore-errors",
-                    "-q",
-                    "-p",
-                    package,
-                    "-o",
-                    reference_stubs_path,
-                ]
-                call_stubgen(
-                    ["--include-private"] + default_parameters
-                    if include_private
-                    else default_parameters
+                generated_stubs_by_package[package] = call_stubgen(
+                    _stubgen_parameters(package_modules, include_private)
                 )
                 if silent:
                     restore_output()
             except Exception as ex:
-                restore_output()
+                if silent:
+                    restore_output()
                 write_error(
                     f'Error: Generating stubs for the package "{package}" failed:',
                     linesep,
                     *format_exception(type(ex), ex, ex.__traceback__),
                 )
 
-        return list(get_stub_types(reference_stubs_path, mypy_conf_path))
+    if stub_cache is not None:
+        for package, package_stubs in generated_stubs_by_package.items():
+            stub_cache.store(
+                package, modules_by_package[package], include_private, package_stubs
+            )
+    stubs_by_package.update(generated_stubs_by_package)
+
+    # Merge in package order, so the result does not depend on the cache or jobs
+    stubs: Dict[str, str] = {}
+    for package in modules_by_package:
+        stubs.update(stubs_by_package.get(package, {}))
+    return stubs
+
+
+def _generate_reference_stub_texts_parallel(
+    modules_by_package: Dict[str, List[str]],
+    silent: bool,
+    include_private: bool,
+    jobs: int,
+) -> Dict[str, Dict[str, str]]:
+    """
+    Run stubgen for each package in a separate worker process.
+
+    The output of the workers is written in the same order as when generating the
+    stubs sequentially.
+
+    See :py:func:`generate_reference_stub_texts` for a description of the parameters.
+
+    :return: the generated stubs of each package stubgen succeeded for
+    """
+    stubs_by_package = {}
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = {
+            package: executor.submit(_generate_package_stubs, modules, include_private)
+            for package, modules in modules_by_package.items()
+        }
+        for package, future in futures.items():
+            stdout, stderr, error, stubs = future.result()
+            if not silent:
+                sys.stdout.write(stdout)
+                sys.stderr.write(stderr)
+            if error is not None:
+                write_error(
+                    f'Error: Generating stubs for the package "{package}" failed:',
+                    linesep,
+                    error,
+                )
+            else:
+                stubs_by_package[package] = stubs
+    return stubs_by_package
+
+
+def generate_reference_stubs(
+    base_stubs_path: str,
+    reference_stubs_path: str,
+    silent: bool = False,
+    include_private: bool = False,
+    jobs: int = 1,
+    cache_dir: Optional[str] = None,
+) -> None:
+    """
+    Use stubgen to generate reference stubs of the modules stubbed in base_stubs_path
+    and write them to reference_stubs_path. For this to work the modules need to be
+    installed.
+
+    See :py:func:`generate_reference_stub_texts` for a description of the parameters.
+
+    :param reference_stubs_path: path to the directory to write the reference stubs to
+    """
+    for relative_path, text in generate_reference_stub_texts(
+        base_stubs_path, silent, include_private, jobs, cache_dir
+    ).items():
+        path = Path(reference_stubs_path, relative_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+
+
+def generate_stub_types(
+    base_stubs_path: str,
+    mypy_conf_path: str,
+    silent: bool = False,
+    include_private: bool = False,
+    cache_dir: Optional[str] = None,
+    semantic_analysis_only: bool = False,
+    jobs: int = 1,
+    stubgen_cache_dir: Optional[str] = None,
+    modules: Optional[List[str]] = None,
+    reexported_classes: Optional[Dict[str, str]] = None,
+) -> Iterable[Tuple[RelevantSymbolNode, str]]:
+    """
+    Use stubgen to generate reference stub types of the modules stubbed in
+    base_stubs_path. For this to work the modules need to be installed.
+
+    The generated stubs are passed to mypy without writing them to files.
+
+    :param base_stubs_path: path to directory with (handwritten) stubs
+    :param mypy_conf_path: path to mypy.ini
+    :param cache_dir: directory for mypy's incremental cache
+    :param semantic_analysis_only: skip type checking in the mypy build
+    :param jobs: number of processes to run stubgen in
+    :param stubgen_cache_dir: cache directory for the generated stubs
+    :param modules: generate stubs for these modules only
+    :param reexported_classes: filled with the classes the reference stubs re-export
+        (see :py:func:`stubalyzer.collect.get_stub_types`)
+    :return: returns the reference stub types, they are collected while they are
+        consumed
+    """
+    return get_generated_stub_types(
+        generate_reference_stub_texts(
+            base_stubs_path,
+            silent,
+            include_private,
+            jobs,
+            stubgen_cache_dir,
+            modules,
+        ),
+        mypy_conf_path,
+        cache_dir,
+        semantic_analysis_only,
+        reexported_classes,
+    )
 
 
 class ErrorEntry(NamedTuple):
-    symbol: RelevantSymbolNode
+    line: int
+    column: int
     message: str
 
 
 class CheckStyleWriter:
-    def __init__(self, path_map: Dict[RelevantSymbolNode, str]):
-        self.path_map = path_map
-        self.errors_by_file: Dict[str, List[ErrorEntry]] = defaultdict(list)
+    """
+    Collects errors and writes them to a report in checkstyle format, with the files
+    sorted by their path and the errors of each file sorted by their position.
+
+    Only the errors of the file that errors were collected for last are kept in
+    memory. Once errors of another file are collected, they are written to a
+    temporary file, from which the report is written one file at a time. Errors are
+    usually collected file by file, but the errors of a file may also be collected
+    in several parts.
+    """
+
+    def __init__(self, symbol_index: SymbolIndex):
+        """
+        :param symbol_index: index of the symbols with the paths of the files they
+            are defined in, snapshots of symbols know their path already
+        """
+        self.symbol_index = symbol_index
+        self._path: Optional[str] = None
+        self._errors: List[ErrorEntry] = []
+        # Only created once errors of a second file are collected
+        self._spill_file: Optional[IO[bytes]] = None
+        # Offsets and sizes of the parts of the errors of each file in the spill file
+        self._spilled_errors: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
 
     def collect_error(
-        self, *messages: str, sep: str = "", symbol: RelevantSymbolNode
+        self, *messages: str, sep: str = "", symbol: ComparableSymbol
     ) -> None:
         message = sep.join(messages)
-        path = self.path_map[symbol]
-        self.errors_by_file[path].append(ErrorEntry(symbol=symbol, message=message))
-
-    def build_tree(self) -> ElementTree:
-        root = Element("checkstyle", {"version": "4.3"})
-        for filename in sorted(self.errors_by_file.keys()):
-            errors = self.errors_by_file[filename]
-            file = SubElement(root, "file", {"name": filename})
-            for error in sorted(errors, key=lambda x: (x.symbol.line, x.symbol.column)):
-                SubElement(
-                    file,
-                    "error",
-                    {
-                        "line": str(error.symbol.line),
-                        "column": str(error.symbol.column),
-                        "severity": "error",
-                        "message": error.message,
-                    },
+        path, line, column = self.symbol_index.get_location(symbol)
+        if path != self._path:
+            self._spill_errors()
+            self._path = path
+        self._errors.append(ErrorEntry(line=line, column=column, message=message))
+
+    def _spill_errors(self) -> None:
+        """
+        Write the errors of the current file to the spill file.
+        """
+        if self._path is None or not self._errors:
+            return
+        if self._spill_file is None:
+            self._spill_file = TemporaryFile()
+        offset = self._spill_file.seek(0, SEEK_END)
+        size = self._spill_file.write(
+            pickle.dumps(self._errors, pickle.HIGHEST_PROTOCOL)
+        )
+        self._spilled_errors[self._path].append((offset, size))
+        self._errors = []
+
+    def _read_errors(self, path: str) -> List[ErrorEntry]:
+        """
+        Get the errors of a file from the spill file and the errors collected
+        last, sorted by their position.
+
+        :param path: path of the file
+        """
+        errors: List[ErrorEntry] = []
+        for offset, size in self._spilled_errors.get(path, []):
+            assert self._spill_file is not None
+            self._spill_file.seek(offset)
+            errors += pickle.loads(self._spill_file.read(size))
+        if path == self._path:
+            errors += self._errors
+        return sorted(errors, key=lambda error: (error.line, error.column))
+
+    def write(self, report_path: str) -> None:
+        """
+        Write the report of the errors collected so far.
+
+        :param report_path: path of the report to write
+        """
+        paths = set(self._spilled_errors)
+        if self._errors:
+            assert self._path is not None
+            paths.add(self._path)
+        with open(
+            report_path, "w", encoding="UTF-8", errors="xmlcharrefreplace"
+        ) as report:
+            # The same declaration and root element as ElementTree.write
+            report.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+            if not paths:
+                report.write('<checkstyle version="4.3" />')
+                return
+
+            report.write('<checkstyle version="4.3">')
+            for path in sorted(paths):
+                file = Element("file", {"name": path})
+                for error in self._read_errors(path):
+                    SubElement(
+                        file,
+                        "error",
+                        {
+                            "line": str(error.line),
+                            "column": str(error.column),
+                            "severity": "error",
+                            "message": error.message,
+                        },
+                    )
+                report.write(tostring(file, encoding="unicode"))
+            report.write("</checkstyle>")
+
+    def close(self) -> None:
+        """
+        Remove the spill file, no more errors can be collected after this.
+        """
+        if self._spill_file is not None:
+            self._spill_file.close()
+
+
+def get_separate_build_stub_types(
+    mypy_conf_path: str,
+    base_stubs_path: str,
+    reference_stubs_path: Optional[str] = None,
+    silent: bool = False,
+    include_private: bool = False,
+    cache_dir: Optional[str] = None,
+    semantic_analysis_only: bool = False,
+    jobs: int = 1,
+    modules: Optional[List[str]] = None,
+    reexported_classes: Optional[Dict[str, str]] = None,
+) -> Tuple[
+    Iterable[Tuple[RelevantSymbolNode, str]], Iterable[Tuple[RelevantSymbolNode, str]]
+]:
+    """
+    Collect the types of the handwritten and the reference stubs with a separate mypy
+    build for each of them.
+
+    See :py:func:`analyze_stubs` for a description of the parameters.
+
+    :param modules: only collect the types of these modules, instead of all modules
+        of the stubs
+    :param reexported_classes: filled with the classes the reference stubs re-export
+        (see :py:func:`stubalyzer.collect.get_stub_types`)
+    :return: the types of the handwritten and the reference stubs
+    """
+    base_cache_dir = reference_cache_dir = None
+    if cache_dir:
+        base_cache_dir = get_cache_dir(
+            cache_dir,
+            HANDWRITTEN_CACHE_NAMESPACE,
+            mypy_conf_path,
+            semantic_analysis_only,
+        )
+        reference_cache_dir = get_cache_dir(
+            cache_dir, REFERENCE_CACHE_NAMESPACE, mypy_conf_path, semantic_analysis_only
+        )
+
+    # The handwritten stubs are analyzed first, so errors in them are reported
+    # before trying to generate the reference stubs.
+    stub_types_base = list(
+        get_stub_types(
+            base_stubs_path,
+            mypy_conf_path,
+            cache_dir=base_cache_dir,
+            semantic_analysis_only=semantic_analysis_only,
+            modules=modules,
+        )
+    )
+    if reference_stubs_path:
+        stub_types_reference = get_stub_types(
+            reference_stubs_path,
+            mypy_conf_path,
+            cache_dir=reference_cache_dir,
+            semantic_analysis_only=semantic_analysis_only,
+            modules=modules,
+            reexported_classes=reexported_classes,
+        )
+    else:
+        stub_types_reference = generate_stub_types(
+            base_stubs_path,
+            mypy_conf_path,
+            silent,
+            include_private,
+            reference_cache_dir,
+            semantic_analysis_only,
+            jobs,
+            cache_dir,
+            modules,
+            reexported_classes,
+        )
+    return stub_types_base, stub_types_reference
+
+
+def get_single_build_stub_types(
+    mypy_conf_path: str,
+    base_stubs_path: str,
+    reference_stubs_path: Optional[str] = None,
+    silent: bool = False,
+    include_private: bool = False,
+    cache_dir: Optional[str] = None,
+    semantic_analysis_only: bool = False,
+    jobs: int = 1,
+    reexported_classes: Optional[Dict[str, str]] = None,
+) -> Tuple[
+    Iterable[Tuple[RelevantSymbolNode, str]], Iterable[Tuple[RelevantSymbolNode, str]]
+]:
+    """
+    Collect the types of the handwritten and the reference stubs with a single mypy
+    build for both of them.
+
+    See :py:func:`analyze_stubs` for a description of the parameters.
+
+    :param reexported_classes: filled with the classes the reference stubs re-export
+        (see :py:func:`stubalyzer.collect.get_stub_types`)
+    :return: the types of the handwritten and the reference stubs
+    """
+    combined_cache_dir = (
+        get_cache_dir(
+            cache_dir, COMBINED_CACHE_NAMESPACE, mypy_conf_path, semantic_analysis_only
+        )
+        if cache_dir
+        else None
+    )
+    if reference_stubs_path:
+        return get_combined_stub_types(
+            base_stubs_path,
+            reference_stubs_path,
+            mypy_conf_path,
+            combined_cache_dir,
+            semantic_analysis_only,
+            reexported_classes,
+        )
+
+    return get_combined_stub_types(
+        base_stubs_path,
+        generate_reference_stub_texts(
+            base_stubs_path, silent, include_private, jobs, cache_dir
+        ),
+        mypy_conf_path,
+        combined_cache_dir,
+        semantic_analysis_only,
+        reexported_classes,
+    )
+
+
+def get_reference_snapshot_stub_types(
+    mypy_conf_path: str,
+    base_stubs_path: str,
+    reference_snapshot_path: str,
+    cache_dir: Optional[str] = None,
+    semantic_analysis_only: bool = False,
+    reexported_classes: Optional[Dict[str, str]] = None,
+) -> Tuple[
+    List[Tuple[RelevantSymbolNode, str]],
+    List[Tuple[SymbolSnapshot, str]],
+    Dict[str, MypyFile],
+]:
+    """
+    Collect the types of the handwritten stubs and read the reference symbols from a
+    file written with :py:func:`stubalyzer.snapshot.write_snapshots`.
+
+    See :py:func:`analyze_stubs` for a description of the parameters.
+
+    :param reexported_classes: filled with the classes the reference stubs re-export,
+        which are read along with the snapshots
+    :return: the types of the handwritten stubs, the snapshots of the reference
+        symbols and the modules of the handwritten build to compare them with
+    """
+    stub_types_base, modules = get_stub_types_and_modules(
+        base_stubs_path,
+        mypy_conf_path,
+        cache_dir=get_cache_dir(
+            cache_dir,
+            HANDWRITTEN_CACHE_NAMESPACE,
+            mypy_conf_path,
+            semantic_analysis_only,
+        )
+        if cache_dir
+        else None,
+        semantic_analysis_only=semantic_analysis_only,
+    )
+    with open(reference_snapshot_path, "rb") as file:
+        snapshots = read_snapshots(file, reexported_classes)
+    return (
+        stub_types_base,
+        [(snapshot, snapshot.path or "") for snapshot in snapshots],
+        modules,
+    )
+
+
+class ShardResult(NamedTuple):
+    stdout: str
+    stderr: str
+    comparisons: List[ShardComparison]
+    compile_error: Optional[List[str]]
+    """Messages of the ``CompileError`` raised while analyzing the shard, if any"""
+    subtype_cache_stats: SubtypeCacheStats
+    """Hits and misses of the subtype checks while analyzing the shard"""
+    system_exit: Optional[SystemExit] = None
+    """The ``SystemExit`` raised while analyzing the shard, if any, e.g. if the
+    reference stubs could not be generated"""
+
+
+def get_shards(base_stubs_path: str, shard_depth: int = 1) -> Dict[str, List[str]]:
+    """
+    Split the modules stubbed in base_stubs_path into shards, that can be analyzed
+    independently.
+
+    :param base_stubs_path: path to directory with (handwritten) stubs
+    :param shard_depth: number of leading components of the module names that make
+        up the name of a shard, e.g. with 1 every top-level package is a shard
+    :return: the modules of each shard by the name of the shard, sorted by name
+    """
+    shards: Dict[str, List[str]] = defaultdict(list)
+    for module in get_stubbed_modules(base_stubs_path):
+        shards[".".join(module.split(".")[:shard_depth])].append(module)
+    return dict(sorted(shards.items()))
+
+
+def _clear_build_caches() -> None:
+    """
+    Clear the caches of the comparison, which keep the types and nodes of the mypy
+    builds alive. The statistics of the subtype cache are kept.
+    """
+    subtype_cache.clear_results()
+    clear_argument_signatures()
+    clear_formatted_types()
+
+
+def _analyze_shard(
+    mypy_conf_path: str,
+    base_stubs_path: str,
+    reference_stubs_path: Optional[str],
+    include_private: bool,
+    cache_dir: Optional[str],
+    semantic_analysis_only: bool,
+    time_budget: Optional[float],
+    modules: List[str],
+) -> ShardResult:
+    """
+    Collect and compare the types of the given modules, in a worker process.
+
+    All output is captured, so the main process can write it in order.
+
+    See :py:func:`analyze_stubs` for a description of the parameters.
+
+    :param modules: names of the modules of the shard
+    """
+    # The mypy build of the shard analyzed before by this process is garbage with
+    # reference cycles, which is freed here instead of after the next build
+    gc.collect()
+    stdout, stderr = silence_output()
+    comparisons = []
+    compile_error = None
+    system_exit = None
+    stats_before = subtype_cache.stats()
+    reexported_classes: Dict[str, str] = {}
+    try:
+        stub_types_base, stub_types_reference = get_separate_build_stub_types(
+            mypy_conf_path,
+            base_stubs_path,
+            reference_stubs_path,
+            False,
+            include_private,
+            cache_dir,
+            semantic_analysis_only,
+            modules=modules,
+            reexported_classes=reexported_classes,
+        )
+        # Overloaded function definitions are only indexed once
+        base_index = SymbolIndex(stub_types_base)
+        # Only the snapshots of the handwritten symbols are sent back, instead of
+        # the mypy build they reference
+        snapshots = {
+            symbol: snapshot
+            for symbol, (snapshot, _) in zip(
+                base_index, take_snapshots(base_index.paths.items())
+            )
+        }
+        for res in compare(
+            base_index,
+            SymbolIndex(stub_types_reference, reexported_classes),
+            time_budget=time_budget,
+        ):
+            assert not isinstance(res.symbol, SymbolSnapshot)
+            comparisons.append(
+                ShardComparison(
+                    symbol=snapshots[res.symbol],
+                    symbol_name=res.symbol_name,
+                    match_result=res.match_result,
+                    message=res.message,
+                    duration=res.duration,
                 )
-        return ElementTree(root)
+            )
+    except CompileError as ex:
+        # Compile errors lose their messages when they are pickled
+        compile_error = ex.messages
+    except SystemExit as ex:
+        system_exit = ex
+    finally:
+        restore_output()
+    stats = subtype_cache.stats()
+    # The caches keep the types and nodes of the shard alive, which would add up over
+    # the shards analyzed by the same process
+    _clear_build_caches()
+    return ShardResult(
+        stdout.getvalue(),
+        stderr.getvalue(),
+        comparisons,
+        compile_error,
+        SubtypeCacheStats(
+            stats.hits - stats_before.hits,
+            stats.misses - stats_before.misses,
+            stats.identical - stats_before.identical,
+        ),
+        system_exit,
+    )
+
+
+def get_sharded_comparisons(
+    mypy_conf_path: str,
+    base_stubs_path: str,
+    reference_stubs_path: Optional[str] = None,
+    silent: bool = False,
+    include_private: bool = False,
+    cache_dir: Optional[str] = None,
+    semantic_analysis_only: bool = False,
+    workers: int = 1,
+    shard_depth: int = 1,
+    time_budget: Optional[float] = None,
+) -> Iterator[ShardComparison]:
+    """
+    Split the handwritten stubs into shards (see :py:func:`get_shards`) and collect
+    and compare the types of each shard with separate mypy builds, in a pool of
+    worker processes.
+
+    The results of each shard are yielded as soon as the shard is analyzed, so only
+    the results of the shards that are analyzed but not consumed yet are kept in
+    memory. The shards are yielded in order of their names, the results of each
+    shard are sorted by the path and position of the symbols, so they do not depend
+    on the number of workers.
+
+    Without a cache_dir, the shards share mypy's incremental cache in a temporary
+    directory, so typeshed is only analyzed once per run.
+
+    See :py:func:`analyze_stubs` for a description of the parameters.
+
+    :return: the comparison results of all shards
+    """
+    shards = get_shards(base_stubs_path, shard_depth)
+    parallel = workers > 1 and len(shards) > 1
+    if parallel and not reference_stubs_path:
+        # Checked up front, as the pool would analyze all shards before exiting
+        check_packages_installed({module.split(".")[0] for module in shards})
+
+    with ExitStack() as stack:
+        if cache_dir is None and len(shards) > 1:
+            cache_dir = stack.enter_context(TemporaryDirectory())
+        analyze_shard = partial(
+            _analyze_shard,
+            mypy_conf_path,
+            base_stubs_path,
+            reference_stubs_path,
+            include_private,
+            cache_dir,
+            semantic_analysis_only,
+            time_budget,
+        )
+        if parallel:
+            with ProcessPoolExecutor(workers) as executor:
+                for result in executor.map(analyze_shard, shards.values()):
+                    subtype_cache.add_stats(result.subtype_cache_stats)
+                    yield from _get_shard_comparisons(result, silent)
+        else:
+            for modules in shards.values():
+                yield from _get_shard_comparisons(analyze_shard(modules), silent)
+
+
+def _get_shard_comparisons(
+    result: ShardResult, silent: bool = False
+) -> List[ShardComparison]:
+    """
+    Write the output of a shard and get its comparison results, sorted by the path
+    and position of the symbols.
+
+    :param result: result of analyzing the shard
+    :param silent: do not write the standard output of the shard
+    :raises CompileError: if the stubs of the shard could not be analyzed
+    :raises SystemExit: if analyzing the shard exited, e.g. because the package of
+        the shard is not installed
+    """
+    if not silent or result.system_exit is not None:
+        sys.stdout.write(result.stdout)
+    sys.stderr.write(result.stderr)
+    if result.compile_error is not None:
+        raise CompileError(result.compile_error)
+    if result.system_exit is not None:
+        raise result.system_exit
+
+    return sorted(
+        result.comparisons,
+        key=lambda comparison: (
+            comparison.symbol.path or "",
+            comparison.symbol.line,
+            comparison.symbol.column,
+            comparison.symbol_name,
+        ),
+    )
+
+
+def _symbol_kind(symbol: ComparableSymbol) -> str:
+    """
+    Get the name of the class of the given symbol node, e.g. ``"FuncDef"``, also if
+    it is a snapshot.
+    """
+    if isinstance(symbol, SymbolSnapshot):
+        return symbol.kind
+    return type(symbol).__name__
+
+
+def write_slowest_symbols(
+    slowest_symbols: List[Tuple[float, str, str]], stubbed_modules: Container[str]
+) -> None:
+    """
+    Write the symbols that took the longest to compare to stderr.
+
+    :param slowest_symbols: duration, full name and kind of the symbols, slowest
+        first
+    :param stubbed_modules: names of the modules the symbols are defined in, e.g.
+        the modules of the :py:func:`stubalyzer.index.SymbolIndex` of the symbols
+    """
+
+    def get_module(symbol_name: str) -> str:
+        parts = symbol_name.split(".")
+        for end in range(len(parts) - 1, 0, -1):
+            module = ".".join(parts[:end])
+            if module in stubbed_modules:
+                return module
+        return parts[0]
+
+    write_error(
+        SLOWEST_MESSAGE,
+        *(
+            linesep
+            + SLOWEST_SYMBOL_MESSAGE.format(
+                milliseconds=duration * 1000,
+                symbol=symbol_name,
+                kind=kind,
+                module=get_module(symbol_name),
+            )
+            for duration, symbol_name, kind in slowest_symbols
+        ),
+    )
 
 
 def analyze_stubs(
@@ -409,6 +1462,17 @@ def analyze_stubs(
     checkstyle_report: Optional[str] = None,
     silent: bool = False,
     include_private: bool = False,
+    cache_dir: Optional[str] = None,
+    single_build: bool = False,
+    semantic_analysis_only: bool = False,
+    jobs: int = 1,
+    workers: Optional[int] = None,
+    shard_depth: int = 1,
+    export_reference: Optional[str] = None,
+    reference_snapshot: Optional[str] = None,
+    timings: bool = False,
+    time_budget: Optional[float] = None,
+    slowest: int = 0,
 ) -> bool:
     """
     Determine if the (presumably) handwritten stubs in base_stubs_path are correct;
@@ -436,12 +1500,43 @@ def analyze_stubs(
         will be written.
     :param silent: Suppress all non-error output.
     :param include_private: Call stubgen with --include-private.
+    :param cache_dir: Directory for mypy's incremental cache and the generated
+        reference stubs. Caching is disabled if not given.
+    :param single_build: Analyze the handwritten and the reference stubs in a single
+        mypy build (see :py:func:`stubalyzer.collect.get_combined_stub_types`),
+        instead of separate builds of each shard.
+    :param semantic_analysis_only: Stop the mypy builds after semantic analysis,
+        instead of type checking all modules.
+    :param jobs: Number of processes to run stubgen for different packages in
+        parallel, when generating the reference stubs for single_build or
+        export_reference.
+    :param workers: Number of worker processes to analyze the shards of the
+        handwritten stubs in (see :py:func:`get_sharded_comparisons`). If not given,
+        the shards are analyzed one after another in this process, unless
+        single_build, reference_snapshot or export_reference need the whole stub
+        sets in memory at once. single_build and jobs are ignored if given.
+    :param shard_depth: Number of leading components of the module names that
+        make up the name of a shard (see :py:func:`get_shards`).
+    :param export_reference: Write the symbols of the reference stubs to this file
+        (see :py:func:`stubalyzer.snapshot.write_snapshots`).
+    :param reference_snapshot: Read the reference symbols from this file, which was
+        written with export_reference, instead of analyzing reference stubs.
+    :param timings: Write how long collecting and comparing the symbols took, the
+        number of identical types and the hit rate of the subtype checks (see
+        ``stubalyzer.subtypes``) to stderr.
+    :param time_budget: Seconds comparing a symbol may take, symbols which take
+        longer get a ``timeout`` result (see :py:func:`compare`).
+    :param slowest: Write this number of symbols which took the longest to compare
+        to stderr, with their kind and module.
     :return: True if the stubs in base_stubs_path are considered correct
     """
     success = True
     failed_count = 0
     total_count = 0
     expected_count = 0
+    subtype_cache.clear()
+    _clear_build_caches()
+    start_time = perf_counter()
 
     try:
         mismatches, unused_mismatches = setup_expected_mismatches(
@@ -456,44 +1551,147 @@ def analyze_stubs(
         success = False
 
     if success:
-        # Prevent overloaded function definitions from appearing multiple times
-        stub_types_base_map = {
-            symbol: path
-            for (symbol, path) in get_stub_types(base_stubs_path, mypy_conf_path)
-        }
-        if reference_stubs_path:
-            stub_types_reference = set(
-                stub for stub, _ in get_stub_types(reference_stubs_path, mypy_conf_path)
+        comparisons: Iterable[Union[ComparisonResult, ShardComparison]]
+        base_index = SymbolIndex()
+        stub_types_base: Iterable[Tuple[RelevantSymbolNode, str]]
+        stub_types_reference: Iterable[Tuple[ComparableSymbol, str]]
+        reexported_classes: Dict[str, str] = {}
+        modules = None
+        # Only these options need the whole stub sets in memory at once
+        sharded = bool(workers) or not (
+            single_build or reference_snapshot or export_reference
+        )
+        if sharded:
+            comparisons = get_sharded_comparisons(
+                mypy_conf_path,
+                base_stubs_path,
+                reference_stubs_path,
+                silent,
+                include_private,
+                cache_dir,
+                semantic_analysis_only,
+                workers or 1,
+                shard_depth,
+                time_budget,
             )
-        else:
-            stub_types_reference = set(
-                stub
-                for stub, _ in generate_stub_types(
-                    base_stubs_path, mypy_conf_path, silent, include_private
+        elif reference_snapshot:
+            try:
+                (
+                    stub_types_base,
+                    stub_types_reference,
+                    modules,
+                ) = get_reference_snapshot_stub_types(
+                    mypy_conf_path,
+                    base_stubs_path,
+                    reference_snapshot,
+                    cache_dir,
+                    semantic_analysis_only,
+                    reexported_classes,
                 )
+            except (OSError, ValueError) as ex:
+                write_error(f'Error: Reading "{reference_snapshot}" failed: {ex}')
+                _clear_build_caches()
+                return False
+        elif single_build:
+            stub_types_base, stub_types_reference = get_single_build_stub_types(
+                mypy_conf_path,
+                base_stubs_path,
+                reference_stubs_path,
+                silent,
+                include_private,
+                cache_dir,
+                semantic_analysis_only,
+                jobs,
+                reexported_classes,
+            )
+        else:
+            stub_types_base, stub_types_reference = get_separate_build_stub_types(
+                mypy_conf_path,
+                base_stubs_path,
+                reference_stubs_path,
+                silent,
+                include_private,
+                cache_dir,
+                semantic_analysis_only,
+                jobs,
+                reexported_classes=reexported_classes,
             )
-        checkstyle_writer = CheckStyleWriter(stub_types_base_map)
-        for res in compare(stub_types_base_map.keys(), stub_types_reference):
+        if not sharded:
+            # Overloaded function definitions are only indexed once
+            reference_index = SymbolIndex(stub_types_reference, reexported_classes)
+            if export_reference:
+                with open(export_reference, "wb") as file:
+                    write_snapshots(
+                        file,
+                        [
+                            snapshot
+                            for snapshot, _ in take_snapshots(
+                                reference_index.paths.items()
+                            )
+                        ],
+                        reference_index.reexported_classes,
+                    )
+            base_index = SymbolIndex(stub_types_base)
+            comparisons = compare(base_index, reference_index, modules, time_budget)
+            # Only the indexes reference the symbols of the builds from here on, and
+            # the reference symbols are freed once the comparison is done
+            del stub_types_base, stub_types_reference, reference_index
+        collect_time = perf_counter()
+        loggers: List[Callable[..., None]] = [write_error]
+        checkstyle_writer = None
+        if checkstyle_report:
+            checkstyle_writer = CheckStyleWriter(base_index)
+            loggers.append(checkstyle_writer.collect_error)
+        # Durations and names of the slowest symbols, the fastest of them first
+        slowest_symbols: List[Tuple[float, str, str]] = []
+        for res in comparisons:
             total_count += 1
+            if slowest and res.duration > 0:
+                entry = (res.duration, res.symbol_name, _symbol_kind(res.symbol))
+                if len(slowest_symbols) < slowest:
+                    heappush(slowest_symbols, entry)
+                else:
+                    heappushpop(slowest_symbols, entry)
             evaluation_result = evaluate_compare_result(
                 res,
                 mismatches,
                 unused_mismatches,
                 expected_mismatches_path,
-                loggers=[write_error, checkstyle_writer.collect_error],
+                loggers=loggers,
             )
             if evaluation_result is EvaluationResult.FAILURE:
                 failed_count += 1
             elif evaluation_result is EvaluationResult.EXPECTED_FAILURE:
                 expected_count += 1
         success = failed_count == 0
+        # The builds are not needed after the comparison, nor by the next run
+        _clear_build_caches()
 
-        if checkstyle_report:
-            checkstyle_tree = checkstyle_writer.build_tree()
-            checkstyle_tree.write(
-                checkstyle_report, encoding="UTF-8", xml_declaration=True
+        if timings:
+            stats = subtype_cache.stats()
+            write_error(
+                TIMINGS_MESSAGE.format(
+                    collect=collect_time - start_time,
+                    compare=perf_counter() - collect_time,
+                    identical=stats.identical,
+                    checks=stats.hits + stats.misses,
+                    hit_rate=stats.hit_rate,
+                )
             )
 
+        if slowest:
+            write_slowest_symbols(
+                sorted(slowest_symbols, reverse=True),
+                # The symbols of the shards are not indexed by this process
+                set(get_stubbed_modules(base_stubs_path))
+                if sharded
+                else base_index.modules,
+            )
+
+        if checkstyle_report and checkstyle_writer is not None:
+            checkstyle_writer.write(checkstyle_report)
+            checkstyle_writer.close()
+
         if unused_mismatches:
             success = False
             symbols = linesep.join([f" - {mm}" for mm in unused_mismatches])
@@ -530,6 +1728,17 @@ def main() -> None:
         args.checkstyle_report,
         args.silent,
         args.include_private,
+        args.cache_dir,
+        args.single_build,
+        args.semantic_analysis_only,
+        args.jobs,
+        args.workers,
+        args.shard_depth,
+        args.export_reference,
+        args.reference_snapshot,
+        args.timings,
+        args.time_budget,
+        args.slowest,
     )
     sys.exit(0 if success else 1)
 
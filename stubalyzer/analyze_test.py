@@ -2,16 +2,29 @@ import os
 import re
 import xml.etree.ElementTree as ET
 from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
 from unittest.mock import patch
 
 import pytest
 from _pytest.capture import CaptureFixture
 from mypy.errors import CompileError
+from mypy.stubgen import generate_stubs, parse_options
 
 from testing.util import MypyNodeFactory, WithStubTestConfig
 
-from .analyze import analyze_stubs, compare, main
-from .compare import ComparisonResult, MatchResult
+from . import signatures, snapshot
+from .analyze import (
+    analyze_stubs,
+    call_stubgen,
+    compare,
+    generate_reference_stubs,
+    get_separate_build_stub_types,
+    get_shards,
+    get_single_build_stub_types,
+    main,
+)
+from .compare import ComparisonResult, MatchResult, subtype_cache
+from .types import RelevantSymbolNode
 
 
 class TestAnalyzeStubs(WithStubTestConfig):
@@ -160,6 +173,110 @@ class TestAnalyzeStubs(WithStubTestConfig):
         finally:
             os.unlink(report_path)
 
+    def test_analyze_timings(self, capsys: CaptureFixture) -> None:
+        analyze_stubs(
+            self.mypy_config_path,
+            self.handwritten_stubs_path,
+            self.generated_stubs_path,
+            timings=True,
+        )
+
+        _, err = capsys.readouterr()
+
+        match = re.search(
+            r"Timings:\s+collecting symbols: [\d.]+s\s+comparing symbols : [\d.]+s"
+            r"\s+identical types   : (\d+)"
+            r"\s+subtype checks    : (\d+) \([\d.]+% cached\)",
+            err,
+        )
+        assert match is not None
+        assert int(match.group(1)) > 0
+        assert int(match.group(2)) > 0
+
+    def test_analyze_slowest(self, capsys: CaptureFixture) -> None:
+        analyze_stubs(
+            self.mypy_config_path,
+            self.handwritten_stubs_path,
+            self.generated_stubs_path,
+            slowest=3,
+        )
+
+        _, err = capsys.readouterr()
+
+        _, slowest_report = err.split("Slowest symbols:")
+        slowest = slowest_report.splitlines()[1:4]
+        durations = []
+        for line in slowest:
+            match = re.fullmatch(r"\s+([\d.]+)ms ([\w.]+) \((\w+) in ([\w.]+)\)", line)
+            assert match is not None
+            assert match.group(2).startswith(f"{match.group(4)}.")
+            durations.append(float(match.group(1)))
+        assert durations == sorted(durations, reverse=True)
+
+    def test_analyze_time_budget(self, tmp_path: Path, capsys: CaptureFixture) -> None:
+        expected_mismatches = tmp_path / "expected_mismatches.json"
+        expected_mismatches.write_text('{"functions.matching_function": "timeout"}')
+
+        success = analyze_stubs(
+            self.mypy_config_path,
+            self.handwritten_stubs_path,
+            self.generated_stubs_path,
+            str(expected_mismatches),
+            time_budget=0,
+        )
+
+        _, err = capsys.readouterr()
+
+        assert not success
+        assert re.search(
+            r'Comparing "functions.additional_args" took [\d.]+s, longer than the time'
+            r" budget of 0.000s.",
+            err,
+        )
+        assert '"functions.matching_function"' not in err
+        assert "1 fail(s) were ignored" in err
+
+    def test_analyze_does_not_keep_the_builds(self) -> None:
+        analyze_stubs(
+            self.mypy_config_path,
+            self.handwritten_stubs_path,
+            self.generated_stubs_path,
+            silent=True,
+        )
+
+        assert not signatures._signatures
+        assert not snapshot._formatted_types
+        assert not subtype_cache.results
+
+
+class TestSingleBuild(WithStubTestConfig):
+    def test_single_build_matches_separate_builds(self) -> None:
+        def results(
+            stub_types: Tuple[
+                Iterable[Tuple[RelevantSymbolNode, str]],
+                Iterable[Tuple[RelevantSymbolNode, str]],
+            ]
+        ) -> Dict[str, Tuple[MatchResult, str]]:
+            base, reference = stub_types
+            return {
+                result.symbol_name: (result.match_result, result.message)
+                for result in compare(
+                    [symbol for symbol, _ in base], [symbol for symbol, _ in reference]
+                )
+            }
+
+        args = (
+            self.mypy_config_path,
+            self.handwritten_stubs_path,
+            self.generated_stubs_path,
+        )
+        separate = results(get_separate_build_stub_types(*args))
+        single = results(get_single_build_stub_types(*args))
+
+        # The top level module "functions" imports its decorator with a relative
+        # import beyond the top level, which stays unresolved in both modes
+        assert single == separate
+
 
 class TestCompareSymbols:
     def test_generated_is_missing_a_function(self, mypy_nodes: MypyNodeFactory) -> None:
@@ -285,21 +402,35 @@ class TestCompileError(WithStubTestConfig):
 
         assert "poolmanager.pyi:7: error: invalid syntax" in ex.value.messages[0]
 
-    def test_compile_error_invalid_syntax_in_reference(self) -> None:
+    def test_compile_error_invalid_syntax_in_reference(self, tmp_path: Path) -> None:
         """
         Invalid reference stubs should cause a CompileError, too. This simulates the
         case where stubgen generates invalid stubs due to an internal error.
         """
+        # Only the reference stubs of the handwritten modules are analyzed
+        (tmp_path / "poolmanager.pyi").write_text("class PoolManager: ...\n")
         with pytest.raises(CompileError) as ex:
             analyze_stubs(
                 self.mypy_config_path,
-                self.handwritten_stubs_path,
+                str(tmp_path),
                 self.get_test_stub_path("test_compile_error_invalid_syntax"),
             )
 
         assert "poolmanager.pyi:7: error: invalid syntax" in ex.value.messages[0]
 
 
+class TestPackageNotInstalled(WithStubTestConfig):
+    def test_package_not_installed(
+        self, tmp_path: Path, capsys: CaptureFixture
+    ) -> None:
+        (tmp_path / "not_installed_package.pyi").write_text("def func() -> int: ...\n")
+        with pytest.raises(SystemExit):
+            analyze_stubs(self.mypy_config_path, str(tmp_path), silent=True)
+
+        out, _ = capsys.readouterr()
+        assert 'The package "not_installed_package" is not installed.' in out
+
+
 class TestIncludePrivate(WithStubTestConfig):
     def test_include_private_flag_forwarded_to_stubgen(
         self, capsys: CaptureFixture
@@ -313,3 +444,158 @@ class TestIncludePrivate(WithStubTestConfig):
         _, err = capsys.readouterr()
 
         assert err == ""
+
+
+class TestParallelStubgen(WithStubTestConfig):
+    def test_parallel_stubs_match_sequential_stubs(self, tmp_path: Path) -> None:
+        base_stubs_path = tmp_path / "handwritten"
+        for stub in ["attr/__init__.pyi", "attr/converters.pyi", "isort/comments.pyi"]:
+            (base_stubs_path / stub).parent.mkdir(parents=True, exist_ok=True)
+            (base_stubs_path / stub).write_text("")
+
+        def generate(jobs: int) -> Dict[str, str]:
+            reference_stubs_path = tmp_path / f"reference-{jobs}"
+            generate_reference_stubs(
+                str(base_stubs_path), str(reference_stubs_path), jobs=jobs
+            )
+            return {
+                str(path.relative_to(reference_stubs_path)): path.read_text()
+                for path in reference_stubs_path.rglob("*.pyi")
+            }
+
+        sequential_stubs = generate(jobs=1)
+
+        assert sorted(sequential_stubs) == [
+            "attr/__init__.pyi",
+            "attr/converters.pyi",
+            "isort/__init__.pyi",
+            "isort/comments.pyi",
+        ]
+        assert generate(jobs=2) == sequential_stubs
+
+    def test_stubs_match_stubgen(self, tmp_path: Path) -> None:
+        # A package, a module and a C module
+        arguments = ["-q", "-m", "attr", "-m", "attr.converters", "-m", "_json"]
+        generate_stubs(parse_options(arguments + ["-o", str(tmp_path)]))
+
+        assert call_stubgen(arguments) == {
+            path.relative_to(tmp_path).as_posix(): path.read_text()
+            for path in tmp_path.rglob("*.pyi")
+        }
+
+
+class TestShardedAnalysis(WithStubTestConfig):
+    def analyze(
+        self,
+        tmp_path: Path,
+        capsys: CaptureFixture,
+        workers: Optional[int],
+        single_build: bool = False,
+    ) -> Tuple[bool, str, str]:
+        report_path = tmp_path / f"report-{workers}-{single_build}.xml"
+        success = analyze_stubs(
+            self.mypy_config_path,
+            self.handwritten_stubs_path,
+            self.generated_stubs_path,
+            self.get_expectations_path("mismatching.json"),
+            str(report_path),
+            # Shares the analysis of typeshed between the shards
+            cache_dir=str(tmp_path / "cache"),
+            single_build=single_build,
+            workers=workers,
+        )
+        _, err = capsys.readouterr()
+        return success, err, report_path.read_text()
+
+    def test_get_shards(self, tmp_path: Path) -> None:
+        for stub in ["a/__init__.pyi", "a/b/c.pyi", "a/d.pyi", "e.pyi"]:
+            (tmp_path / stub).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / stub).write_text("")
+
+        assert get_shards(str(tmp_path)) == {
+            "a": ["a", "a.b", "a.b.c", "a.d"],
+            "e": ["e"],
+        }
+        assert get_shards(str(tmp_path), shard_depth=2) == {
+            "a": ["a"],
+            "a.b": ["a.b", "a.b.c"],
+            "a.d": ["a.d"],
+            "e": ["e"],
+        }
+
+    def test_sharded_analysis_matches_unsharded_analysis(
+        self, tmp_path: Path, capsys: CaptureFixture
+    ) -> None:
+        success, err, report = self.analyze(
+            tmp_path, capsys, workers=None, single_build=True
+        )
+        sharded_success, sharded_err, sharded_report = self.analyze(
+            tmp_path, capsys, workers=1
+        )
+
+        assert sharded_success == success
+        assert sorted(sharded_err.split(os.linesep)) == sorted(err.split(os.linesep))
+        assert sorted(
+            ET.tostring(error) for error in ET.fromstring(sharded_report).iter("error")
+        ) == sorted(ET.tostring(error) for error in ET.fromstring(report).iter("error"))
+
+    def test_output_does_not_depend_on_workers(
+        self, tmp_path: Path, capsys: CaptureFixture
+    ) -> None:
+        assert self.analyze(tmp_path, capsys, workers=1) == self.analyze(
+            tmp_path, capsys, workers=3
+        )
+
+    def test_shards_are_analyzed_by_default(
+        self, tmp_path: Path, capsys: CaptureFixture
+    ) -> None:
+        assert self.analyze(tmp_path, capsys, workers=None) == self.analyze(
+            tmp_path, capsys, workers=1
+        )
+
+
+class TestReferenceSnapshot(WithStubTestConfig):
+    def analyze(
+        self,
+        tmp_path: Path,
+        capsys: CaptureFixture,
+        reference_stubs_path: Optional[str] = None,
+        export_reference: Optional[str] = None,
+        reference_snapshot: Optional[str] = None,
+    ) -> str:
+        analyze_stubs(
+            self.mypy_config_path,
+            self.handwritten_stubs_path,
+            reference_stubs_path,
+            checkstyle_report=str(tmp_path / "report.xml"),
+            export_reference=export_reference,
+            reference_snapshot=reference_snapshot,
+        )
+        return str(capsys.readouterr().err)
+
+    def test_reference_snapshot_matches_reference_stubs(
+        self, tmp_path: Path, capsys: CaptureFixture
+    ) -> None:
+        snapshot_path = str(tmp_path / "reference.snapshot")
+        err = self.analyze(
+            tmp_path,
+            capsys,
+            reference_stubs_path=self.generated_stubs_path,
+            export_reference=snapshot_path,
+        )
+        report = (tmp_path / "report.xml").read_text()
+
+        snapshot_err = self.analyze(tmp_path, capsys, reference_snapshot=snapshot_path)
+
+        assert sorted(snapshot_err.split(os.linesep)) == sorted(err.split(os.linesep))
+        assert (tmp_path / "report.xml").read_text() == report
+
+    def test_invalid_reference_snapshot(
+        self, tmp_path: Path, capsys: CaptureFixture
+    ) -> None:
+        snapshot_path = tmp_path / "reference.snapshot"
+        snapshot_path.write_text("[]")
+
+        err = self.analyze(tmp_path, capsys, reference_snapshot=str(snapshot_path))
+
+        assert f'Error: Reading "{snapshot_path}" failed: Not a file' in err
@@ -1,20 +1,32 @@
 from json.decoder import JSONDecodeError
+from pathlib import Path
+from typing import List, Tuple, cast
 from unittest.mock import Mock, patch
+from xml.etree.ElementTree import Element, ElementTree, SubElement
 
 import pytest
 from _pytest.capture import CaptureFixture
 from mypy.nodes import TypeAlias, TypeVarExpr, Var
 from schema import SchemaError
 
+from testing.util import MypyNodeFactory
+
 from .analyze import (
+    CheckStyleWriter,
     EvaluationResult,
+    ShardComparison,
+    ShardResult,
     analyze_stubs,
     compare,
     evaluate_compare_result,
+    get_sharded_comparisons,
     setup_expected_mismatches,
     write_error,
 )
-from .compare import ComparisonResult, MatchResult
+from .compare import ComparisonResult, MatchResult, compare_many
+from .index import SymbolIndex
+from .subtypes import SubtypeCacheStats
+from .types import RelevantSymbolNode
 
 
 class TestCompare:
@@ -29,8 +41,11 @@ class TestCompare:
         assert len(list(compare(handwritten, []))) == 2
 
     @patch(
-        "stubalyzer.analyze.compare_symbols",
-        return_value=ComparisonResult.create_match(Mock(), Mock()),
+        "stubalyzer.analyze.compare_many",
+        side_effect=lambda pairs, modules: (
+            ComparisonResult.create_match(symbol, reference)
+            for symbol, reference in pairs
+        ),
     )
     def test_match_to_generated_symbols(self, compare_mock: Mock) -> None:
         handwritten = [
@@ -43,6 +58,96 @@ class TestCompare:
         assert result[0].match_result == MatchResult.MATCH
         assert result[1].match_result == MatchResult.NOT_FOUND
 
+    def test_suggest_symbols_of_the_same_name(self) -> None:
+        handwritten = Mock(fullname="pkg.mod.helper")
+        handwritten.name = "helper"
+        generated = Mock(fullname="pkg.helper")
+        generated.name = "helper"
+
+        (result,) = compare([handwritten], [generated])
+
+        assert result.match_result is MatchResult.NOT_FOUND
+        assert result.data == {"candidates": ["pkg.helper"]}
+        assert result.message == (
+            'Symbol "pkg.mod.helper" not found in generated stubs,'
+            ' did you mean "pkg.helper"?'
+        )
+
+    @patch("stubalyzer.analyze.COMPARE_BATCH_SIZE", 2)
+    def test_results_are_in_order_of_the_symbols(
+        self, mypy_nodes: MypyNodeFactory
+    ) -> None:
+        pairs: List[Tuple[RelevantSymbolNode, RelevantSymbolNode]] = [
+            mypy_nodes.get_matching_func_node(),
+            mypy_nodes.get_class(),
+            mypy_nodes.get_additional_args_node(),
+            mypy_nodes.get_decorated_function(),
+            mypy_nodes.get_overloaded_reordered(),
+        ]
+        not_found = Mock(fullname="not_found_in_generated")
+        handwritten = [symbol for symbol, _ in pairs]
+        handwritten.insert(3, not_found)
+
+        with patch(
+            "stubalyzer.analyze.compare_many", wraps=compare_many
+        ) as compare_mock:
+            results = list(compare(handwritten, [ref for _, ref in pairs]))
+
+        assert compare_mock.call_count == 3
+        assert [result.symbol for result in results] == handwritten
+        assert [result.match_result for result in results] == [
+            MatchResult.MATCH,
+            MatchResult.MATCH,
+            MatchResult.MISMATCH,
+            MatchResult.NOT_FOUND,
+            MatchResult.MATCH,
+            MatchResult.MATCH,
+        ]
+
+    def test_members_of_identical_classes_are_not_compared(
+        self, mypy_nodes: MypyNodeFactory
+    ) -> None:
+        cls, cls_reference = mypy_nodes.get_class_with_identical_stub()
+        members = [
+            cast(RelevantSymbolNode, symbol.node) for symbol in cls.names.values()
+        ]
+        reference_members = [
+            cast(RelevantSymbolNode, symbol.node)
+            for symbol in cls_reference.names.values()
+        ]
+
+        with patch(
+            "stubalyzer.analyze.compare_many", wraps=compare_many
+        ) as compare_mock:
+            results = list(
+                compare([cls, *members], [cls_reference, *reference_members])
+            )
+
+        compare_mock.assert_called_once_with([(cls, cls_reference)], None)
+        assert [result.symbol for result in results] == [cls, *members]
+        assert [result.reference for result in results] == [
+            cls_reference,
+            *reference_members,
+        ]
+        assert all(result.match_result is MatchResult.MATCH for result in results)
+
+    def test_time_budget(self, mypy_nodes: MypyNodeFactory) -> None:
+        function, reference = mypy_nodes.get_matching_func_node()
+
+        (result,) = compare([function], [reference])
+
+        assert result.match_result is MatchResult.MATCH
+        assert result.duration > 0
+
+        (result,) = compare([function], [reference], time_budget=0)
+
+        assert result.match_result is MatchResult.TIMEOUT
+        assert result.reference is reference
+        assert result.data == {"duration": result.duration, "time_budget": 0}
+        assert result.message.startswith(
+            'Comparing "functions.matching_function" took '
+        )
+
 
 class TestSetupExpectedMismatches:
     def test_file_not_provided(self) -> None:
@@ -229,16 +334,12 @@ class TestAnalyzeStubs:
         "stubalyzer.analyze.evaluate_compare_result",
         return_value=EvaluationResult.SUCCESS,
     )
-    @patch("stubalyzer.analyze.compare", return_value=range(10))
-    @patch("stubalyzer.analyze.generate_stub_types")
-    @patch("stubalyzer.analyze.get_stub_types", return_value=[])
+    @patch("stubalyzer.analyze.get_sharded_comparisons", return_value=range(10))
     @pytest.mark.parametrize("silent", [False, True])  # type: ignore
     def test_everything_ok(
         self,
-        generate_mock: Mock,
-        compare_mock: Mock,
+        comparisons_mock: Mock,
         result_mock: Mock,
-        get_stub_types_mock: Mock,
         silent: bool,
         capsys: CaptureFixture,
     ) -> None:
@@ -278,17 +379,13 @@ class TestAnalyzeStubs:
         + [EvaluationResult.SUCCESS] * 4
         + [EvaluationResult.EXPECTED_FAILURE] * 4,
     )
-    @patch("stubalyzer.analyze.compare", return_value=range(10))
-    @patch("stubalyzer.analyze.generate_stub_types")
-    @patch("stubalyzer.analyze.get_stub_types", return_value=[])
+    @patch("stubalyzer.analyze.get_sharded_comparisons", return_value=range(10))
     @pytest.mark.parametrize("silent", [False, True])  # type: ignore
     def test_some_results_fail_ok(
         self,
-        generate_mock: Mock,
-        compare_mock: Mock,
+        comparisons_mock: Mock,
         result_mock: Mock,
         setup_mock: Mock,
-        get_stub_types_mock: Mock,
         silent: bool,
         capsys: CaptureFixture,
     ) -> None:
@@ -313,16 +410,12 @@ class TestAnalyzeStubs:
         + [EvaluationResult.SUCCESS] * 4
         + [EvaluationResult.EXPECTED_FAILURE] * 4,
     )
-    @patch("stubalyzer.analyze.compare", return_value=range(10))
-    @patch("stubalyzer.analyze.generate_stub_types")
-    @patch("stubalyzer.analyze.get_stub_types", return_value=[])
+    @patch("stubalyzer.analyze.get_sharded_comparisons", return_value=range(10))
     def test_does_not_suppress_error_on_silent(
         self,
-        generate_mock: Mock,
-        compare_mock: Mock,
+        comparisons_mock: Mock,
         result_mock: Mock,
         setup_mock: Mock,
-        get_stub_types_mock: Mock,
         capsys: CaptureFixture,
     ) -> None:
         assert not analyze_stubs(
@@ -343,15 +436,11 @@ class TestAnalyzeStubs:
         "stubalyzer.analyze.setup_expected_mismatches",
         return_value=({}, ["lib.1", "lib.2"]),
     )
-    @patch("stubalyzer.analyze.compare", return_value=[])
-    @patch("stubalyzer.analyze.generate_stub_types")
-    @patch("stubalyzer.analyze.get_stub_types", return_value=[])
+    @patch("stubalyzer.analyze.get_sharded_comparisons", return_value=[])
     def test_unused_mismatches(
         self,
-        generate_mock: Mock,
-        compare_mock: Mock,
+        comparisons_mock: Mock,
         setup_mock: Mock,
-        get_stub_types_mock: Mock,
         capsys: CaptureFixture,
     ) -> None:
         assert not analyze_stubs(
@@ -367,3 +456,90 @@ class TestAnalyzeStubs:
             " - lib.2\n"
             'Check "a/proper/mismatch_path" to fix.' in err
         )
+
+
+class TestShardedComparisons:
+    @patch("stubalyzer.analyze.get_shards", return_value={"a": ["a"], "b": ["b"]})
+    @patch("stubalyzer.analyze._analyze_shard")
+    def test_shards_are_yielded_when_analyzed(
+        self, analyze_shard_mock: Mock, get_shards_mock: Mock, capsys: CaptureFixture
+    ) -> None:
+        def analyze_shard(*args: object) -> ShardResult:
+            (module,) = cast(List[str], args[-1])
+            comparisons = [
+                ShardComparison(
+                    symbol=Mock(path=f"{module}.pyi", line=line, column=0),
+                    symbol_name=f"{module}.symbol{line}",
+                    match_result=MatchResult.MATCH,
+                    message="",
+                    duration=0.0,
+                )
+                for line in [2, 1]
+            ]
+            return ShardResult(
+                f"{module} out", "", comparisons, None, SubtypeCacheStats(0, 0)
+            )
+
+        analyze_shard_mock.side_effect = analyze_shard
+        comparisons = get_sharded_comparisons(
+            "mypy_conf_path", "base_stubs_path", "reference_stubs_path"
+        )
+
+        assert next(comparisons).symbol_name == "a.symbol1"
+        assert analyze_shard_mock.call_count == 1
+        assert [comparison.symbol_name for comparison in comparisons] == [
+            "a.symbol2",
+            "b.symbol1",
+            "b.symbol2",
+        ]
+        assert analyze_shard_mock.call_count == 2
+        assert capsys.readouterr().out == "a outb out"
+
+
+class TestCheckStyleWriter:
+    def test_write(self, tmp_path: Path) -> None:
+        symbols = [
+            Mock(fullname=f"symbol{index}", line=line, column=0)
+            for index, line in enumerate([3, 1, 2, 1, 1])
+        ]
+        paths = ["b.pyi", "b.pyi", "a.pyi", "b.pyi", "c.pyi"]
+        writer = CheckStyleWriter(SymbolIndex(zip(symbols, paths)))
+        for symbol in symbols:
+            writer.collect_error(f"Error in {symbol.fullname} →", symbol=symbol)
+
+        writer.write(str(tmp_path / "report.xml"))
+        writer.close()
+
+        # The same as writing the whole tree at once
+        root = Element("checkstyle", {"version": "4.3"})
+        for path, indexes in [("a.pyi", [2]), ("b.pyi", [1, 3, 0]), ("c.pyi", [4])]:
+            file = SubElement(root, "file", {"name": path})
+            for index in indexes:
+                SubElement(
+                    file,
+                    "error",
+                    {
+                        "line": str(symbols[index].line),
+                        "column": "0",
+                        "severity": "error",
+                        "message": f"Error in symbol{index} →",
+                    },
+                )
+        ElementTree(root).write(
+            tmp_path / "expected.xml", encoding="UTF-8", xml_declaration=True
+        )
+        assert (tmp_path / "report.xml").read_bytes() == (
+            tmp_path / "expected.xml"
+        ).read_bytes()
+
+    def test_write_without_errors(self, tmp_path: Path) -> None:
+        writer = CheckStyleWriter(SymbolIndex())
+
+        writer.write(str(tmp_path / "report.xml"))
+
+        ElementTree(Element("checkstyle", {"version": "4.3"})).write(
+            tmp_path / "expected.xml", encoding="UTF-8", xml_declaration=True
+        )
+        assert (tmp_path / "report.xml").read_bytes() == (
+            tmp_path / "expected.xml"
+        ).read_bytes()
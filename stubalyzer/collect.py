@@ -1,12 +1,31 @@
 """
 API for analyzing Python stubs using mypy.
 """
+import ast
 import os
+import sys
+from contextlib import contextmanager
+from hashlib import sha256
+from io import StringIO
 from os.path import abspath
-from typing import Iterable, Optional, Set, Tuple
+from pathlib import Path, PurePath, PurePosixPath
+from typing import (
+    Collection,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
-from mypy.build import BuildResult, State, build
+import mypy.build
+from mypy.build import BuildManager, BuildResult, Graph, State, build
+from mypy.find_sources import create_source_list
 from mypy.main import process_options
+from mypy.modulefinder import BuildSource
 from mypy.nodes import (
     GDEF,
     MDEF,
@@ -14,13 +33,19 @@ from mypy.nodes import (
     FuncDef,
     MypyFile,
     OverloadedFuncDef,
+    RefExpr,
     SymbolNode,
     TypeAlias,
     TypeInfo,
     TypeVarExpr,
     Var,
 )
+from mypy.options import Options
+from mypy.semanal import SemanticAnalyzer
+from mypy.semanal_main import semantic_analysis_for_scc
+from mypy.version import __version__ as mypy_version
 
+from .signatures import index_argument_signatures
 from .types import RelevantSymbolNode
 
 IGNORED_MODULE_SYMBOLS = [
@@ -36,9 +61,216 @@ IGNORED_MODULE_SYMBOLS = [
 Module level definitions that will not be collected by collect_types.
 """
 
+HANDWRITTEN_CACHE_NAMESPACE = "handwritten"
+"""Name of the cache directory used for builds of the handwritten stubs."""
+
+REFERENCE_CACHE_NAMESPACE = "reference"
+"""Name of the cache directory used for builds of the reference stubs."""
+
+COMBINED_CACHE_NAMESPACE = "combined"
+"""Name of the cache directory used for combined builds of both stub trees."""
+
+REFERENCE_MODULE_PREFIX = "__stubalyzer_reference__"
+"""
+Package the reference stubs are placed in for a combined build, to keep them apart
+from the handwritten stubs.
+"""
+
+GENERATED_STUBS_PATH = os.path.join(os.path.abspath(os.sep), "<generated stubs>")
+"""
+Directory stubs that are only kept in memory (see :py:func:`get_generated_stub_types`)
+pretend to be located in. It does not exist.
+"""
+
+
+def get_cache_dir(
+    cache_root: str,
+    namespace: str,
+    mypy_conf_path: str,
+    semantic_analysis_only: bool = False,
+) -> str:
+    """
+    Get the directory mypy should use for its incremental cache.
+
+    Every namespace gets its own directory below ``cache_root``, so builds of the
+    handwritten and the reference stubs never share cache entries. The directory name
+    also contains a digest of the mypy version, the Python version, the contents of
+    the mypy config and the build mode, so changing any of them starts over with an
+    empty cache.
+
+    :param cache_root: directory containing all cache namespaces
+    :param namespace: name of the namespace, e.g. ``HANDWRITTEN_CACHE_NAMESPACE``
+    :param mypy_conf_path: path to mypy.ini
+    :param semantic_analysis_only: if the cache is used for builds that skip type
+        checking, which leave out types inferred by the type checker
+    """
+    digest = sha256()
+    digest.update(mypy_version.encode())
+    digest.update(sys.version.encode())
+    digest.update(Path(mypy_conf_path).read_bytes())
+    if semantic_analysis_only:
+        digest.update(b"semantic-analysis-only")
+    return os.path.join(cache_root, namespace, digest.hexdigest()[:16])
+
+
+def _with_source_text(sources: List[BuildSource]) -> List[BuildSource]:
+    """
+    Read the text of the given sources.
+
+    Mypy does not look up cache entries for sources whose text is given, so the
+    modules are always parsed and analyzed from scratch. This is needed because
+    trees loaded from the cache lack information we compare (e.g. the line numbers
+    and original decorators of a definition).
+
+    :param sources: sources to read
+    """
+    return [
+        BuildSource(
+            source.path, source.module, Path(source.path).read_text(), source.base_dir
+        )
+        if source.path and source.text is None
+        else source
+        for source in sources
+    ]
+
+
+def _mypy_options(
+    mypy_conf_path: str, paths: List[str], cache_dir: Optional[str] = None
+) -> Tuple[List[BuildSource], Options]:
+    """
+    Get the sources and options for a mypy build, as mypy's command line would.
+
+    :param mypy_conf_path: path to a mypy.ini
+    :param paths: files and directories to build
+    :param cache_dir: directory for mypy's incremental cache, caching is disabled
+        if not given
+    """
+    args = ["--config-file", mypy_conf_path]
+    if cache_dir is None:
+        args += [
+            "--no-incremental",
+            "--cache-dir=" + ("nul" if os.name == "nt" else "/dev/null"),
+        ]
+    else:
+        args += ["--incremental", "--cache-dir=" + cache_dir]
+
+    # Without paths, only the options are needed and the sources are created by the
+    # caller
+    return process_options(args + paths, require_targets=bool(paths))
+
+
+# Ids of the options of the builds that stop after semantic analysis, while they run
+_semantic_analysis_only_builds: Set[int] = set()
+_mypy_process_stale_scc = mypy.build.process_stale_scc
+
+
+def _process_stale_scc(graph: Graph, scc: List[str], manager: BuildManager) -> None:
+    """
+    Replacement for :py:func:`mypy.build.process_stale_scc`, which stops after
+    semantic analysis for the builds in :py:func:`_semantic_analysis_only` and
+    processes the modules of all other builds as mypy does.
+
+    :param graph: the build graph
+    :param scc: ids of the strongly connected modules to process
+    :param manager: the build manager
+    """
+    if id(manager.options) in _semantic_analysis_only_builds:
+        _process_stale_scc_semantic_analysis_only(graph, scc, manager)
+    else:
+        _mypy_process_stale_scc(graph, scc, manager)
+
+
+def _process_stale_scc_semantic_analysis_only(
+    graph: Graph, scc: List[str], manager: BuildManager
+) -> None:
+    """
+    Process the given modules like :py:func:`mypy.build.process_stale_scc`, but stop
+    after semantic analysis.
+
+    Type checking is skipped and errors are dropped without formatting them, since we
+    never look at them. Blocking errors (e.g. syntax errors) still raise a
+    ``CompileError``.
+
+    :param graph: the build graph
+    :param scc: ids of the strongly connected modules to process
+    :param manager: the build manager
+    """
+    for id in scc:
+        graph[id].parse_file()
+    semantic_analysis_for_scc(graph, scc, manager.errors)
+
+    errors = manager.errors
+    has_errors = any(errors.is_errors_for_file(graph[id].xpath) for id in scc)
+    for id in scc:
+        state = graph[id]
+        # Modules with errors are not cached, just like in a full build
+        state.transitive_error = has_errors
+        errors.error_info_map.pop(state.xpath, None)
+        errors.flushed_files.add(state.xpath)
+        state.write_cache()
+        state.mark_as_rechecked()
+
+
+@contextmanager
+def _semantic_analysis_only(options: Options) -> Iterator[None]:
+    """
+    Let the mypy build with the given options stop after semantic analysis, while
+    it runs in this context.
+
+    Semantic analysis creates all the symbol tables and types we look at
+    (``TypeInfo``, ``FuncDef.type``, ``TypeAlias.target``, ...). Only types that are
+    inferred by the type checker are missing, e.g. for variables without annotation.
+
+    Mypy has no option for this, so :py:func:`mypy.build.process_stale_scc` is
+    replaced by :py:func:`_process_stale_scc` the first time. It is never restored,
+    since other builds may run at the same time, but it only changes how the builds
+    in this context are processed.
+
+    :param options: options of the build, which must not be shared with other builds
+        running at the same time
+    """
+    if mypy.build.process_stale_scc is not _process_stale_scc:
+        setattr(mypy.build, "process_stale_scc", _process_stale_scc)
+    _semantic_analysis_only_builds.add(id(options))
+    try:
+        yield
+    finally:
+        _semantic_analysis_only_builds.discard(id(options))
+
+
+def _build(
+    sources: List[BuildSource], options: Options, semantic_analysis_only: bool = False
+) -> BuildResult:
+    """
+    Run a mypy build.
+
+    :param sources: sources to build
+    :param options: build options
+    :param semantic_analysis_only: skip type checking, see
+        :py:func:`_semantic_analysis_only`
+    """
+    # Mypy only writes to stdout to complain about builds without sources, which
+    # happen when none of the modules to build is part of the stubs
+    stdout = StringIO()
+    try:
+        if not semantic_analysis_only:
+            return build(sources, options, None, None, stdout=stdout)
+
+        with _semantic_analysis_only(options):
+            return build(sources, options, None, None, stdout=stdout)
+    finally:
+        # The semantic analyzer keeps the async functions it analyzed in a class
+        # attribute, which would keep the modules of every build alive
+        SemanticAnalyzer.wrapped_coro_return_types.clear()
+
 
 def _mypy_analyze(
-    mypy_conf_path: str, root_path: str, stubs_path: Optional[str] = None
+    mypy_conf_path: str,
+    root_path: str,
+    stubs_path: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    semantic_analysis_only: bool = False,
+    modules: Optional[Collection[str]] = None,
 ) -> BuildResult:
     """
     Parse and analyze the types of the code in root_path.
@@ -46,22 +278,160 @@ def _mypy_analyze(
     :param mypy_conf_path: path to a mypy.ini
     :param root_path: path to the code directory where the type analysis is started
     :param stubs_path: path to the directory of stubs for mypy to use
+    :param cache_dir: directory for mypy's incremental cache, caching is disabled
+        if not given
+    :param semantic_analysis_only: skip type checking, which stubalyzer does not need
+    :param modules: names of the modules to build, all other modules are only
+        analyzed if they are imported
     :returns: Mypy's analysis result
     """
     # The call to `build.build` is inspired by `mypy/mypy/main.py::main`
     # `build` is not a documented public API
-    args = [
-        "--config-file",
-        mypy_conf_path,
-        "--no-incremental",
-        "--cache-dir=" + ("nul" if os.name == "nt" else "/dev/null"),
-        root_path,
-    ]
-    sources, options = process_options(args)
+    sources, options = _mypy_options(mypy_conf_path, [root_path], cache_dir)
     if stubs_path is not None:
         options = options.apply_changes({"mypy_path": [stubs_path]})
 
-    return build(sources, options, None, None)
+    if cache_dir is not None:
+        if stubs_path is not None:
+            # The stubs would only be followed as imports and could then be loaded
+            # from the cache, so they are added as sources explicitly.
+            source_paths = {source.path for source in sources}
+            sources += [
+                source
+                for source in create_source_list([stubs_path], options)
+                if source.path not in source_paths
+            ]
+
+    if modules is not None:
+        sources = [source for source in sources if source.module in modules]
+
+    if cache_dir is not None:
+        sources = _with_source_text(sources)
+
+    return _build(sources, options, semantic_analysis_only)
+
+
+def _prefix_imports(text: str, prefix: str, packages: Set[str], package: str) -> str:
+    """
+    Rewrite absolute imports of the given packages to import them from below prefix.
+
+    Relative imports that go beyond the top level package are rewritten to go beyond
+    prefix as well, so they stay unresolved like they are without prefix.
+
+    Line numbers of all other statements are kept intact. Text that is not valid
+    Python is returned as is, so mypy can report the syntax error.
+
+    :param text: source code of a stub file
+    :param prefix: name of the package to import from
+    :param packages: top level packages whose imports should be rewritten
+    :param package: package that relative imports of the stub file are relative to,
+        empty for a top level module
+    """
+    try:
+        tree = ast.parse(text)
+    except SyntaxError:
+        return text
+
+    def is_prefixed(module: str) -> bool:
+        return module.split(".")[0] in packages
+
+    def format_alias(name: str, asname: Optional[str]) -> str:
+        return f"{name} as {asname}" if asname else name
+
+    # Relative imports of a higher level go beyond the top level package
+    max_level = len(package.split(".")) if package else 0
+    replacements: List[Tuple[ast.stmt, str]] = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom):
+            names = ", ".join(format_alias(a.name, a.asname) for a in node.names)
+            if node.level > max_level:
+                module = "." * (node.level + 1) + (node.module or "")
+                replacements.append((node, f"from {module} import {names}"))
+            elif not node.level and node.module and is_prefixed(node.module):
+                replacements.append(
+                    (node, f"from {prefix}.{node.module} import {names}")
+                )
+        elif isinstance(node, ast.Import):
+            if not any(is_prefixed(alias.name) for alias in node.names):
+                continue
+            statements = []
+            for alias in node.names:
+                if not is_prefixed(alias.name):
+                    statements.append(
+                        f"import {format_alias(alias.name, alias.asname)}"
+                    )
+                elif alias.asname:
+                    statements.append(f"import {prefix}.{alias.name} as {alias.asname}")
+                else:
+                    # `import a.b` binds the name `a`, which has to stay available
+                    statements.append(
+                        f"from {prefix} import {alias.name.split('.')[0]}"
+                    )
+                    if "." in alias.name:
+                        statements.append(f"import {prefix}.{alias.name}")
+            replacements.append((node, "; ".join(statements)))
+
+    # ast offsets are given in bytes
+    lines = text.encode().splitlines(keepends=True)
+    for node, statement in sorted(
+        replacements, key=lambda r: (r[0].lineno, r[0].col_offset), reverse=True
+    ):
+        assert node.end_lineno is not None and node.end_col_offset is not None
+        first, last = node.lineno - 1, node.end_lineno
+        start, end = node.col_offset, node.end_col_offset
+        # Keep the number of lines, so the line numbers of later statements match
+        lines[first:last] = [
+            lines[first][:start]
+            + statement.encode()
+            + b"\n" * (last - first - 1)
+            + lines[last - 1][end:]
+        ]
+    return b"".join(lines).decode()
+
+
+def strip_module_prefix(module: MypyFile, prefix: str) -> None:
+    """
+    Remove the given prefix from the full names of all definitions in the module.
+
+    This is done in place, so types referencing the definitions (e.g. instances of
+    a class) are named without the prefix as well.
+
+    :param module: module to rename
+    :param prefix: package prefix to remove, e.g. ``REFERENCE_MODULE_PREFIX``
+    """
+    prefix = prefix + "."
+    prefix_length = len(prefix)
+
+    def strip(name: str) -> str:
+        return name[prefix_length:] if name.startswith(prefix) else name
+
+    def visit(node: Optional[SymbolNode]) -> None:
+        # Names that were stripped already or that are defined outside of the
+        # prefixed modules (e.g. in typeshed) are left untouched
+        if node is None or not (node.fullname or "").startswith(prefix):
+            return
+
+        if isinstance(node, Decorator):
+            for decorator in node.original_decorators:
+                if isinstance(decorator, RefExpr) and decorator.fullname:
+                    decorator.fullname = strip(decorator.fullname)
+            visit(node.func)
+            visit(node.var)
+            return
+
+        setattr(node, "_fullname", strip(node.fullname))
+        if isinstance(node, (MypyFile, TypeInfo)):
+            if isinstance(node, TypeInfo):
+                node.module_name = strip(node.module_name)
+                node.defn.fullname = strip(node.defn.fullname)
+            for symbol in node.names.values():
+                visit(symbol.node)
+        elif isinstance(node, OverloadedFuncDef):
+            for item in node.items:
+                visit(item)
+            visit(node.impl)
+
+    visit(module)
 
 
 def is_stubbed_module(module: State) -> bool:
@@ -118,13 +488,109 @@ def collect_types(
     ):
         # the symbol represents a function definition,
         # variable, type alias or generic TypeVar
+        index_argument_signatures(symbol_node)
         yield symbol_node
     else:
         assert False, f"Unexpected symbol type {type(symbol_node)}"
 
 
+def get_reexported_classes(module: MypyFile) -> Iterator[Tuple[str, str]]:
+    """
+    Get the classes the given module re-exports from other modules, i.e. the public
+    names in its symbol table that refer to a class of another full name.
+
+    :param module: module to get the re-exported classes of
+    :return: the names the classes are re-exported under and the full names of the
+        classes
+    """
+    for name, symbol in module.names.items():
+        if symbol.kind != GDEF or not symbol.module_public:
+            continue
+        if isinstance(symbol.node, TypeInfo):
+            reexported_name = f"{module.fullname}.{name}"
+            fullname: str = symbol.node.fullname
+            if fullname != reexported_name:
+                yield (reexported_name, fullname)
+
+
+def _collect_module_types(
+    modules: Iterable[State], reexported_classes: Optional[Dict[str, str]] = None
+) -> Iterable[Tuple[RelevantSymbolNode, str]]:
+    """
+    Collect the relevant symbol nodes of the given modules and the path they are
+    defined in.
+
+    :param modules: modules of a build result graph
+    :param reexported_classes: filled with the classes the modules re-export (see
+        :py:func:`get_reexported_classes`)
+    """
+    for module in modules:
+        if module.tree:
+            assert module.path
+            if reexported_classes is not None:
+                reexported_classes.update(get_reexported_classes(module.tree))
+            yield from (
+                (stub_type, module.path) for stub_type in collect_types(module.tree)
+            )
+
+
+def _get_module_name(relative_path: PurePath) -> str:
+    """
+    Get the name of the module of a stub file.
+
+    :param relative_path: path of the stub file relative to the stubs directory
+    """
+    parts = relative_path.with_suffix("").parts
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts)
+
+
+def _get_generated_stub_sources(
+    stubs: Dict[str, str], module_prefix: str = ""
+) -> List[BuildSource]:
+    """
+    Create the sources for a mypy build of stubs kept in memory.
+
+    :param stubs: text of the stub files by their path relative to the stubs
+        directory
+    :param module_prefix: prefix for the names of all modules
+    """
+    return [
+        BuildSource(
+            os.path.join(GENERATED_STUBS_PATH, relative_path),
+            module_prefix + _get_module_name(PurePosixPath(relative_path)),
+            text,
+            GENERATED_STUBS_PATH,
+        )
+        for relative_path, text in sorted(stubs.items())
+    ]
+
+
+def get_stubbed_modules(stubs_path: str) -> List[str]:
+    """
+    Get the names of all modules stubbed in stubs_path, including their parent
+    packages, e.g. ``a``, ``a.b`` and ``a.b.c`` for ``a/b/c.pyi``.
+
+    :param stubs_path: where all the stub files are located
+    :return: the sorted module names
+    """
+    modules: Set[str] = set()
+    for path in Path(stubs_path).rglob("*.pyi"):
+        parts = _get_module_name(path.relative_to(stubs_path)).split(".")
+        for index in range(1, len(parts) + 1):
+            modules.add(".".join(parts[:index]))
+    return sorted(modules)
+
+
 def get_stub_types(
-    stubs_path: str, mypy_conf_path: str, root_path: Optional[str] = None
+    stubs_path: str,
+    mypy_conf_path: str,
+    root_path: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    semantic_analysis_only: bool = False,
+    modules: Optional[Collection[str]] = None,
+    reexported_classes: Optional[Dict[str, str]] = None,
 ) -> Iterable[Tuple[RelevantSymbolNode, str]]:
     """
     Analyze the stub files in stubs_path and return module
@@ -137,13 +603,69 @@ def get_stub_types(
     :param stubs_path: where all the stub files are located
     :param mypy_conf_path: path to mypy.ini
     :param root_path: path to the code directory where the type analysis is started
+    :param cache_dir: directory for mypy's incremental cache (see
+        :py:func:`get_cache_dir`), caching is disabled if not given
+    :param semantic_analysis_only: stop the mypy build after semantic analysis
+        instead of type checking all modules
+    :param modules: only analyze and return the symbols of these modules (see
+        :py:func:`get_stubbed_modules`), modules they import from stubs_path are
+        still analyzed as far as needed
+    :param reexported_classes: filled with the full names of the classes the stubs
+        re-export by the names they are re-exported under (see
+        :py:func:`get_reexported_classes`), while the symbols are collected
+    """
+    stub_types, _ = get_stub_types_and_modules(
+        stubs_path,
+        mypy_conf_path,
+        root_path,
+        cache_dir,
+        semantic_analysis_only,
+        modules,
+        reexported_classes,
+    )
+    yield from stub_types
+
+
+def get_stub_types_and_modules(
+    stubs_path: str,
+    mypy_conf_path: str,
+    root_path: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    semantic_analysis_only: bool = False,
+    modules: Optional[Collection[str]] = None,
+    reexported_classes: Optional[Dict[str, str]] = None,
+) -> Tuple[List[Tuple[RelevantSymbolNode, str]], Dict[str, MypyFile]]:
+    """
+    Analyze the stub files in stubs_path like :py:func:`get_stub_types` and also
+    return all modules of the mypy build, which are needed to compare the symbols
+    to snapshots (see :py:func:`stubalyzer.compare.compare_symbols`).
+
+    See :py:func:`get_stub_types` for a description of the parameters.
+
+    :return: the relevant symbol nodes with the paths they are defined in and the
+        modules of the build by their name
     """
     stubs_path = abspath(stubs_path)
 
     if root_path:
-        build_result = _mypy_analyze(mypy_conf_path, root_path, stubs_path)
+        build_result = _mypy_analyze(
+            mypy_conf_path,
+            root_path,
+            stubs_path,
+            cache_dir,
+            semantic_analysis_only,
+            modules,
+        )
     else:
-        build_result = _mypy_analyze(mypy_conf_path, stubs_path)
+        build_result = _mypy_analyze(
+            mypy_conf_path,
+            stubs_path,
+            # Modules that are not built are resolved via the mypy path
+            stubs_path if modules is not None else None,
+            cache_dir,
+            semantic_analysis_only,
+            modules,
+        )
 
     stubbed_modules = {
         module
@@ -151,11 +673,134 @@ def get_stub_types(
         if module.path
         and is_stubbed_module(module)
         and module.path.startswith(stubs_path)
+        and (modules is None or module.id in modules)
     }
 
-    for module in stubbed_modules:
-        if module.tree:
-            assert module.path
-            yield from (
-                (stub_type, module.path) for stub_type in collect_types(module.tree)
+    return (
+        list(_collect_module_types(stubbed_modules, reexported_classes)),
+        build_result.files,
+    )
+
+
+def get_generated_stub_types(
+    stubs: Dict[str, str],
+    mypy_conf_path: str,
+    cache_dir: Optional[str] = None,
+    semantic_analysis_only: bool = False,
+    reexported_classes: Optional[Dict[str, str]] = None,
+) -> Iterable[Tuple[RelevantSymbolNode, str]]:
+    """
+    Analyze stubs kept in memory and return their relevant symbol nodes (like
+    :py:func:`get_stub_types`).
+
+    The stubs are passed to mypy directly, instead of writing them to files first.
+    Their paths are below ``GENERATED_STUBS_PATH``.
+
+    :param stubs: text of the stub files by their path relative to the stubs
+        directory, e.g. ``{"package/__init__.pyi": "..."}``
+    :param mypy_conf_path: path to mypy.ini
+    :param cache_dir: directory for mypy's incremental cache (see
+        :py:func:`get_cache_dir`), caching is disabled if not given
+    :param semantic_analysis_only: stop the mypy build after semantic analysis
+        instead of type checking all modules
+    :param reexported_classes: filled with the classes the stubs re-export (see
+        :py:func:`get_stub_types`)
+    """
+    _, options = _mypy_options(mypy_conf_path, [], cache_dir)
+    build_result = _build(
+        _get_generated_stub_sources(stubs), options, semantic_analysis_only
+    )
+
+    yield from _collect_module_types(
+        (
+            module
+            for module in build_result.graph.values()
+            if module.path
+            and is_stubbed_module(module)
+            and module.path.startswith(GENERATED_STUBS_PATH)
+        ),
+        reexported_classes,
+    )
+
+
+def get_combined_stub_types(
+    stubs_path: str,
+    reference_stubs: Union[str, Dict[str, str]],
+    mypy_conf_path: str,
+    cache_dir: Optional[str] = None,
+    semantic_analysis_only: bool = False,
+    reexported_classes: Optional[Dict[str, str]] = None,
+) -> Tuple[List[Tuple[RelevantSymbolNode, str]], List[Tuple[RelevantSymbolNode, str]]]:
+    """
+    Analyze the stub files in stubs_path and the reference stubs in a single mypy
+    build and return the relevant symbol nodes of both (like
+    :py:func:`get_stub_types`).
+
+    Both stub trees share the analysis of their dependencies (e.g. typeshed).
+    The reference stubs are analyzed as modules of the package
+    ``REFERENCE_MODULE_PREFIX`` with their imports rewritten accordingly, so the
+    two trees do not see each other. The prefix is removed from the reference
+    symbols again before they are collected.
+
+    :param stubs_path: where all the (handwritten) stub files are located
+    :param reference_stubs: where all the reference stub files are located, or the
+        text of reference stubs kept in memory (see
+        :py:func:`get_generated_stub_types`)
+    :param mypy_conf_path: path to mypy.ini
+    :param cache_dir: directory for mypy's incremental cache (see
+        :py:func:`get_cache_dir`), caching is disabled if not given
+    :param semantic_analysis_only: stop the mypy build after semantic analysis
+        instead of type checking all modules
+    :param reexported_classes: filled with the classes the reference stubs re-export
+        (see :py:func:`get_stub_types`)
+    :return: the symbols of the stubs and of the reference stubs
+    """
+    stubs_path = abspath(stubs_path)
+
+    sources, options = _mypy_options(mypy_conf_path, [stubs_path], cache_dir)
+    if cache_dir is not None:
+        sources = _with_source_text(sources)
+
+    if isinstance(reference_stubs, str):
+        reference_sources = _with_source_text(
+            create_source_list([abspath(reference_stubs)], options)
+        )
+    else:
+        reference_sources = _get_generated_stub_sources(reference_stubs)
+    packages = {source.module.split(".")[0] for source in reference_sources}
+    sources.append(BuildSource(None, REFERENCE_MODULE_PREFIX, ""))
+    for source in reference_sources:
+        assert source.text is not None
+        is_package = os.path.basename(source.path or "").startswith("__init__.")
+        sources.append(
+            BuildSource(
+                source.path,
+                f"{REFERENCE_MODULE_PREFIX}.{source.module}",
+                _prefix_imports(
+                    source.text,
+                    REFERENCE_MODULE_PREFIX,
+                    packages,
+                    source.module if is_package else source.module.rpartition(".")[0],
+                ),
+                source.base_dir,
             )
+        )
+
+    build_result = _build(sources, options, semantic_analysis_only)
+
+    reference_modules = []
+    stubbed_modules = []
+    for module in build_result.graph.values():
+        if not module.path or not is_stubbed_module(module):
+            continue
+        if module.id.startswith(REFERENCE_MODULE_PREFIX + "."):
+            if module.tree:
+                strip_module_prefix(module.tree, REFERENCE_MODULE_PREFIX)
+            reference_modules.append(module)
+        elif module.path.startswith(stubs_path):
+            stubbed_modules.append(module)
+
+    return (
+        list(_collect_module_types(stubbed_modules)),
+        list(_collect_module_types(reference_modules, reexported_classes)),
+    )
@@ -1,11 +1,29 @@
-from typing import Dict, cast
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Tuple, cast
 
+import pytest
+from mypy.errors import CompileError
 from mypy.nodes import Decorator, SymbolNode, TypeAlias, TypeInfo
 from mypy.types import CallableType, FuncDef, Instance, UnboundType, UnionType
 
 from testing.util import WithStubTestConfig
 
-from .collect import get_stub_types
+from .collect import (
+    GENERATED_STUBS_PATH,
+    HANDWRITTEN_CACHE_NAMESPACE,
+    REFERENCE_CACHE_NAMESPACE,
+    REFERENCE_MODULE_PREFIX,
+    _build,
+    _mypy_options,
+    _prefix_imports,
+    _semantic_analysis_only,
+    get_cache_dir,
+    get_combined_stub_types,
+    get_generated_stub_types,
+    get_stub_types,
+    get_stubbed_modules,
+)
 
 
 class WithStubSymbols(WithStubTestConfig):
@@ -82,3 +100,237 @@ class TestGetStubTypes(WithStubSymbols):
         aClass = self.symbols.get("classes.AClass")
         assert isinstance(aClass, TypeInfo)
         assert {b.type.fullname for b in aClass.bases} == {"builtins.object"}
+
+
+class TestIncrementalCache(WithStubTestConfig):
+    def test_cache_dir_namespaces(self, tmp_path: Path) -> None:
+        conf_path = self.mypy_config_path
+        handwritten = get_cache_dir(
+            str(tmp_path), HANDWRITTEN_CACHE_NAMESPACE, conf_path
+        )
+        reference = get_cache_dir(str(tmp_path), REFERENCE_CACHE_NAMESPACE, conf_path)
+        assert handwritten != reference
+        assert handwritten == get_cache_dir(
+            str(tmp_path), HANDWRITTEN_CACHE_NAMESPACE, conf_path
+        )
+
+    def test_cache_dir_changes_with_config(self, tmp_path: Path) -> None:
+        conf_path = tmp_path / "mypy.ini"
+        conf_path.write_text("[mypy]\n")
+        before = get_cache_dir(
+            str(tmp_path), HANDWRITTEN_CACHE_NAMESPACE, str(conf_path)
+        )
+        conf_path.write_text("[mypy]\nstrict_optional = False\n")
+        after = get_cache_dir(
+            str(tmp_path), HANDWRITTEN_CACHE_NAMESPACE, str(conf_path)
+        )
+        assert before != after
+
+    def test_cached_build_collects_same_types(self, tmp_path: Path) -> None:
+        stubs_path = self.generated_stubs_path
+        cache_dir = get_cache_dir(
+            str(tmp_path), REFERENCE_CACHE_NAMESPACE, self.mypy_config_path
+        )
+
+        def collect() -> Dict[str, str]:
+            return {
+                symbol.fullname: f"{type(symbol).__name__}:{symbol.line}"
+                for symbol, _ in get_stub_types(
+                    stubs_path, self.mypy_config_path, cache_dir=cache_dir
+                )
+            }
+
+        uncached = {
+            symbol.fullname: f"{type(symbol).__name__}:{symbol.line}"
+            for symbol, _ in get_stub_types(stubs_path, self.mypy_config_path)
+        }
+        # The first run fills the cache, the second one reads from it
+        assert collect() == uncached
+        assert any(Path(cache_dir).iterdir())
+        assert collect() == uncached
+
+
+class TestCombinedBuild(WithStubTestConfig):
+    def test_prefix_imports(self) -> None:
+        text = "\n".join(
+            [
+                "import os, pkg.sub",
+                "from pkg import a as b, c",
+                "from .relative import d",
+                "if sys.version_info >= (3, 8):",
+                "    from pkg.sub import (",
+                "        e,",
+                "    )",
+                "x: pkg.sub.X",
+            ]
+        )
+        assert _prefix_imports(text, "ref", {"pkg"}, "pkg").splitlines() == [
+            "import os; from ref import pkg; import ref.pkg.sub",
+            "from ref.pkg import a as b, c",
+            "from .relative import d",
+            "if sys.version_info >= (3, 8):",
+            "    from ref.pkg.sub import e",
+            "",
+            "",
+            "x: pkg.sub.X",
+        ]
+
+    def test_prefix_imports_beyond_top_level(self) -> None:
+        text = "\n".join(["from .sibling import a", "from .. import b"])
+        assert _prefix_imports(text, "ref", {"pkg"}, "").splitlines() == [
+            "from ..sibling import a",
+            "from ... import b",
+        ]
+        assert _prefix_imports(text, "ref", {"pkg"}, "pkg").splitlines() == [
+            "from .sibling import a",
+            "from ... import b",
+        ]
+
+    def test_reference_symbols_are_not_prefixed(self) -> None:
+        stubs, reference = get_combined_stub_types(
+            self.handwritten_stubs_path,
+            self.generated_stubs_path,
+            self.mypy_config_path,
+        )
+        handwritten_names = {symbol.fullname for symbol, _ in stubs}
+        reference_names = {symbol.fullname for symbol, _ in reference}
+
+        assert "functions.matching_function" in handwritten_names
+        assert "functions.matching_function" in reference_names
+        assert not any(
+            name.startswith(REFERENCE_MODULE_PREFIX)
+            for name in handwritten_names | reference_names
+        )
+
+        subclass = next(s for s, _ in reference if s.fullname == "classes.AClass")
+        assert isinstance(subclass, TypeInfo)
+        assert subclass.module_name == "classes"
+        assert {path for _, path in reference} <= {
+            str(path.resolve()) for path in Path(self.generated_stubs_path).iterdir()
+        }
+
+
+class TestSemanticAnalysisOnly(WithStubTestConfig):
+    def test_collects_same_types(self) -> None:
+        def collect(semantic_analysis_only: bool) -> Dict[str, str]:
+            return {
+                symbol.fullname: f"{type(symbol).__name__}:{symbol.line}"
+                f":{getattr(symbol, 'type', None)}"
+                for symbol, _ in get_stub_types(
+                    self.generated_stubs_path,
+                    self.mypy_config_path,
+                    semantic_analysis_only=semantic_analysis_only,
+                )
+            }
+
+        assert collect(semantic_analysis_only=True) == collect(
+            semantic_analysis_only=False
+        )
+
+    def test_blocking_errors_are_raised(self) -> None:
+        with pytest.raises(CompileError) as ex:
+            list(
+                get_stub_types(
+                    self.get_test_stub_path("test_compile_error_invalid_syntax"),
+                    self.mypy_config_path,
+                    semantic_analysis_only=True,
+                )
+            )
+
+        assert "poolmanager.pyi:7: error: invalid syntax" in ex.value.messages[0]
+
+    def test_only_builds_in_context_stop_after_semantic_analysis(
+        self, tmp_path: Path
+    ) -> None:
+        (tmp_path / "inferred.pyi").write_text("def f() -> int: ...\nx = f()\n")
+
+        def inferred_type(semantic_analysis_only: bool) -> str:
+            sources, options = _mypy_options(self.mypy_config_path, [str(tmp_path)])
+            _, other_options = _mypy_options(self.mypy_config_path, [])
+            with _semantic_analysis_only(other_options):
+                result = _build(sources, options, semantic_analysis_only)
+            return str(getattr(result.files["inferred"].names["x"].node, "type"))
+
+        assert inferred_type(semantic_analysis_only=True) == "None"
+        assert inferred_type(semantic_analysis_only=False) == "builtins.int"
+
+    def test_cache_dir_differs_from_full_build(self, tmp_path: Path) -> None:
+        conf_path = self.mypy_config_path
+        assert get_cache_dir(
+            str(tmp_path), HANDWRITTEN_CACHE_NAMESPACE, conf_path
+        ) != get_cache_dir(
+            str(tmp_path),
+            HANDWRITTEN_CACHE_NAMESPACE,
+            conf_path,
+            semantic_analysis_only=True,
+        )
+
+
+class TestStubbedModules(WithStubTestConfig):
+    def write_stubs(self, path: Path) -> None:
+        (path / "pkg" / "sub").mkdir(parents=True)
+        (path / "pkg" / "__init__.pyi").write_text("")
+        (path / "pkg" / "sub" / "__init__.pyi").write_text("")
+        (path / "pkg" / "base.pyi").write_text("class Base:\n    x: int\n")
+        (path / "pkg" / "sub" / "mod.pyi").write_text(
+            "from pkg.base import Base\nclass Derived(Base): ...\n"
+        )
+        (path / "single.pyi").write_text("y: str\n")
+
+    def test_get_stubbed_modules(self, tmp_path: Path) -> None:
+        self.write_stubs(tmp_path)
+        (tmp_path / "pkg" / "sub" / "__init__.pyi").unlink()
+
+        assert get_stubbed_modules(str(tmp_path)) == [
+            "pkg",
+            "pkg.base",
+            "pkg.sub",
+            "pkg.sub.mod",
+            "single",
+        ]
+
+    def test_only_given_modules_are_collected(self, tmp_path: Path) -> None:
+        self.write_stubs(tmp_path)
+
+        symbols = {
+            symbol.fullname: symbol
+            for symbol, _ in get_stub_types(
+                str(tmp_path),
+                self.mypy_config_path,
+                modules=["pkg", "pkg.sub", "pkg.sub.mod"],
+            )
+        }
+
+        assert set(symbols) == {"pkg.sub.mod.Derived"}
+        # Imported modules are still analyzed
+        derived = cast(TypeInfo, symbols["pkg.sub.mod.Derived"])
+        assert [base.fullname for base in derived.mro] == [
+            "pkg.sub.mod.Derived",
+            "pkg.base.Base",
+            "builtins.object",
+        ]
+
+
+class TestGeneratedStubTypes(WithStubTestConfig):
+    def test_matches_stubs_read_from_files(self) -> None:
+        stubs_path = Path(self.generated_stubs_path)
+        stubs = {
+            path.relative_to(stubs_path).as_posix(): path.read_text()
+            for path in stubs_path.rglob("*.pyi")
+        }
+
+        def describe(symbols: Iterable[Tuple[SymbolNode, str]]) -> Dict[str, str]:
+            return {
+                symbol.fullname: f"{type(symbol).__name__}:{symbol.line}"
+                f":{getattr(symbol, 'type', None)}"
+                for symbol, _ in symbols
+            }
+
+        generated_symbols = list(get_generated_stub_types(stubs, self.mypy_config_path))
+
+        assert describe(generated_symbols) == describe(
+            get_stub_types(self.generated_stubs_path, self.mypy_config_path)
+        )
+        assert {path for _, path in generated_symbols} == {
+            os.path.join(GENERATED_STUBS_PATH, relative_path) for relative_path in stubs
+        }
@@ -4,34 +4,65 @@ Compare mypy types.
 
 from __future__ import annotations
 
+from collections import defaultdict
 from enum import Enum
-from typing import Any, Dict, NamedTuple, Optional, Union
+from functools import partial
+from time import perf_counter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
 
 from mypy.nodes import (
-    ARG_NAMED,
-    ARG_POS,
-    CONTRAVARIANT,
-    COVARIANT,
     Decorator,
     FuncDef,
+    MypyFile,
+    OverloadedFuncDef,
     SymbolNode,
     TypeAlias,
     TypeInfo,
     TypeVarExpr,
+    Var,
 )
-from mypy.subtypes import is_subtype
 from mypy.types import CallableType, Overloaded
 from mypy.types import Type as TypeNode
 
+from .signatures import RequiredArguments, get_argument_signature
+from .snapshot import (
+    ComparableSymbol,
+    SymbolSnapshot,
+    format_symbol_type,
+    restore_symbol,
+)
+from .subtypes import SubtypeCache, TypeKey, canonical_form
 from .types import RelevantSymbolNode
 from .utils import get_expression_fullname
 
+subtype_cache = SubtypeCache()
+"""
+Subtype checks of the current run, shared by all comparisons of mypy types
+(see ``stubalyzer.subtypes``)
+"""
+
+ClassFingerprint = Tuple[Tuple[str, Hashable], ...]
+"""Names of the members of a class with what decides if they match"""
+
 
 class MatchResult(Enum):
     MATCH = "match"
     MISMATCH = "mismatch"
     NOT_FOUND = "not_found"
     MISLOCATED_SYMBOL = "mislocated_symbol"
+    TIMEOUT = "timeout"
 
     @classmethod
     def declare_mismatch(cls, matchResultString: str) -> MatchResult:
@@ -53,53 +84,110 @@ class MatchResult(Enum):
         return result
 
 
-def _get_symbol_type_info(symbol: SymbolNode) -> str:
+class ComparisonResult:
     """
-    Get the type of the given symbol as a human readable string.
+    Result of comparing two symbol nodes and their types.
 
-    :param symbol: symbol for which to get the type
+    Most comparisons match and their message is never shown, so the types of the
+    symbols are only formatted when they are first accessed.
     """
-    if isinstance(symbol, TypeAlias):
-        return repr(symbol.target)
-    if isinstance(symbol, TypeVarExpr):
-        return _format_type_var(symbol)
-    if isinstance(symbol, TypeInfo):
-        return f"Class({symbol.fullname})"
-
-    return repr(getattr(symbol, "type", None))
-
 
-class ComparisonResult(NamedTuple):
-    """
-    Result of comparing two symbol nodes and their types.
-    """
+    __slots__ = (
+        "match_result",
+        "symbol",
+        "reference",
+        "data",
+        "message_val",
+        "_message_factory",
+        "duration",
+        "_symbol_type",
+        "_reference_type",
+        "_message",
+    )
 
     match_result: MatchResult
     """Type of comparison result"""
 
-    symbol: RelevantSymbolNode
+    symbol: ComparableSymbol
     """Symbol that was checked"""
 
-    reference: Optional[SymbolNode]
+    reference: Optional[Union[SymbolNode, SymbolSnapshot]]
     """Reference symbol that was checked against"""
 
-    symbol_name: str
-    """Full name of the symbol that was checked"""
+    data: Optional[Dict[str, Any]]
+    """Optional additional data"""
 
-    symbol_type: str
-    """Type of the symbol that was checked"""
+    message_val: Optional[str]
+    """Optional message"""
 
-    reference_name: Optional[str]
-    """Full name of the reference symbol"""
+    duration: float
+    """Seconds it took to compare the symbols, 0 if they were not compared"""
 
-    reference_type: Optional[str]
-    """Type of the reference symbol"""
+    def __init__(
+        self,
+        match_result: MatchResult,
+        symbol: ComparableSymbol,
+        reference: Optional[Union[SymbolNode, SymbolSnapshot]],
+        data: Optional[Dict[str, Any]] = None,
+        message_val: Optional[str] = None,
+        message_factory: Optional[Callable[[], str]] = None,
+    ) -> None:
+        self.match_result = match_result
+        self.symbol = symbol
+        self.reference = reference
+        self.data = data
+        self.message_val = message_val
+        self._message_factory = message_factory
+        self.duration = 0.0
+        self._symbol_type: Optional[str] = None
+        self._reference_type: Optional[str] = None
+        self._message: Optional[str] = None
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ComparisonResult):
+            return NotImplemented
+        return (
+            self.match_result is other.match_result
+            and self.symbol == other.symbol
+            and self.reference == other.reference
+            and self.data == other.data
+            and self.message_val == other.message_val
+        )
 
-    data: Optional[Dict[str, Any]] = None
-    """Optional additional data"""
+    def __hash__(self) -> int:
+        # Without data, which may not be hashable
+        return hash((self.match_result, self.symbol, self.reference, self.message_val))
 
-    message_val: Optional[str] = None
-    """Optional message"""
+    def __repr__(self) -> str:
+        return (
+            f"ComparisonResult(match_result={self.match_result},"
+            f" symbol_name={self.symbol_name!r},"
+            f" reference_name={self.reference_name!r})"
+        )
+
+    @property
+    def symbol_name(self) -> str:
+        """Full name of the symbol that was checked"""
+        return self.symbol.fullname
+
+    @property
+    def symbol_type(self) -> str:
+        """Type of the symbol that was checked"""
+        if self._symbol_type is None:
+            self._symbol_type = format_symbol_type(self.symbol)
+        return self._symbol_type
+
+    @property
+    def reference_name(self) -> Optional[str]:
+        """Full name of the reference symbol"""
+        return self.reference.fullname if self.reference else None
+
+    @property
+    def reference_type(self) -> Optional[str]:
+        """Type of the reference symbol"""
+        if self._reference_type is None and self.reference:
+            self._reference_type = format_symbol_type(self.reference)
+        return self._reference_type
 
     @property
     def message(self) -> str:
@@ -107,6 +195,14 @@ class ComparisonResult(NamedTuple):
         if self.message_val:
             return self.message_val
 
+        if self._message is None:
+            if self._message_factory:
+                self._message = self._message_factory()
+            else:
+                self._message = self._format_message()
+        return self._message
+
+    def _format_message(self) -> str:
         if self.match_result is MatchResult.MATCH:
             return "\n".join(
                 [
@@ -124,8 +220,13 @@ class ComparisonResult(NamedTuple):
                 ]
             )
         elif self.match_result is MatchResult.NOT_FOUND:
-            return f'Symbol "{self.symbol_name}" not found in generated stubs'
-        elif self.match_result is MatchResult.MISLOCATED_SYMBOL:
+            message = f'Symbol "{self.symbol_name}" not found in generated stubs'
+            candidates = (self.data or {}).get("candidates")
+            if candidates:
+                suggestions = " or ".join(f'"{name}"' for name in candidates)
+                message += f", did you mean {suggestions}?"
+            return message
+        else:
             return (
                 f'Found symbol "{self.symbol_name}" in different location'
                 f' "{self.reference_name}".'
@@ -135,10 +236,11 @@ class ComparisonResult(NamedTuple):
     def create(
         cls,
         match_result: MatchResult,
-        symbol: RelevantSymbolNode,
-        reference: Optional[SymbolNode],
+        symbol: ComparableSymbol,
+        reference: Optional[Union[SymbolNode, SymbolSnapshot]],
         data: Optional[Dict[str, Any]] = None,
         message: Optional[str] = None,
+        message_factory: Optional[Callable[[], str]] = None,
     ) -> ComparisonResult:
         """
         Create a comparison result.
@@ -148,6 +250,8 @@ class ComparisonResult(NamedTuple):
         :param reference: reference symbol that was checked against
         :param data: optional additional data
         :param message: optional message
+        :param message_factory: optional function creating the message, it is only
+            called when the message is first accessed
         """
         return cls(
             match_result=match_result,
@@ -155,15 +259,12 @@ class ComparisonResult(NamedTuple):
             reference=reference,
             data=data,
             message_val=message,
-            symbol_name=symbol.fullname,
-            symbol_type=_get_symbol_type_info(symbol),
-            reference_name=reference.fullname if reference else None,
-            reference_type=_get_symbol_type_info(reference) if reference else None,
+            message_factory=message_factory,
         )
 
     @classmethod
     def create_not_found(
-        cls, symbol: RelevantSymbolNode, data: Optional[Dict[str, Any]] = None
+        cls, symbol: ComparableSymbol, data: Optional[Dict[str, Any]] = None
     ) -> ComparisonResult:
         """
         Create an unsuccessful comparison result
@@ -179,8 +280,8 @@ class ComparisonResult(NamedTuple):
     @classmethod
     def create_mislocated_symbol(
         cls,
-        symbol: RelevantSymbolNode,
-        reference: SymbolNode,
+        symbol: ComparableSymbol,
+        reference: Union[SymbolNode, SymbolSnapshot],
         data: Optional[Dict[str, Any]] = None,
     ) -> ComparisonResult:
         """
@@ -198,6 +299,36 @@ class ComparisonResult(NamedTuple):
             data=data,
         )
 
+    @classmethod
+    def create_timeout(
+        cls,
+        symbol: ComparableSymbol,
+        reference: Union[SymbolNode, SymbolSnapshot],
+        duration: float,
+        time_budget: float,
+    ) -> ComparisonResult:
+        """
+        Create an unsuccessful comparison result where comparing the symbols took
+        longer than the time budget.
+
+        :param symbol: symbol that was checked
+        :param reference: reference symbol that was checked against
+        :param duration: seconds it took to compare the symbols
+        :param time_budget: seconds comparing a symbol may take
+        """
+        result = cls.create(
+            match_result=MatchResult.TIMEOUT,
+            symbol=symbol,
+            reference=reference,
+            data={"duration": duration, "time_budget": time_budget},
+            message=(
+                f'Comparing "{symbol.fullname}" took {duration:.3f}s, longer than'
+                f" the time budget of {time_budget:.3f}s."
+            ),
+        )
+        result.duration = duration
+        return result
+
     @classmethod
     def create_mismatch(
         cls,
@@ -254,7 +385,7 @@ def _mypy_types_match(symbol_type: TypeNode, reference_type: TypeNode) -> MatchR
     :param symbol_type: symbol type to check
     :param reference_type: reference type to check against
     """
-    if is_subtype(symbol_type, reference_type):
+    if subtype_cache.is_subtype(symbol_type, reference_type):
         return MatchResult.MATCH
     return MatchResult.MISMATCH
 
@@ -271,33 +402,8 @@ def _check_arguments_compatible(
         arg_names on
     :param reference: reference CallableType or FuncDef to check against
     """
-    callable_args = list(
-        zip(callable_type_or_func_def.arg_kinds, callable_type_or_func_def.arg_names)
-    )
-    reference_args = list(zip(reference.arg_kinds, reference.arg_names))
-
-    positional_required_identical = [
-        (kind, name) for (kind, name) in callable_args if kind == ARG_POS
-    ] == [(kind, name) for (kind, name) in reference_args if kind == ARG_POS]
-
-    keyword_required_equal = {
-        (kind, name) for (kind, name) in callable_args if kind == ARG_NAMED
-    } == {(kind, name) for (kind, name) in reference_args if kind == ARG_NAMED}
-
-    optional_args = {
-        (kind, name)
-        for (kind, name) in callable_args
-        if kind not in {ARG_POS, ARG_NAMED}
-    }
-    optional_reference_args = {
-        (kind, name)
-        for (kind, name) in reference_args
-        if kind not in {ARG_POS, ARG_NAMED}
-    }
-    optional_compatible = optional_args.issubset(optional_reference_args)
-
-    return (
-        positional_required_identical and keyword_required_equal and optional_compatible
+    return get_argument_signature(callable_type_or_func_def).is_compatible(
+        get_argument_signature(reference)
     )
 
 
@@ -325,19 +431,118 @@ def _overloaded_types_match(
     """
     Check if the given overloaded type matches the reference.
 
+    Every item has to match a different item of the reference. Items are paired in
+    order first. The remaining items may be in a different order in the reference:
+    they are looked up by their canonical form (see
+    :py:func:`stubalyzer.subtypes.canonical_form`) among the remaining reference
+    items with the same required arguments, and only compared to each of those if
+    there is no identical one.
+
     :param overloaded: overloaded type to check
     :param reference_overloaded: overloaded type to check against
     """
     if len(overloaded.items) != len(reference_overloaded.items):
         return MatchResult.MISMATCH
 
+    unpaired = []
+    # Remaining reference items by their required arguments and their id
+    buckets: Dict[RequiredArguments, Dict[int, CallableType]] = defaultdict(dict)
+    identical: Dict[TypeKey, List[CallableType]] = defaultdict(list)
     for ovl, ref in zip(overloaded.items, reference_overloaded.items):
-        if _callable_types_match(ovl, ref) != MatchResult.MATCH:
+        if _callable_types_match(ovl, ref) is not MatchResult.MATCH:
+            unpaired.append(ovl)
+            buckets[get_argument_signature(ref).required][id(ref)] = ref
+            form = canonical_form(ref)
+            if form is not None:
+                identical[form].append(ref)
+
+    for ovl in unpaired:
+        bucket = buckets[get_argument_signature(ovl).required]
+        form = canonical_form(ovl)
+        candidates = identical.get(form, []) if form is not None else []
+        paired = next((ref for ref in candidates if id(ref) in bucket), None)
+        if paired is None:
+            paired = next(
+                (
+                    ref
+                    for ref in bucket.values()
+                    if _callable_types_match(ovl, ref) is MatchResult.MATCH
+                ),
+                None,
+            )
+        if paired is None:
             return MatchResult.MISMATCH
+        del bucket[id(paired)]
 
     return MatchResult.MATCH
 
 
+def _match_mypy_types(
+    symbol: RelevantSymbolNode,
+    symbol_type: Optional[TypeNode],
+    reference: RelevantSymbolNode,
+    reference_type: Optional[TypeNode],
+) -> MatchResult:
+    """
+    Check if the given mypy type matches the reference type, like
+    :py:func:`compare_mypy_types`, without creating a comparison result.
+
+    This is used for the comparisons nested in other comparisons, which only need
+    to know if the types match.
+
+    :param symbol: symbol node the type belongs to
+    :param symbol_type: type to check
+    :param reference: symbol node the reference type belongs to
+    :param reference_type: type to check against
+    """
+    if reference_type is None:
+        # The reference type will never be None for overloaded functions.
+        if isinstance(symbol, FuncDef):
+            assert isinstance(reference, FuncDef)
+            if _check_arguments_compatible(symbol, reference):
+                return MatchResult.MATCH
+            return MatchResult.MISMATCH
+        # MyPy does not have enough type information
+        # hence we accept that our stub is correct
+        return MatchResult.MATCH
+
+    if symbol_type is None:
+        return MatchResult.MISMATCH
+
+    if subtype_cache.are_identical(symbol_type, reference_type):
+        return MatchResult.MATCH
+
+    if isinstance(symbol_type, CallableType) and isinstance(
+        reference_type, CallableType
+    ):
+        return _callable_types_match(symbol_type, reference_type)
+    if isinstance(symbol_type, Overloaded) and isinstance(reference_type, Overloaded):
+        return _overloaded_types_match(symbol_type, reference_type)
+    return _mypy_types_match(symbol_type, reference_type)
+
+
+def _mypy_types_message(
+    symbol: RelevantSymbolNode,
+    reference_type: Optional[TypeNode],
+    match_result: MatchResult,
+) -> Optional[str]:
+    """
+    Get the message explaining the result of :py:func:`_match_mypy_types`, if the
+    default message of the comparison result does not fit.
+
+    :param symbol: symbol node that was checked
+    :param reference_type: type that was checked against
+    :param match_result: result of the check
+    """
+    if reference_type is not None:
+        return None
+    if isinstance(symbol, FuncDef):
+        if match_result is MatchResult.MATCH:
+            return "Matched function definition without reference type."
+        return "Arguments don't match."
+    return "Generated type is None"
+
+
 def compare_mypy_types(
     symbol: RelevantSymbolNode,
     reference: RelevantSymbolNode,
@@ -359,42 +564,13 @@ def compare_mypy_types(
     :param symbol_type: type of the symbol to validate
     :param reference_type: type of the symbol to validate against
     """
-    if reference_type is None:
-        # The reference type will never be None for overloaded functions.
-        if isinstance(symbol, FuncDef):
-            assert isinstance(reference, FuncDef)
-            arguments_compatible = _check_arguments_compatible(symbol, reference)
-            if arguments_compatible:
-                return ComparisonResult.create_match(
-                    symbol=symbol,
-                    reference=reference,
-                    message="Matched function definition without reference type.",
-                )
-            else:
-                return ComparisonResult.create_mismatch(
-                    symbol=symbol, reference=reference, message="Arguments don't match."
-                )
-        else:
-            # MyPy does not have enough type information
-            # hence we accept that our stub is correct
-            return ComparisonResult.create_match(
-                symbol=symbol, reference=reference, message="Generated type is None"
-            )
-
-    if symbol_type is None:
-        return ComparisonResult.create_mismatch(symbol=symbol, reference=reference)
-
-    if isinstance(symbol_type, CallableType) and isinstance(
-        reference_type, CallableType
-    ):
-        match = _callable_types_match(symbol_type, reference_type)
-    elif isinstance(symbol_type, Overloaded) and isinstance(reference_type, Overloaded):
-        match = _overloaded_types_match(symbol_type, reference_type)
-    else:
-        match = _mypy_types_match(symbol_type, reference_type)
+    match = _match_mypy_types(symbol, symbol_type, reference, reference_type)
 
     return ComparisonResult.create(
-        match_result=match, symbol=symbol, reference=reference
+        match_result=match,
+        symbol=symbol,
+        reference=reference,
+        message=_mypy_types_message(symbol, reference_type, match),
     )
 
 
@@ -429,42 +605,22 @@ def _compare_type_aliases(symbol: TypeAlias, reference: TypeAlias) -> Comparison
     return compare_mypy_types(symbol, reference, symbol.target, reference.target)
 
 
-def _format_type_var(symbol: TypeVarExpr) -> str:
-    """
-    Format a TypeVarExpr as it would be written in code.
-
-    :param symbol: TypeVarExpr to format
-    """
-
-    variance = ""
-    if symbol.variance == COVARIANT:
-        variance = ", covariant=True"
-    elif symbol.variance == CONTRAVARIANT:
-        variance = ", contravariant=True"
-
-    values = ""
-    if symbol.values:
-        values = ", " + (", ".join(str(t) for t in symbol.values))
-
-    return f"{symbol.name} = TypeVar('{symbol.name}'{values}{variance})"
-
-
 def _match_type_var_expr(symbol: TypeVarExpr, reference: TypeVarExpr) -> MatchResult:
     if symbol.variance != reference.variance:
         return MatchResult.MISMATCH
 
     if not symbol.values and not reference.values:
-        return compare_mypy_types(
-            symbol, reference, symbol.upper_bound, reference.upper_bound
-        ).match_result
+        return _match_mypy_types(
+            symbol, symbol.upper_bound, reference, reference.upper_bound
+        )
 
     if len(symbol.values) != len(reference.values):
         return MatchResult.MISMATCH
 
     for symbol_type, reference_type in zip(symbol.values, reference.values):
-        result = compare_mypy_types(symbol, reference, symbol_type, reference_type)
-        if result.match_result is not MatchResult.MATCH:
-            return result.match_result
+        match = _match_mypy_types(symbol, symbol_type, reference, reference_type)
+        if match is not MatchResult.MATCH:
+            return match
 
     return MatchResult.MATCH
 
@@ -503,13 +659,19 @@ def _compare_decorator(symbol: Decorator, reference: Decorator) -> ComparisonRes
     )
 
     if symbol_decorators == reference_decorators:
-        function_comparison = compare_symbols(symbol.func, reference.func)
+        func, reference_func = symbol.func, reference.func
+        match = _match_mypy_types(func, func.type, reference_func, reference_func.type)
         return ComparisonResult.create(
-            match_result=function_comparison.match_result,
+            match_result=match,
             symbol=symbol,
             reference=reference,
-            data=function_comparison.data,
-            message=function_comparison.message,
+            # The message describes the functions the decorators are applied to
+            message_factory=lambda: ComparisonResult.create(
+                match_result=match,
+                symbol=func,
+                reference=reference_func,
+                message=_mypy_types_message(func, reference_func.type, match),
+            ).message,
         )
     else:
         return ComparisonResult.create_mismatch(
@@ -525,8 +687,49 @@ def _compare_decorator(symbol: Decorator, reference: Decorator) -> ComparisonRes
         )
 
 
+def _compare_snapshots(
+    symbol: ComparableSymbol,
+    reference: ComparableSymbol,
+    modules: Optional[Dict[str, MypyFile]],
+) -> ComparisonResult:
+    """
+    Check if the given symbol is compatible with the reference symbol, if at least
+    one of them is a snapshot.
+
+    The snapshots are restored to symbol nodes for the comparison, the result
+    references the snapshots again.
+
+    :param symbol: symbol node or snapshot to validate
+    :param reference: symbol node or snapshot to validate against
+    :param modules: modules to resolve the types of the snapshots against
+    """
+    if modules is None:
+        raise ValueError(
+            "The modules of a mypy build are needed to compare symbol snapshots."
+        )
+
+    result = compare_symbols(
+        restore_symbol(symbol, modules)
+        if isinstance(symbol, SymbolSnapshot)
+        else symbol,
+        restore_symbol(reference, modules)
+        if isinstance(reference, SymbolSnapshot)
+        else reference,
+    )
+    return ComparisonResult(
+        match_result=result.match_result,
+        symbol=symbol,
+        reference=reference,
+        data=result.data,
+        message_val=result.message_val,
+        message_factory=result._message_factory,
+    )
+
+
 def compare_symbols(
-    symbol: RelevantSymbolNode, reference: RelevantSymbolNode
+    symbol: ComparableSymbol,
+    reference: ComparableSymbol,
+    modules: Optional[Dict[str, MypyFile]] = None,
 ) -> ComparisonResult:
     """
     Check if the given symbol node is compatible with the reference symbol.
@@ -543,26 +746,212 @@ def compare_symbols(
     -  ``symbol`` and ``reference`` somehow overlap
        (see :py:func:`mypy.meet.is_overlapping_types`)
 
+    Snapshots of symbols (see :py:func:`stubalyzer.snapshot.snapshot_symbol`) can be
+    compared as well, their types are resolved against the given modules then.
+
     :param symbol: symbol node to validate
     :param reference: symbol node to validate against
+    :param modules: modules of a mypy build (``BuildResult.files``), only needed if
+        any of the symbols is a snapshot
+    """
+    return _get_comparer(_pair_kind(symbol, reference), modules)(symbol, reference)
+
+
+def compare_many(
+    pairs: Iterable[Tuple[ComparableSymbol, ComparableSymbol]],
+    modules: Optional[Dict[str, MypyFile]] = None,
+) -> Iterator[ComparisonResult]:
+    """
+    Check a batch of symbols against their reference symbols, like
+    :py:func:`compare_symbols`.
+
+    The pairs are grouped by the kind of their symbols, and each group is compared
+    in one go by the function for its kind. All comparisons share the subtype cache
+    of the run and the argument signatures of the collected functions. The time each
+    comparison takes is recorded in the ``duration`` of its result.
+
+    :param pairs: symbols to validate with the symbols to validate them against
+    :param modules: modules of a mypy build (``BuildResult.files``), only needed if
+        any of the symbols is a snapshot
+    :return: the results, in the order of the pairs
     """
+    pairs = list(pairs)
+    results: List[Optional[ComparisonResult]] = [None] * len(pairs)
+    groups: Dict[Optional[type], List[int]] = defaultdict(list)
+    for index, (symbol, reference) in enumerate(pairs):
+        groups[_pair_kind(symbol, reference)].append(index)
+
+    for kind, indices in groups.items():
+        comparer = _get_comparer(kind, modules)
+        for index in indices:
+            start_time = perf_counter()
+            result = comparer(*pairs[index])
+            result.duration = perf_counter() - start_time
+            results[index] = result
+
+    for compared in results:
+        assert compared is not None
+        yield compared
+
+
+def _compare_symbol_types(
+    symbol: RelevantSymbolNode, reference: RelevantSymbolNode
+) -> ComparisonResult:
+    """
+    Check if the type of the given symbol matches the type of the reference, for
+    functions, overloaded functions and variables.
+
+    :param symbol: symbol node to validate
+    :param reference: symbol node to validate against
+    """
+    return compare_mypy_types(
+        symbol, reference, getattr(symbol, "type"), getattr(reference, "type")
+    )
+
+
+def _compare_different_kinds(
+    symbol: RelevantSymbolNode, reference: RelevantSymbolNode
+) -> ComparisonResult:
+    """
+    Create the result of comparing symbol nodes of different kinds.
+
+    :param symbol: symbol node to validate
+    :param reference: symbol node of another kind to validate against
+    """
+    return ComparisonResult.create_mismatch(symbol=symbol, reference=reference)
+
+
+_COMPARERS: Dict[Optional[type], Callable[[Any, Any], ComparisonResult]] = {
+    None: _compare_different_kinds,
+    TypeInfo: _type_infos_are_same_class,
+    TypeAlias: _compare_type_aliases,
+    TypeVarExpr: _compare_type_var_expr,
+    Decorator: _compare_decorator,
+}
+"""
+Functions comparing the symbols of a kind, by the class of the symbol nodes. Symbol
+nodes of different kinds are compared by the function for ``None``, and all other
+kinds by their types.
+"""
+
+
+def _pair_kind(symbol: ComparableSymbol, reference: ComparableSymbol) -> Optional[type]:
+    """
+    Get the kind of a pair of symbols, which decides how they are compared:
+    ``SymbolSnapshot`` if any of them is a snapshot, ``None`` if they are of
+    different kinds, and the class of the symbol nodes otherwise.
+
+    :param symbol: symbol node or snapshot to validate
+    :param reference: symbol node or snapshot to validate against
+    """
+    if isinstance(symbol, SymbolSnapshot) or isinstance(reference, SymbolSnapshot):
+        return SymbolSnapshot
+
     # TODO: Check if this is always the case, i.e. could there be
     # cases where `symbol` and `reference` don't have the same class but still match?
     if type(symbol) != type(reference):
-        return ComparisonResult.create_mismatch(symbol=symbol, reference=reference)
+        return None
+    return type(symbol)
 
-    if isinstance(symbol, TypeInfo) and isinstance(reference, TypeInfo):
-        return _type_infos_are_same_class(symbol, reference)
 
-    if isinstance(symbol, TypeAlias) and isinstance(reference, TypeAlias):
-        return _compare_type_aliases(symbol, reference)
+def _get_comparer(
+    kind: Optional[type], modules: Optional[Dict[str, MypyFile]]
+) -> Callable[[Any, Any], ComparisonResult]:
+    """
+    Get the function comparing pairs of symbols of the given kind (see
+    :py:func:`_pair_kind`).
 
-    if isinstance(symbol, TypeVarExpr) and isinstance(reference, TypeVarExpr):
-        return _compare_type_var_expr(symbol, reference)
+    :param kind: kind of the pairs
+    :param modules: modules of a mypy build, to compare snapshots
+    """
+    if kind is SymbolSnapshot:
+        return partial(_compare_snapshots, modules=modules)
+    return _COMPARERS.get(kind, _compare_symbol_types)
 
-    if isinstance(symbol, Decorator) and isinstance(reference, Decorator):
-        return _compare_decorator(symbol, reference)
 
-    return compare_mypy_types(
-        symbol, reference, getattr(symbol, "type"), getattr(reference, "type")
-    )
+def _member_fingerprint(member: SymbolNode) -> Optional[Hashable]:
+    """
+    Get what decides if the given class member matches a reference member, which is
+    equal for members that always match.
+
+    :param member: node of a class member
+    :return: the fingerprint, or ``None`` if the member is not covered
+    """
+    if isinstance(member, TypeInfo):
+        # Nested classes only have to be the same class, their members are checked
+        # with their own fingerprint.
+        return ("TypeInfo", member.fullname)
+    if isinstance(member, Decorator):
+        func = _member_fingerprint(member.func)
+        if func is None:
+            return None
+        decorators = tuple(map(get_expression_fullname, member.original_decorators))
+        return ("Decorator", decorators, func)
+    if isinstance(member, FuncDef) and member.type is None:
+        # Functions without a type match if their arguments are compatible
+        return ("FuncDef", None, get_argument_signature(member))
+    if isinstance(member, TypeAlias):
+        form = canonical_form(member.target)
+    elif isinstance(member, (FuncDef, OverloadedFuncDef, Var)):
+        if member.type is None:
+            return (type(member).__name__, None)
+        form = canonical_form(member.type)
+    else:
+        return None
+    if form is None:
+        return None
+    return (type(member).__name__, form)
+
+
+def class_fingerprint(symbol: TypeInfo) -> Optional[ClassFingerprint]:
+    """
+    Get the fingerprint of the members of a class: their names, kinds and canonical
+    types (see :py:func:`stubalyzer.subtypes.canonical_form`). The members of
+    classes with the same fingerprint match each other, also if the classes are
+    from different mypy builds.
+
+    :param symbol: class to get the fingerprint of
+    :return: the fingerprint, or ``None`` if any member is not covered by it
+    """
+    fingerprint = []
+    for name, member in sorted(symbol.names.items()):
+        if member.node is None:
+            continue
+        member_fingerprint = _member_fingerprint(member.node)
+        if member_fingerprint is None:
+            return None
+        fingerprint.append((name, member_fingerprint))
+    return tuple(fingerprint)
+
+
+def compare_class_members(
+    symbol: TypeInfo, reference: TypeInfo
+) -> Optional[Dict[str, ComparisonResult]]:
+    """
+    Compare all members of a class to the members of the reference class in one
+    step, by their fingerprints (see :py:func:`class_fingerprint`).
+
+    If the fingerprints are equal, a successful comparison result is returned for
+    each member, by the full name of the member. The types of the members are only
+    formatted if their results are reported.
+
+    :param symbol: class to validate
+    :param reference: class to validate against
+    :return: the results by member name, or ``None`` if the members have to be
+        compared one by one
+    """
+    fingerprint = class_fingerprint(symbol)
+    if fingerprint is None or fingerprint != class_fingerprint(reference):
+        return None
+
+    results = {}
+    for name, member in symbol.names.items():
+        reference_member = reference.names[name].node
+        if member.node is None or reference_member is None:
+            continue
+        # Only relevant symbol nodes are covered by the fingerprint
+        results[member.node.fullname] = ComparisonResult.create_match(
+            symbol=cast(RelevantSymbolNode, member.node),
+            reference=cast(RelevantSymbolNode, reference_member),
+        )
+    return results
@@ -1,10 +1,21 @@
+from typing import List, Tuple, cast
+from unittest.mock import patch
+
 import pytest
 from mypy.nodes import Var
 from mypy.types import NoneType
 
 from testing.util import MypyNodeFactory
 
-from .compare import ComparisonResult, MatchResult, compare_symbols
+from .compare import (
+    ComparisonResult,
+    MatchResult,
+    class_fingerprint,
+    compare_class_members,
+    compare_many,
+    compare_symbols,
+)
+from .types import RelevantSymbolNode
 
 
 def assert_match(result: ComparisonResult) -> None:
@@ -62,6 +73,36 @@ class TestComparisonResult:
         assert result.message is not None
         assert result.data is data
 
+    def test_types_are_formatted_lazily(self) -> None:
+        own_symbol = Var("x", NoneType())
+        other_symbol = Var("x", NoneType())
+
+        with patch(
+            "stubalyzer.snapshot.repr", create=True, side_effect=repr
+        ) as repr_mock:
+            result = ComparisonResult.create_match(own_symbol, other_symbol)
+            repr_mock.assert_not_called()
+
+            assert result.symbol_type == "None"
+            assert result.reference_type == "None"
+            assert "None" in result.message
+            # The type is formatted once per type object
+            assert repr_mock.call_count == 2
+
+        assert not hasattr(result, "__dict__")
+
+    def test_results_are_hashable(self) -> None:
+        own_symbol = Var("x", NoneType())
+        other_symbol = Var("x", NoneType())
+        data = {"name_a": "package.x", "name_b": "package.x"}
+
+        results = {
+            ComparisonResult.create_match(own_symbol, other_symbol, data=data),
+            ComparisonResult.create_match(own_symbol, other_symbol, data=dict(data)),
+            ComparisonResult.create_mismatch(own_symbol, other_symbol, data=data),
+        }
+        assert len(results) == 2
+
 
 class TestCompareNone:
     def test_right_type_is_none_succeeds(self) -> None:
@@ -107,6 +148,73 @@ class TestCompareTypeInfos:
         assert result.match_result is MatchResult.MISMATCH
 
 
+class TestCompareClassMembers:
+    def test_members_of_identical_classes_match(
+        self, mypy_nodes: MypyNodeFactory
+    ) -> None:
+        cls, cls_reference = mypy_nodes.get_class_with_identical_stub()
+        assert class_fingerprint(cls) == class_fingerprint(cls_reference)
+
+        results = compare_class_members(cls, cls_reference)
+
+        assert results is not None
+        assert sorted(results) == [
+            "classes.ClassWithIdenticalStub.a_classmethod",
+            "classes.ClassWithIdenticalStub.a_method",
+            "classes.ClassWithIdenticalStub.an_attribute",
+        ]
+        for name, result in results.items():
+            assert result.match_result is MatchResult.MATCH
+            assert result.symbol is cls.names[name.split(".")[-1]].node
+            assert result.reference is cls_reference.names[name.split(".")[-1]].node
+            assert (
+                compare_symbols(
+                    result.symbol, cast(RelevantSymbolNode, result.reference)
+                )
+                == result
+            )
+
+    def test_members_of_different_classes_are_compared_one_by_one(
+        self, mypy_nodes: MypyNodeFactory
+    ) -> None:
+        cls, cls_reference = mypy_nodes.get_class()
+
+        assert class_fingerprint(cls) is not None
+        assert class_fingerprint(cls) != class_fingerprint(cls_reference)
+        assert compare_class_members(cls, cls_reference) is None
+
+
+class TestCompareMany:
+    def test_results_are_in_order_of_the_pairs(
+        self, mypy_nodes: MypyNodeFactory
+    ) -> None:
+        pairs: List[Tuple[RelevantSymbolNode, RelevantSymbolNode]] = [
+            mypy_nodes.get_matching_func_node(),
+            mypy_nodes.get_class(),
+            mypy_nodes.get_additional_args_node(),
+            mypy_nodes.get_decorated_with_additional_args(),
+            (mypy_nodes.get_class()[0], mypy_nodes.get_method()[1]),
+            mypy_nodes.get_decorated_function(),
+            mypy_nodes.get_mismatch_with_zero_parameters(),
+        ]
+
+        results = list(compare_many(pairs))
+
+        assert results == [
+            compare_symbols(symbol, reference) for symbol, reference in pairs
+        ]
+        assert [result.match_result for result in results] == [
+            MatchResult.MATCH,
+            MatchResult.MATCH,
+            MatchResult.MISMATCH,
+            MatchResult.MISMATCH,
+            MatchResult.MISMATCH,
+            MatchResult.MATCH,
+            MatchResult.MISMATCH,
+        ]
+        assert all(result.duration > 0 for result in results)
+
+
 class TestComparePrimitiveVars:
     def test_bool_more_specific_than_int(self, mypy_nodes: MypyNodeFactory) -> None:
         int_var = mypy_nodes.get_int_var()
@@ -267,6 +375,21 @@ class TestCompareFunctions:
         result = compare_symbols(overloaded_def, overloaded_reference)
         assert result.match_result is MatchResult.MISMATCH
 
+    def test_reordered_overloads_match(self, mypy_nodes: MypyNodeFactory) -> None:
+        overloaded_def, overloaded_reference = mypy_nodes.get_overloaded_reordered()
+        result = compare_symbols(overloaded_def, overloaded_reference)
+        assert result.match_result is MatchResult.MATCH
+
+    def test_reordered_overloads_mismatch_if_any_item_does_not_match(
+        self, mypy_nodes: MypyNodeFactory
+    ) -> None:
+        (
+            overloaded_def,
+            overloaded_reference,
+        ) = mypy_nodes.get_overloaded_reordered_mismatching()
+        result = compare_symbols(overloaded_def, overloaded_reference)
+        assert result.match_result is MatchResult.MISMATCH
+
     def test_decorated_function_matches(self, mypy_nodes: MypyNodeFactory) -> None:
         decorated, decorated_reference = mypy_nodes.get_decorated_function()
         result = compare_symbols(decorated, decorated_reference)
@@ -279,6 +402,14 @@ class TestCompareFunctions:
         result = compare_symbols(decorated, decorated_reference)
         assert result.match_result is MatchResult.MISMATCH
 
+    def test_decorated_function_message_describes_the_function(
+        self, mypy_nodes: MypyNodeFactory
+    ) -> None:
+        decorated, decorated_reference = mypy_nodes.get_decorated_with_additional_args()
+        result = compare_symbols(decorated, decorated_reference)
+        function_result = compare_symbols(decorated.func, decorated_reference.func)
+        assert result.message == function_result.message
+
     def test_decorated_mismatches_if_handwritten_stub_has_additional_optional_args(
         self, mypy_nodes: MypyNodeFactory
     ) -> None:
@@ -0,0 +1,149 @@
+"""
+Index of the collected stub types, shared by comparing, looking up and reporting
+them.
+
+The symbols collected from a build (see :py:func:`stubalyzer.collect.get_stub_types`)
+are indexed once, by their full name and by their module. The full names, module
+names and paths the index is keyed by are interned, so the symbols of a large tree
+share a single copy of each of them.
+"""
+from collections import defaultdict
+from sys import intern
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from mypy.nodes import TypeInfo
+
+from .lookup import MemberIndex, NameIndex, get_symbol_class
+from .snapshot import ComparableSymbol, SymbolSnapshot, TypeInfoSnapshot
+
+
+class SymbolIndex:
+    """
+    Index of collected symbols, in the order they were collected.
+
+    Symbols that are collected more than once (e.g. overloaded function definitions)
+    are only indexed the first time.
+    """
+
+    def __init__(
+        self,
+        stub_types: Iterable[Tuple[ComparableSymbol, str]] = (),
+        reexported_classes: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """
+        :param stub_types: symbols and the paths of the files they are defined in,
+            as returned by :py:func:`stubalyzer.collect.get_stub_types`
+        :param reexported_classes: classes re-exported by the stubs, which are
+            collected along with the symbols (see the parameter of the same name of
+            :py:func:`stubalyzer.collect.get_stub_types`)
+        """
+        self.paths: Dict[ComparableSymbol, str] = {}
+        """Paths of the files the symbols are defined in, by symbol"""
+        self.symbols: Dict[str, ComparableSymbol] = {}
+        """Symbols by their full name, the last one collected for duplicate names"""
+        # The other indexes are built when they are first needed, comparing
+        # symbols mostly only looks them up by their full name
+        self._modules: Optional[Dict[str, List[ComparableSymbol]]] = None
+        self._member_index: Optional[MemberIndex] = None
+        self._name_index: Optional[NameIndex] = None
+
+        for symbol, path in stub_types:
+            if symbol not in self.paths:
+                self.paths[symbol] = intern(path)
+                self.symbols[intern(symbol.fullname)] = symbol
+        # Only complete once all symbols are collected
+        self.reexported_classes: Dict[str, str] = (
+            {} if reexported_classes is None else reexported_classes
+        )
+        """Full names of the re-exported classes by the names they are re-exported
+        under"""
+
+    @classmethod
+    def from_symbols(cls, symbols: Iterable[ComparableSymbol]) -> "SymbolIndex":
+        """
+        Index symbols without their paths, e.g. reference symbols which are not
+        reported on.
+
+        :param symbols: symbols to index
+        """
+        return cls((symbol, "") for symbol in symbols)
+
+    def __iter__(self) -> Iterator[ComparableSymbol]:
+        return iter(self.paths)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __contains__(self, symbol: object) -> bool:
+        return symbol in self.paths
+
+    @staticmethod
+    def _get_class_fullname(symbol: ComparableSymbol) -> Optional[str]:
+        """
+        Get the full name of the class the given symbol is defined on, if any.
+
+        :param symbol: symbol or snapshot to get the class of
+        """
+        if isinstance(symbol, SymbolSnapshot):
+            return symbol.class_fullname
+        cls = get_symbol_class(symbol)
+        if cls is None:
+            return None
+        fullname: str = cls.fullname
+        return fullname
+
+    def _index_modules(self) -> Dict[str, List[ComparableSymbol]]:
+        """Index the symbols by their module"""
+        modules: Dict[str, List[ComparableSymbol]] = defaultdict(list)
+        # Modules of the classes, which their members are defined in as well
+        class_modules: Dict[str, str] = {}
+        for symbol in self.paths:
+            class_fullname = self._get_class_fullname(symbol)
+            if isinstance(symbol, TypeInfo):
+                module: str = symbol.module_name
+            elif class_fullname is None:
+                module = symbol.fullname.rsplit(".", 1)[0]
+            else:
+                # Classes are collected before their members
+                module = class_modules.get(class_fullname) or (
+                    class_fullname.rsplit(".", 1)[0]
+                )
+            module = intern(module)
+            modules[module].append(symbol)
+            if isinstance(symbol, (TypeInfo, TypeInfoSnapshot)):
+                class_modules[intern(symbol.fullname)] = module
+        return modules
+
+    @property
+    def modules(self) -> Dict[str, List[ComparableSymbol]]:
+        """Symbols by the name of the module they are defined in"""
+        if self._modules is None:
+            self._modules = self._index_modules()
+        return self._modules
+
+    def get_location(self, symbol: ComparableSymbol) -> Tuple[str, int, int]:
+        """
+        Get the path of the file, the line and the column the given symbol is
+        defined at. Snapshots know their path already.
+
+        :param symbol: indexed symbol or snapshot
+        """
+        if isinstance(symbol, SymbolSnapshot) and symbol.path is not None:
+            path = symbol.path
+        else:
+            path = self.paths[symbol]
+        return (path, symbol.line, symbol.column)
+
+    @property
+    def member_index(self) -> MemberIndex:
+        """Index of the members of the classes, including inherited members"""
+        if self._member_index is None:
+            self._member_index = MemberIndex(self.symbols, self.reexported_classes)
+        return self._member_index
+
+    @property
+    def name_index(self) -> NameIndex:
+        """Index of the top level symbols by their short name"""
+        if self._name_index is None:
+            self._name_index = NameIndex(self.symbols.values())
+        return self._name_index
@@ -0,0 +1,58 @@
+from typing import List, Tuple
+
+from testing.util import WithStubTestConfig
+
+from .collect import get_stub_types
+from .index import SymbolIndex
+from .snapshot import take_snapshots
+from .types import RelevantSymbolNode
+
+
+class TestSymbolIndex(WithStubTestConfig):
+    _stub_types: List[Tuple[RelevantSymbolNode, str]]
+
+    @classmethod
+    def setup_class(cls) -> None:
+        cls._stub_types = list(
+            get_stub_types(cls.get_handwritten_stubs_path(), cls.get_mypy_config_path())
+        )
+
+    def test_index(self) -> None:
+        index = SymbolIndex(self._stub_types)
+
+        cls = index.symbols["classes.AClass"]
+        method = index.symbols["classes.AClass.a_method"]
+        function = index.symbols["functions.additional_args"]
+        assert cls in index.modules["classes"] and method in index.modules["classes"]
+        assert function in index.modules["functions"]
+        path, line, _ = index.get_location(method)
+        assert path.endswith("classes.pyi") and line == 4
+
+    def test_symbols_are_indexed_once(self) -> None:
+        index = SymbolIndex(self._stub_types + self._stub_types)
+
+        assert list(index) == list(dict.fromkeys(s for s, _ in self._stub_types))
+        assert len(index) == len(index.symbols)
+
+    def test_fullnames_are_interned(self) -> None:
+        index = SymbolIndex(self._stub_types)
+        generated_index = SymbolIndex(
+            get_stub_types(self.get_generated_stubs_path(), self.get_mypy_config_path())
+        )
+        generated_names = {name: name for name in generated_index.symbols}
+
+        for name in index.symbols:
+            if name in generated_names:
+                assert generated_names[name] is name
+
+    def test_index_snapshots(self) -> None:
+        index = SymbolIndex(take_snapshots(self._stub_types))
+
+        method = index.symbols["classes.AClass.a_method"]
+        assert method in index.modules["classes"]
+        path, _, _ = index.get_location(method)
+        assert path.endswith("classes.pyi")
+        assert index.member_index.lookup("classes.SubClassOfAClass", "a_method") == (
+            method,
+            index.symbols["classes.AClass"],
+        )
@@ -1,14 +1,22 @@
-from typing import Dict, NamedTuple, Optional
+"""
+Look up where symbols are defined in the reference stubs.
+"""
+from collections import defaultdict
+from heapq import nsmallest
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple, Union
 
-from mypy.nodes import FUNC_NO_INFO, SymbolNode, TypeInfo
+from mypy.nodes import FUNC_NO_INFO, Decorator, FuncDef, SymbolNode, TypeInfo
 
-from .types import RelevantSymbolNode
+from .snapshot import ComparableSymbol, SymbolSnapshot, TypeInfoSnapshot
+
+MAX_CANDIDATES = 3
+"""Maximum number of symbols suggested for a symbol that was not found"""
 
 
 class LookupResult(NamedTuple):
-    symbol: Optional[SymbolNode]
+    symbol: Optional[Union[SymbolNode, SymbolSnapshot]]
     """Symbol that was found"""
-    containing_class: Optional[TypeInfo]
+    containing_class: Optional[Union[TypeInfo, TypeInfoSnapshot]]
     """Class the symbol was found on"""
 
 
@@ -25,8 +33,192 @@ def get_symbol_class(symbol: SymbolNode) -> Optional[TypeInfo]:
     return None
 
 
+def _get_snapshot_class(
+    symbol_map: Mapping[str, ComparableSymbol], symbol: SymbolSnapshot
+) -> Optional[TypeInfoSnapshot]:
+    """
+    Get the snapshot of the class the given snapshot is defined on.
+
+    :param symbol_map: Dictionary for looking up symbols by their full name
+    :param symbol: Snapshot to retrieve the class of
+    """
+    if symbol.class_fullname is None:
+        return None
+
+    cls = symbol_map.get(symbol.class_fullname)
+    return cls if isinstance(cls, TypeInfoSnapshot) else None
+
+
+class MemberIndex:
+    """
+    Index of the members of the classes in a symbol map, including the members they
+    inherit, by the full name of the class and the name of the member.
+
+    A member is found by going through the method resolution order of the class
+    when it is first looked up. Later lookups of the member are a single dictionary
+    lookup.
+
+    Classes are also found by the names the stubs re-export them under, e.g.
+    ``pkg._impl.Class`` as ``pkg.Class`` if ``pkg`` imports it with
+    ``from pkg._impl import Class as Class``.
+    """
+
+    def __init__(
+        self,
+        symbol_map: Mapping[str, ComparableSymbol],
+        reexported_classes: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        """
+        :param symbol_map: Dictionary for looking up symbols by their full name
+        :param reexported_classes: Full names of the classes by the names they are
+            re-exported under (see
+            :py:func:`stubalyzer.collect.get_reexported_classes`)
+        """
+        self.symbol_map = symbol_map
+        self.reexported_classes = (
+            {} if reexported_classes is None else reexported_classes
+        )
+        self._members: Dict[Tuple[str, str], LookupResult] = {}
+
+    def lookup_class(
+        self, class_fullname: str
+    ) -> Optional[Union[TypeInfo, TypeInfoSnapshot]]:
+        """
+        Find a class by its full name, or by a name it is re-exported under.
+
+        :param class_fullname: Full name of the class
+        """
+        cls = self.symbol_map.get(class_fullname)
+        if cls is None:
+            reexported = self.reexported_classes.get(class_fullname)
+            if reexported is not None:
+                cls = self.symbol_map.get(reexported)
+        return cls if isinstance(cls, (TypeInfo, TypeInfoSnapshot)) else None
+
+    def _lookup_member(self, class_fullname: str, name: str) -> LookupResult:
+        """
+        Find a member of a class by going through its method resolution order.
+
+        :param class_fullname: Full name of the class
+        :param name: Name of the member
+        """
+        cls = self.lookup_class(class_fullname)
+        if isinstance(cls, TypeInfoSnapshot):
+            # Snapshots of classes include their inherited members already
+            member = cls.members.get(name)
+            if member is None:
+                return LookupResult(None, None)
+            return LookupResult(member, _get_snapshot_class(self.symbol_map, member))
+
+        if cls is not None:
+            for base in cls.mro or [cls]:
+                symbol_table_node = base.names.get(name)
+                if symbol_table_node is not None:
+                    if symbol_table_node.node is None:
+                        break
+                    return LookupResult(symbol_table_node.node, base)
+        return LookupResult(None, None)
+
+    def lookup(self, class_fullname: str, name: str) -> LookupResult:
+        """
+        Find a member of a class, also if it is inherited.
+
+        :param class_fullname: Full name of the class
+        :param name: Name of the member
+        :return: The member (if any) and the class it is defined on (if any)
+        """
+        key = (class_fullname, name)
+        result = self._members.get(key)
+        if result is None:
+            result = self._members[key] = self._lookup_member(class_fullname, name)
+        return result
+
+
+def is_top_level(symbol: ComparableSymbol) -> bool:
+    """
+    Check if the given symbol is defined at the top level of its module, and not on
+    a class.
+    """
+    if isinstance(symbol, SymbolSnapshot):
+        return symbol.class_fullname is None
+    if isinstance(symbol, TypeInfo):
+        fullname: str = symbol.fullname
+        return fullname == f"{symbol.module_name}.{symbol.name}"
+    return get_symbol_class(symbol) is None
+
+
+def _get_arity(symbol: ComparableSymbol) -> Optional[int]:
+    """
+    Get the number of arguments of the given function, ``None`` for other symbols.
+    """
+    if isinstance(symbol, Decorator):
+        symbol = symbol.func
+    if isinstance(symbol, FuncDef):
+        return len(symbol.arg_kinds)
+    return None
+
+
+class NameIndex:
+    """
+    Index of the symbols defined at the top level of the modules in a symbol map, by
+    their short name, e.g. ``pkg.mod.function`` by ``function``.
+
+    It is used to suggest where a symbol that was not found may have been moved to,
+    e.g. to a sibling module or to the package ``__init__`` that re-exports it. The
+    index is built in one pass over the symbols, after that finding the candidates
+    for a symbol only looks at the symbols of the same name.
+    """
+
+    def __init__(self, symbols: Iterable[ComparableSymbol]) -> None:
+        """
+        :param symbols: symbols to index
+        """
+        self._symbols: Dict[str, List[Tuple[str, Optional[int]]]] = defaultdict(list)
+        for symbol in symbols:
+            if is_top_level(symbol):
+                self._symbols[symbol.name].append((symbol.fullname, _get_arity(symbol)))
+
+    def candidates(
+        self, symbol: ComparableSymbol, limit: int = MAX_CANDIDATES
+    ) -> List[str]:
+        """
+        Get the full names of the indexed symbols with the same name as the given
+        symbol, the most likely ones first: functions with the same number of
+        arguments, then symbols in modules closer to the module of the symbol.
+
+        :param symbol: symbol that was not found
+        :param limit: maximum number of candidates
+        """
+        arity = _get_arity(symbol)
+        parts = symbol.fullname.split(".")
+
+        def rank(candidate: Tuple[str, Optional[int]]) -> Tuple[bool, int, str]:
+            fullname, candidate_arity = candidate
+            common = 0
+            for part, candidate_part in zip(parts, fullname.split(".")):
+                if part != candidate_part:
+                    break
+                common += 1
+            return (candidate_arity != arity, -common, fullname)
+
+        return [
+            fullname
+            for fullname, _ in nsmallest(
+                limit,
+                (
+                    candidate
+                    for candidate in self._symbols.get(symbol.name, [])
+                    if candidate[0] != symbol.fullname
+                ),
+                key=rank,
+            )
+        ]
+
+
 def lookup_symbol(
-    symbol_map: Dict[str, RelevantSymbolNode], symbol_to_lookup: SymbolNode
+    symbol_map: Mapping[str, ComparableSymbol],
+    symbol_to_lookup: Union[SymbolNode, SymbolSnapshot],
+    member_index: Optional[MemberIndex] = None,
 ) -> LookupResult:
     """
     Find the given symbol in the symbol map.
@@ -38,32 +230,46 @@ def lookup_symbol(
 
     If the result of the lookup has a different ``fullname`` than the original symbol
     the given symbol is defined at a different point in the class hierarchy than
-    expected.
+    expected. Classes are also found by the names they are re-exported under (see
+    :py:func:`MemberIndex.lookup_class`).
+
+    The symbol map and the symbol to look up may contain snapshots of the symbols
+    instead (see :py:func:`stubalyzer.snapshot.snapshot_symbol`).
 
     :param symbol_map: Dictionary for looking up symbols by their full name
     :param symbol_to_lookup: Symbol to search for
+    :param member_index: Index of the classes in the symbol map, to reuse it for
+        multiple lookups
     :return: The found symbol (if any) and the class it was found on (if any)
     """
     fail = LookupResult(None, None)
 
     symbol = symbol_map.get(symbol_to_lookup.fullname)
+    if isinstance(symbol, SymbolSnapshot):
+        return LookupResult(symbol, _get_snapshot_class(symbol_map, symbol))
     if symbol:
         return LookupResult(symbol, get_symbol_class(symbol))
 
-    # Check if we have a class on the symbol we're looking up
-    cls_to_lookup = getattr(symbol_to_lookup, "info", None)
-    if not cls_to_lookup or cls_to_lookup == FUNC_NO_INFO:
-        return fail
+    if member_index is None:
+        member_index = MemberIndex(symbol_map)
 
-    symbol_cls = symbol_map.get(cls_to_lookup.fullname)
+    if isinstance(symbol_to_lookup, (TypeInfo, TypeInfoSnapshot)):
+        cls = member_index.lookup_class(symbol_to_lookup.fullname)
+        if cls is None:
+            return fail
+        if isinstance(cls, TypeInfoSnapshot):
+            return LookupResult(cls, _get_snapshot_class(symbol_map, cls))
+        return LookupResult(cls, get_symbol_class(cls))
 
-    if not symbol_cls or not isinstance(symbol_cls, TypeInfo):
-        return fail
-
-    found_symbol_table_node = symbol_cls.get(symbol_to_lookup.name)
-    if not found_symbol_table_node or not found_symbol_table_node.node:
+    # Check if we have a class on the symbol we're looking up
+    if isinstance(symbol_to_lookup, SymbolSnapshot):
+        cls_fullname = symbol_to_lookup.class_fullname
+    else:
+        cls_to_lookup = getattr(symbol_to_lookup, "info", None)
+        if not cls_to_lookup or cls_to_lookup == FUNC_NO_INFO:
+            return fail
+        cls_fullname = cls_to_lookup.fullname
+    if cls_fullname is None:
         return fail
 
-    return LookupResult(
-        found_symbol_table_node.node, get_symbol_class(found_symbol_table_node.node)
-    )
+    return member_index.lookup(cls_fullname, symbol_to_lookup.name)
@@ -1,10 +1,14 @@
 from copy import copy
+from pathlib import Path
+from typing import Dict, Tuple
 
 from mypy.nodes import FUNC_NO_INFO
 
-from testing.util import MypyNodeFactory
+from testing.util import MypyNodeFactory, WithStubTestConfig
 
-from .lookup import LookupResult, lookup_symbol
+from .collect import get_stub_types
+from .lookup import LookupResult, MemberIndex, NameIndex, lookup_symbol
+from .types import RelevantSymbolNode
 
 
 class TestLookupOfMislocatedSymbols:
@@ -49,3 +53,133 @@ class TestLookupOfMislocatedSymbols:
 
         result = lookup_symbol(gen_map, hand)
         assert result == LookupResult(symbol=gen, containing_class=gen.info)
+
+
+class TestMemberIndex(WithStubTestConfig):
+    def test_inherited_member(self, mypy_nodes: MypyNodeFactory) -> None:
+        gen_map = mypy_nodes.get_generated_stubs_map()
+        actual_location = mypy_nodes.get_mislocated_method_actual_location_generated()
+        index = MemberIndex(gen_map)
+
+        result = index.lookup("classes.ClassWithoutSuperClassInHandwritten", "a_method")
+
+        assert result == LookupResult(
+            symbol=actual_location, containing_class=actual_location.info
+        )
+        assert index.lookup("classes.AClass", "a_method") == result
+        assert index.lookup("classes.AClass", "not_a_member") == (None, None)
+        assert index.lookup("classes.NotAClass", "a_method") == (None, None)
+
+    def get_reexport_stubs(
+        self, tmp_path: Path, reference_init: str
+    ) -> Tuple[
+        Dict[str, RelevantSymbolNode], Dict[str, RelevantSymbolNode], MemberIndex
+    ]:
+        handwritten_path = tmp_path / "handwritten" / "pkg"
+        handwritten_path.mkdir(parents=True)
+        (handwritten_path / "__init__.pyi").write_text(
+            "class Base:\n    def method(self) -> None: ...\n"
+        )
+        reference_path = tmp_path / "reference" / "pkg"
+        reference_path.mkdir(parents=True)
+        (reference_path / "__init__.pyi").write_text(reference_init)
+        (reference_path / "_impl.pyi").write_text(
+            "class Base:\n    def method(self) -> None: ...\n"
+        )
+
+        handwritten = {
+            symbol.fullname: symbol
+            for symbol, _ in get_stub_types(
+                str(handwritten_path.parent), self.get_mypy_config_path()
+            )
+        }
+        reexported_classes: Dict[str, str] = {}
+        reference = {
+            symbol.fullname: symbol
+            for symbol, _ in get_stub_types(
+                str(reference_path.parent),
+                self.get_mypy_config_path(),
+                reexported_classes=reexported_classes,
+            )
+        }
+        return handwritten, reference, MemberIndex(reference, reexported_classes)
+
+    def test_reexported_class(self, tmp_path: Path) -> None:
+        handwritten, reference, index = self.get_reexport_stubs(
+            tmp_path, "from pkg._impl import Base as Base\n"
+        )
+
+        assert index.reexported_classes == {"pkg.Base": "pkg._impl.Base"}
+        assert lookup_symbol(reference, handwritten["pkg.Base"], index) == (
+            reference["pkg._impl.Base"],
+            None,
+        )
+        assert lookup_symbol(reference, handwritten["pkg.Base.method"], index) == (
+            reference["pkg._impl.Base.method"],
+            reference["pkg._impl.Base"],
+        )
+
+    def test_class_not_reexported(self, tmp_path: Path) -> None:
+        handwritten, reference, index = self.get_reexport_stubs(tmp_path, "")
+
+        assert index.reexported_classes == {}
+        assert lookup_symbol(reference, handwritten["pkg.Base"], index) == (
+            None,
+            None,
+        )
+        assert lookup_symbol(reference, handwritten["pkg.Base.method"], index) == (
+            None,
+            None,
+        )
+
+
+class TestNameIndex(WithStubTestConfig):
+    def test_candidates(self, tmp_path: Path) -> None:
+        stubs = {
+            "handwritten/pkg/__init__.pyi": "",
+            "handwritten/pkg/mod.pyi": (
+                "def helper(a: int) -> int: ...\n"
+                "class Class:\n"
+                "    def helper(self) -> None: ...\n"
+            ),
+            "reference/pkg/__init__.pyi": "def helper(a: int) -> int: ...\n",
+            "reference/pkg/other.pyi": (
+                "def helper(a: int, b: int) -> int: ...\n"
+                "class Class:\n"
+                "    def helper(self) -> None: ...\n"
+            ),
+            "reference/other_pkg/__init__.pyi": "",
+            "reference/other_pkg/mod.pyi": "helper: int\n",
+        }
+        for path, text in stubs.items():
+            (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / path).write_text(text)
+        handwritten = {
+            symbol.fullname: symbol
+            for symbol, _ in get_stub_types(
+                str(tmp_path / "handwritten"), self.get_mypy_config_path()
+            )
+        }
+        reference = [
+            symbol
+            for symbol, _ in get_stub_types(
+                str(tmp_path / "reference"), self.get_mypy_config_path()
+            )
+        ]
+        index = NameIndex(reference)
+
+        assert index.candidates(handwritten["pkg.mod.helper"]) == [
+            "pkg.helper",
+            "pkg.other.helper",
+            "other_pkg.mod.helper",
+        ]
+        assert index.candidates(handwritten["pkg.mod.helper"], limit=1) == [
+            "pkg.helper"
+        ]
+        assert index.candidates(handwritten["pkg.mod.Class"]) == ["pkg.other.Class"]
+        # Class members are not indexed
+        assert index.candidates(handwritten["pkg.mod.Class.helper"]) == [
+            "pkg.helper",
+            "pkg.other.helper",
+            "other_pkg.mod.helper",
+        ]
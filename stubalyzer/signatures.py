@@ -0,0 +1,132 @@
+"""
+Argument signatures of functions and callable types.
+
+Comparing the arguments of two functions only needs their kinds and names. They
+are extracted once per function or callable type into an
+``ArgumentSignature``, which is shared by all functions with the same
+arguments. The signatures of the collected functions are extracted while they are
+collected (see :py:func:`index_argument_signatures`), and kept until the
+comparison of the run is done (see :py:func:`clear_argument_signatures`).
+"""
+from typing import Dict, FrozenSet, NamedTuple, Optional, Tuple, Union
+
+from mypy.nodes import (
+    ARG_NAMED,
+    ARG_POS,
+    ArgKind,
+    Decorator,
+    FuncDef,
+    OverloadedFuncDef,
+    SymbolNode,
+)
+from mypy.types import CallableType, Overloaded, get_proper_type
+
+Argument = Tuple[ArgKind, Optional[str]]
+RequiredArguments = Tuple[Tuple[Argument, ...], FrozenSet[Argument]]
+"""Required positional and keyword arguments, which compatible signatures share"""
+
+# Signatures by the id of the function or callable type. The objects are kept, so
+# their ids are not reused for other objects while they are in here.
+_signatures: Dict[int, Tuple[object, "ArgumentSignature"]] = {}
+_interned_signatures: Dict["ArgumentSignature", "ArgumentSignature"] = {}
+
+
+class ArgumentSignature(NamedTuple):
+    """
+    Kinds and names of the arguments of a function.
+    """
+
+    positional: Tuple[Argument, ...]
+    """Required positional arguments, in order"""
+
+    keyword: FrozenSet[Argument]
+    """Required keyword arguments"""
+
+    optional: FrozenSet[Argument]
+    """Optional arguments, including ``*args`` and ``**kwargs``"""
+
+    @property
+    def required(self) -> RequiredArguments:
+        """Required positional and keyword arguments"""
+        return (self.positional, self.keyword)
+
+    def is_compatible(self, reference: "ArgumentSignature") -> bool:
+        """
+        Check if the arguments are compatible with the reference arguments: the
+        required arguments are the same and all optional arguments are optional in
+        the reference as well.
+
+        :param reference: signature to check against
+        """
+        if self is reference:
+            return True
+        return (
+            self.positional == reference.positional
+            and self.keyword == reference.keyword
+            and self.optional <= reference.optional
+        )
+
+
+def get_argument_signature(
+    callable_type_or_func_def: Union[CallableType, FuncDef]
+) -> ArgumentSignature:
+    """
+    Get the argument signature of a function or callable type. The signature is
+    extracted when this is first called for the object.
+
+    :param callable_type_or_func_def: FuncDef or CallableType to get the arguments of
+    """
+    cached = _signatures.get(id(callable_type_or_func_def))
+    if cached is not None and cached[0] is callable_type_or_func_def:
+        return cached[1]
+
+    arguments = list(
+        zip(callable_type_or_func_def.arg_kinds, callable_type_or_func_def.arg_names)
+    )
+    signature = ArgumentSignature(
+        positional=tuple((kind, name) for (kind, name) in arguments if kind == ARG_POS),
+        keyword=frozenset(
+            (kind, name) for (kind, name) in arguments if kind == ARG_NAMED
+        ),
+        optional=frozenset(
+            (kind, name)
+            for (kind, name) in arguments
+            if kind not in {ARG_POS, ARG_NAMED}
+        ),
+    )
+    signature = _interned_signatures.setdefault(signature, signature)
+    _signatures[id(callable_type_or_func_def)] = (callable_type_or_func_def, signature)
+    return signature
+
+
+def index_argument_signatures(symbol: SymbolNode) -> None:
+    """
+    Extract the argument signatures of the given function, of its type and of the
+    items of overloaded functions, so they are ready when the function is compared.
+    Other symbols are ignored.
+
+    :param symbol: collected symbol
+    """
+    if isinstance(symbol, Decorator):
+        symbol = symbol.func
+    if isinstance(symbol, FuncDef):
+        get_argument_signature(symbol)
+    if not isinstance(symbol, (FuncDef, OverloadedFuncDef)) or symbol.type is None:
+        return
+
+    symbol_type = get_proper_type(symbol.type)
+    if isinstance(symbol_type, CallableType):
+        get_argument_signature(symbol_type)
+    elif isinstance(symbol_type, Overloaded):
+        for item in symbol_type.items:
+            get_argument_signature(item)
+
+
+def clear_argument_signatures() -> None:
+    """
+    Forget the functions and callable types whose signatures were extracted, so
+    the build they belong to can be freed. This is done by
+    :py:func:`stubalyzer.analyze.analyze_stubs` once the comparison is done, other
+    callers collecting and comparing types have to call it themselves.
+    """
+    _signatures.clear()
@@ -0,0 +1,66 @@
+from mypy.nodes import ARG_NAMED, ARG_OPT, ARG_POS, ARG_STAR
+from mypy.types import CallableType
+
+from testing.util import MypyNodeFactory
+
+from . import signatures
+from .signatures import (
+    ArgumentSignature,
+    clear_argument_signatures,
+    get_argument_signature,
+)
+
+
+class TestArgumentSignature:
+    def test_get_argument_signature(self, mypy_nodes: MypyNodeFactory) -> None:
+        function, _ = mypy_nodes.get_additional_optional_args_node()
+
+        assert get_argument_signature(function) == ArgumentSignature(
+            positional=((ARG_POS, "foo"),),
+            keyword=frozenset(),
+            optional=frozenset({(ARG_OPT, "bar")}),
+        )
+
+    def test_signatures_are_shared(self, mypy_nodes: MypyNodeFactory) -> None:
+        function, reference = mypy_nodes.get_matching_func_node()
+        assert isinstance(reference.type, CallableType)
+
+        assert get_argument_signature(function) is get_argument_signature(reference)
+        assert get_argument_signature(function) is get_argument_signature(
+            reference.type
+        )
+
+    def test_signatures_are_indexed_when_collected(
+        self, mypy_nodes: MypyNodeFactory
+    ) -> None:
+        function, reference = mypy_nodes.get_matching_func_node()
+
+        assert signatures._signatures[id(function)][0] is function
+        assert signatures._signatures[id(reference.type)][0] is reference.type
+
+    def test_clear_argument_signatures(self, mypy_nodes: MypyNodeFactory) -> None:
+        function, _ = mypy_nodes.get_matching_func_node()
+        signature = get_argument_signature(function)
+
+        clear_argument_signatures()
+
+        assert id(function) not in signatures._signatures
+        # Extracted again, the same signatures are still shared
+        assert get_argument_signature(function) is signature
+
+    def test_is_compatible(self) -> None:
+        signature = ArgumentSignature(
+            positional=((ARG_POS, "a"),),
+            keyword=frozenset({(ARG_NAMED, "b")}),
+            optional=frozenset({(ARG_OPT, "c")}),
+        )
+
+        assert signature.is_compatible(signature)
+        assert signature.is_compatible(
+            signature._replace(optional=frozenset({(ARG_OPT, "c"), (ARG_STAR, None)}))
+        )
+        assert not signature.is_compatible(signature._replace(optional=frozenset()))
+        assert not signature.is_compatible(signature._replace(keyword=frozenset()))
+        assert not signature.is_compatible(
+            signature._replace(positional=((ARG_POS, "b"),))
+        )
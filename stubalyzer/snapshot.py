@@ -0,0 +1,453 @@
+"""
+Detached snapshots of the symbols collected from mypy builds.
+
+Symbol nodes reference the whole graph of the mypy build they were created in, which
+keeps it alive and makes them expensive to send to other processes. Snapshots only
+hold what stubalyzer needs of a symbol: its full name, location and its type, both
+formatted for messages and serialized with mypy's own ``serialize()``. They are
+small and can be pickled.
+
+To compare snapshots, they are restored to symbol nodes again (see
+:py:func:`restore_symbol`), with the types resolved against the modules of a mypy
+build.
+
+Snapshots can be written to a file and read again (see :py:func:`write_snapshots`),
+e.g. to reuse the symbols of reference stubs in multiple projects.
+"""
+import json
+import pickle
+from typing import (
+    BinaryIO,
+    ClassVar,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from mypy.fixup import NodeFixer
+from mypy.nodes import (
+    CONTRAVARIANT,
+    COVARIANT,
+    Block,
+    ClassDef,
+    Decorator,
+    FuncDef,
+    MypyFile,
+    NameExpr,
+    OverloadedFuncDef,
+    SymbolNode,
+    SymbolTable,
+    TypeAlias,
+    TypeInfo,
+    TypeVarExpr,
+    Var,
+)
+from mypy.version import __version__ as mypy_version
+
+from .types import RelevantSymbolNode
+from .utils import get_expression_fullname
+
+
+class SymbolSnapshot:
+    """
+    Snapshot of a symbol node, which does not reference the mypy build it was
+    collected from.
+    """
+
+    __slots__ = ("fullname", "path", "line", "column", "class_fullname", "type", "data")
+
+    kind: ClassVar[str] = ""
+    """Name of the class of the symbol node, e.g. ``"FuncDef"``"""
+
+    def __init__(
+        self,
+        fullname: str,
+        path: Optional[str],
+        line: int,
+        column: int,
+        class_fullname: Optional[str],
+        type: str,
+        data: Optional[bytes],
+    ):
+        self.fullname = fullname
+        """Full name of the symbol"""
+        self.path = path
+        """Path of the stub file the symbol is defined in, if it was collected"""
+        self.line = line
+        self.column = column
+        self.class_fullname = class_fullname
+        """Full name of the class the symbol is defined on, if any"""
+        self.type = type
+        """Type of the symbol as a human readable string"""
+        self.data = data
+        """
+        The symbol node serialized by mypy and encoded as JSON. It is only decoded
+        when the symbol is restored, which keeps snapshots small and fast to load.
+        """
+
+    @property
+    def name(self) -> str:
+        """Short name of the symbol"""
+        return self.fullname.rsplit(".", 1)[-1]
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.fullname!r})"
+
+
+class VarSnapshot(SymbolSnapshot):
+    __slots__ = ()
+    kind = "Var"
+
+
+class FuncDefSnapshot(SymbolSnapshot):
+    __slots__ = ()
+    kind = "FuncDef"
+
+
+class OverloadedFuncDefSnapshot(SymbolSnapshot):
+    __slots__ = ()
+    kind = "OverloadedFuncDef"
+
+
+class DecoratorSnapshot(SymbolSnapshot):
+    __slots__ = ("decorators",)
+    kind = "Decorator"
+
+    decorators: List[Optional[str]]
+    """Full names of the decorators, mypy does not serialize them"""
+
+
+class TypeInfoSnapshot(SymbolSnapshot):
+    __slots__ = ("mro", "members")
+    kind = "TypeInfo"
+
+    mro: List[str]
+    """Full names of the classes in the method resolution order of the class"""
+
+    members: Dict[str, SymbolSnapshot]
+    """Snapshots of all members of the class, including inherited ones, by name"""
+
+
+class TypeVarExprSnapshot(SymbolSnapshot):
+    __slots__ = ()
+    kind = "TypeVarExpr"
+
+
+class TypeAliasSnapshot(SymbolSnapshot):
+    __slots__ = ()
+    kind = "TypeAlias"
+
+
+SNAPSHOT_CLASSES: Dict[type, type] = {
+    Var: VarSnapshot,
+    FuncDef: FuncDefSnapshot,
+    OverloadedFuncDef: OverloadedFuncDefSnapshot,
+    Decorator: DecoratorSnapshot,
+    TypeInfo: TypeInfoSnapshot,
+    TypeVarExpr: TypeVarExprSnapshot,
+    TypeAlias: TypeAliasSnapshot,
+}
+"""Snapshot class of each kind of ``RelevantSymbolNode``"""
+
+ComparableSymbol = Union[RelevantSymbolNode, SymbolSnapshot]
+"""Symbol node or its snapshot, both of which can be compared and reported"""
+
+SNAPSHOT_FILE_FORMAT = "stubalyzer-snapshots"
+SNAPSHOT_FILE_VERSION = 2
+
+_FORMATTED_TYPES_MAX_SIZE = 4096
+# Formatted types by the id of the type object. The type objects are kept, so
+# their ids are not reused for other types while they are in here.
+_formatted_types: Dict[int, Tuple[object, str]] = {}
+
+
+def _format_type(mypy_type: object) -> str:
+    """
+    Format a mypy type for messages, reusing the string if the same type object
+    was formatted before.
+
+    :param mypy_type: type to format, or ``None``
+    """
+    cached = _formatted_types.get(id(mypy_type))
+    if cached is not None and cached[0] is mypy_type:
+        return cached[1]
+
+    formatted = repr(mypy_type)
+    if len(_formatted_types) >= _FORMATTED_TYPES_MAX_SIZE:
+        del _formatted_types[next(iter(_formatted_types))]
+    _formatted_types[id(mypy_type)] = (mypy_type, formatted)
+    return formatted
+
+
+def clear_formatted_types() -> None:
+    """
+    Forget the types that were formatted, so the build they belong to can be freed.
+    """
+    _formatted_types.clear()
+
+
+def _format_type_var(symbol: TypeVarExpr) -> str:
+    """
+    Format a TypeVarExpr as it would be written in code.
+
+    :param symbol: TypeVarExpr to format
+    """
+
+    variance = ""
+    if symbol.variance == COVARIANT:
+        variance = ", covariant=True"
+    elif symbol.variance == CONTRAVARIANT:
+        variance = ", contravariant=True"
+
+    values = ""
+    if symbol.values:
+        values = ", " + (", ".join(str(t) for t in symbol.values))
+
+    return f"{symbol.name} = TypeVar('{symbol.name}'{values}{variance})"
+
+
+def format_symbol_type(symbol: Union[SymbolNode, SymbolSnapshot]) -> str:
+    """
+    Get the type of the given symbol as a human readable string.
+
+    :param symbol: symbol or snapshot for which to get the type
+    """
+    if isinstance(symbol, SymbolSnapshot):
+        return symbol.type
+    if isinstance(symbol, TypeAlias):
+        return _format_type(symbol.target)
+    if isinstance(symbol, TypeVarExpr):
+        return _format_type_var(symbol)
+    if isinstance(symbol, TypeInfo):
+        return f"Class({symbol.fullname})"
+
+    return _format_type(getattr(symbol, "type", None))
+
+
+class _SnapshotTaker:
+    """
+    Take snapshots of symbol nodes, reusing the snapshot of nodes that were
+    snapshotted before (e.g. inherited class members).
+    """
+
+    def __init__(self) -> None:
+        # The nodes are kept, so their ids are not reused while taking snapshots
+        self.snapshots: Dict[int, Tuple[SymbolNode, SymbolSnapshot]] = {}
+
+    def take(
+        self, symbol: ComparableSymbol, path: Optional[str] = None
+    ) -> SymbolSnapshot:
+        if isinstance(symbol, SymbolSnapshot):
+            return symbol
+
+        known = self.snapshots.get(id(symbol))
+        if known is not None:
+            snapshot = known[1]
+            if snapshot.path is None:
+                snapshot.path = path
+            return snapshot
+
+        info = getattr(symbol, "info", None)
+        snapshot = SNAPSHOT_CLASSES[type(symbol)](
+            fullname=symbol.fullname,
+            path=path,
+            line=symbol.line,
+            column=symbol.column,
+            # Symbols without a class have a FakeInfo, which is falsy
+            class_fullname=info.fullname
+            if isinstance(info, TypeInfo) and info
+            else None,
+            type=format_symbol_type(symbol),
+            # Classes are compared by name only, their members are snapshotted
+            # separately
+            data=None
+            if isinstance(symbol, TypeInfo)
+            else json.dumps(symbol.serialize(), separators=(",", ":")).encode(),
+        )
+        # Registered before taking snapshots of the members, which may reference
+        # the class again
+        self.snapshots[id(symbol)] = (symbol, snapshot)
+
+        if isinstance(symbol, Decorator):
+            assert isinstance(snapshot, DecoratorSnapshot)
+            snapshot.decorators = [
+                get_expression_fullname(decorator)
+                for decorator in symbol.original_decorators
+            ]
+        elif isinstance(symbol, TypeInfo):
+            assert isinstance(snapshot, TypeInfoSnapshot)
+            snapshot.mro = [cls.fullname for cls in symbol.mro]
+            snapshot.members = {}
+            # Same order as TypeInfo.get, the first class defining a name wins
+            names = set()
+            for cls in symbol.mro:
+                for name, table_node in cls.names.items():
+                    if name in names:
+                        continue
+                    names.add(name)
+                    node = table_node.node
+                    if node is not None and type(node) in SNAPSHOT_CLASSES:
+                        snapshot.members[name] = self.take(node)  # type: ignore
+        return snapshot
+
+
+def snapshot_symbol(
+    symbol: ComparableSymbol, path: Optional[str] = None
+) -> SymbolSnapshot:
+    """
+    Take a snapshot of a symbol node.
+
+    :param symbol: the symbol node, snapshots are returned as they are
+    :param path: path of the stub file the symbol is defined in
+    """
+    return _SnapshotTaker().take(symbol, path)
+
+
+def take_snapshots(
+    stub_types: Iterable[Tuple[ComparableSymbol, str]]
+) -> List[Tuple[SymbolSnapshot, str]]:
+    """
+    Take snapshots of collected stub types (see
+    :py:func:`stubalyzer.collect.get_stub_types`).
+
+    Once the snapshots are taken, the mypy build the types were collected from can
+    be freed.
+
+    :param stub_types: the symbol nodes and the paths of the files they are defined in
+    :return: the snapshots and the paths of the files they are defined in, symbols
+        that are given multiple times (e.g. overloaded functions) get the same
+        snapshot
+    """
+    taker = _SnapshotTaker()
+    return [(taker.take(symbol, path), path) for symbol, path in stub_types]
+
+
+def _decorator_expression(fullname: Optional[str]) -> NameExpr:
+    expression = NameExpr(fullname.rsplit(".", 1)[-1] if fullname else "")
+    expression.fullname = fullname
+    return expression
+
+
+def restore_symbol(
+    snapshot: SymbolSnapshot, modules: Dict[str, MypyFile]
+) -> RelevantSymbolNode:
+    """
+    Restore a symbol node from its snapshot.
+
+    The classes referenced by the types of the symbol are looked up in the given
+    modules. Classes that are not found there are replaced by a placeholder class.
+
+    Restored classes are not fully functional, since they are only compared by name.
+
+    :param snapshot: snapshot of the symbol
+    :param modules: modules of a mypy build (``BuildResult.files``), which has to
+        include ``builtins``
+    """
+    symbol: RelevantSymbolNode
+    if isinstance(snapshot, TypeInfoSnapshot):
+        module_name, _, name = snapshot.fullname.rpartition(".")
+        defn = ClassDef(name, Block([]))
+        defn.fullname = snapshot.fullname
+        symbol = TypeInfo(SymbolTable(), defn, module_name)
+    else:
+        assert snapshot.data is not None
+        symbol = SymbolNode.deserialize(json.loads(snapshot.data))  # type: ignore
+        symbol.accept(NodeFixer(modules, allow_missing=True))
+        if isinstance(snapshot, DecoratorSnapshot):
+            assert isinstance(symbol, Decorator)
+            symbol.original_decorators = [
+                _decorator_expression(decorator) for decorator in snapshot.decorators
+            ]
+    # Not set_line, since deserialized functions have no arguments to update
+    symbol.line = snapshot.line
+    symbol.column = snapshot.column
+    return symbol
+
+
+_SNAPSHOT_CLASSES_BY_NAME = {cls.__name__: cls for cls in SNAPSHOT_CLASSES.values()}
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    """Unpickler that refuses to create anything but snapshots."""
+
+    def find_class(self, module: str, name: str) -> type:
+        snapshot_class = _SNAPSHOT_CLASSES_BY_NAME.get(name)
+        if module != __name__ or snapshot_class is None:
+            raise pickle.UnpicklingError(f"{module}.{name} is not a symbol snapshot")
+        return snapshot_class
+
+
+def write_snapshots(
+    file: BinaryIO,
+    snapshots: Iterable[SymbolSnapshot],
+    reexported_classes: Optional[Mapping[str, str]] = None,
+) -> None:
+    """
+    Write snapshots to a file, so they can be read with :py:func:`read_snapshots`.
+
+    The serialized types can only be read with the same mypy version, which is
+    stored along with the snapshots.
+
+    :param file: binary file to write to
+    :param snapshots: the snapshots to write
+    :param reexported_classes: full names of the classes the snapshotted stubs
+        re-export, by the names they are re-exported under (see
+        :py:func:`stubalyzer.collect.get_reexported_classes`)
+    """
+    pickle.dump(
+        (SNAPSHOT_FILE_FORMAT, SNAPSHOT_FILE_VERSION, mypy_version),
+        file,
+        pickle.HIGHEST_PROTOCOL,
+    )
+    pickle.dump(
+        (list(snapshots), dict(reexported_classes or {})),
+        file,
+        pickle.HIGHEST_PROTOCOL,
+    )
+
+
+def read_snapshots(
+    file: BinaryIO, reexported_classes: Optional[Dict[str, str]] = None
+) -> List[SymbolSnapshot]:
+    """
+    Read snapshots written by :py:func:`write_snapshots`.
+
+    Only snapshots are read from the file, nothing else can be unpickled from it.
+    The serialized types of the snapshots are not decoded until they are restored.
+
+    :param file: binary file to read from
+    :param reexported_classes: filled with the re-exported classes written along with
+        the snapshots
+    :raises ValueError: if the file does not contain snapshots, they were written
+        with a different mypy version or they cannot be read (e.g. the file is
+        truncated)
+    """
+    try:
+        header = _SnapshotUnpickler(file).load()
+    except (pickle.UnpicklingError, EOFError) as ex:
+        raise ValueError(f"Not a file of symbol snapshots: {ex}") from ex
+
+    if (
+        not isinstance(header, tuple)
+        or len(header) != 3
+        or header[:2] != (SNAPSHOT_FILE_FORMAT, SNAPSHOT_FILE_VERSION)
+    ):
+        raise ValueError("Not a file of symbol snapshots of this stubalyzer version.")
+    if header[2] != mypy_version:
+        raise ValueError(
+            f"The symbol snapshots were written with mypy {header[2]}, but mypy "
+            f"{mypy_version} is installed."
+        )
+
+    # A new unpickler, since the header and the snapshots are pickled separately
+    try:
+        snapshots, reexported = _SnapshotUnpickler(file).load()
+    except (pickle.UnpicklingError, EOFError) as ex:
+        raise ValueError(f"The symbol snapshots could not be read: {ex}") from ex
+    if reexported_classes is not None:
+        reexported_classes.update(reexported)
+    return list(snapshots)
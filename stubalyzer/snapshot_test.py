@@ -0,0 +1,227 @@
+import pickle
+from io import BytesIO
+from typing import Dict, Iterable, List, Tuple
+from unittest.mock import patch
+
+import pytest
+from mypy.nodes import Decorator, FuncDef, MypyFile, TypeInfo
+
+from testing.util import WithStubTestConfig
+
+from .analyze import compare
+from .collect import get_stub_types, get_stub_types_and_modules
+from .compare import compare_symbols
+from .lookup import lookup_symbol
+from .snapshot import (
+    ComparableSymbol,
+    DecoratorSnapshot,
+    FuncDefSnapshot,
+    SymbolSnapshot,
+    TypeInfoSnapshot,
+    read_snapshots,
+    restore_symbol,
+    snapshot_symbol,
+    take_snapshots,
+    write_snapshots,
+)
+from .types import RelevantSymbolNode
+
+
+class WithSnapshots(WithStubTestConfig):
+    _handwritten: Dict[RelevantSymbolNode, str]
+    _generated: List[Tuple[RelevantSymbolNode, str]]
+    _modules: Dict[str, MypyFile]
+
+    @classmethod
+    def setup_class(cls) -> None:
+        conf_path = cls.get_mypy_config_path()
+        handwritten, cls._modules = get_stub_types_and_modules(
+            cls.get_handwritten_stubs_path(), conf_path
+        )
+        cls._handwritten = dict(handwritten)
+        cls._generated = list(get_stub_types(cls.get_generated_stubs_path(), conf_path))
+
+    def get_snapshots(self) -> Tuple[List[SymbolSnapshot], List[SymbolSnapshot]]:
+        # Pickled like sending them to another process
+        handwritten, generated = pickle.loads(
+            pickle.dumps(
+                (
+                    take_snapshots(self._handwritten.items()),
+                    take_snapshots(self._generated),
+                )
+            )
+        )
+        return (
+            [snapshot for snapshot, _ in handwritten],
+            [snapshot for snapshot, _ in generated],
+        )
+
+
+class TestSnapshotSymbol(WithSnapshots):
+    def test_snapshot(self) -> None:
+        handwritten, _ = self.get_snapshots()
+        snapshots = {snapshot.fullname: snapshot for snapshot in handwritten}
+
+        method = snapshots["functions.additional_args"]
+        assert isinstance(method, FuncDefSnapshot)
+        assert method.kind == "FuncDef"
+        assert method.name == "additional_args"
+        assert method.path is not None and method.path.endswith("functions.pyi")
+        assert method.class_fullname is None
+
+        cls = snapshots["classes.AClass"]
+        assert isinstance(cls, TypeInfoSnapshot)
+        assert cls.type == "Class(classes.AClass)"
+        assert cls.mro == ["classes.AClass", "builtins.object"]
+        assert cls.members["a_method"] is snapshots["classes.AClass.a_method"]
+        assert cls.members["a_method"].class_fullname == "classes.AClass"
+        # Inherited members are included
+        assert cls.members["__init__"].fullname == "builtins.object.__init__"
+        assert cls.members["__init__"].path is None
+
+    def test_snapshots_do_not_reference_symbol_nodes(self) -> None:
+        symbol = next(
+            symbol for symbol in self._handwritten if isinstance(symbol, Decorator)
+        )
+        snapshot = snapshot_symbol(symbol, "path.pyi")
+
+        assert isinstance(snapshot, DecoratorSnapshot)
+        assert not hasattr(snapshot, "__dict__")
+        restored = restore_symbol(pickle.loads(pickle.dumps(snapshot)), self._modules)
+        assert isinstance(restored, Decorator)
+        assert restored is not symbol
+        assert restored.fullname == symbol.fullname
+        assert (restored.line, restored.column) == (symbol.line, symbol.column)
+        assert [getattr(d, "fullname") for d in restored.original_decorators] == [
+            getattr(d, "fullname") for d in symbol.original_decorators
+        ]
+
+    def test_restore_class(self) -> None:
+        symbol = next(
+            symbol for symbol in self._handwritten if isinstance(symbol, TypeInfo)
+        )
+        restored = restore_symbol(snapshot_symbol(symbol), self._modules)
+
+        assert isinstance(restored, TypeInfo)
+        assert restored.fullname == symbol.fullname
+        assert restored.module_name == symbol.module_name
+
+
+class TestCompareSnapshots(WithSnapshots):
+    def get_results(
+        self, handwritten: Iterable[ComparableSymbol], generated: List[SymbolSnapshot]
+    ) -> List[Tuple[str, str, str]]:
+        return [
+            (result.symbol_name, result.match_result.value, result.message)
+            for result in compare(handwritten, generated, self._modules)
+        ]
+
+    def test_snapshots_compare_like_symbol_nodes(self) -> None:
+        expected = [
+            (result.symbol_name, result.match_result.value, result.message)
+            for result in compare(
+                self._handwritten.keys(), [symbol for symbol, _ in self._generated]
+            )
+        ]
+        handwritten, generated = self.get_snapshots()
+
+        assert self.get_results(handwritten, generated) == expected
+        # Symbol nodes can be compared to snapshots
+        assert self.get_results(list(self._handwritten.keys()), generated) == expected
+
+    def test_results_reference_the_snapshots(self) -> None:
+        handwritten, generated = self.get_snapshots()
+
+        for result in compare(handwritten, generated, self._modules):
+            assert result.symbol in handwritten
+            assert result.reference is None or isinstance(
+                result.reference, SymbolSnapshot
+            )
+
+    def test_compare_snapshots_without_modules(self) -> None:
+        handwritten, generated = self.get_snapshots()
+
+        with pytest.raises(ValueError):
+            compare_symbols(handwritten[0], handwritten[0])
+
+
+class TestLookupSnapshots(WithSnapshots):
+    def test_mislocated_symbol(self) -> None:
+        handwritten, generated = self.get_snapshots()
+        symbol = next(
+            snapshot
+            for snapshot in handwritten
+            if snapshot.fullname
+            == "classes.ClassWithoutSuperClassInHandwritten.a_method"
+        )
+        generated_map = {snapshot.fullname: snapshot for snapshot in generated}
+
+        result = lookup_symbol(generated_map, symbol)
+
+        assert result.symbol is generated_map["classes.AClass.a_method"]
+        assert result.containing_class is generated_map["classes.AClass"]
+
+    def test_symbol_not_found(self) -> None:
+        _, generated = self.get_snapshots()
+        generated_map = {snapshot.fullname: snapshot for snapshot in generated}
+        symbol = next(
+            symbol for symbol in self._handwritten if isinstance(symbol, FuncDef)
+        )
+        snapshot = snapshot_symbol(symbol)
+        snapshot.fullname = "not_a_module.function"
+
+        assert lookup_symbol(generated_map, snapshot) == (None, None)
+
+
+class TestSnapshotFile(WithSnapshots):
+    def test_write_and_read(self) -> None:
+        handwritten, _ = self.get_snapshots()
+        file = BytesIO()
+
+        write_snapshots(file, handwritten)
+        file.seek(0)
+        snapshots = read_snapshots(file)
+
+        assert [s.fullname for s in snapshots] == [s.fullname for s in handwritten]
+        assert [s.data for s in snapshots] == [s.data for s in handwritten]
+
+    def test_write_and_read_reexported_classes(self) -> None:
+        file = BytesIO()
+
+        write_snapshots(file, [], {"pkg.Class": "pkg._impl.Class"})
+        file.seek(0)
+        reexported_classes: Dict[str, str] = {}
+        snapshots = read_snapshots(file, reexported_classes)
+
+        assert snapshots == []
+        assert reexported_classes == {"pkg.Class": "pkg._impl.Class"}
+
+    def test_read_other_pickles(self) -> None:
+        file = BytesIO()
+        pickle.dump(BytesIO(), file)
+        file.seek(0)
+
+        with pytest.raises(ValueError, match="Not a file of symbol snapshots"):
+            read_snapshots(file)
+
+    def test_read_snapshots_of_other_mypy_version(self) -> None:
+        file = BytesIO()
+        with patch("stubalyzer.snapshot.mypy_version", "0.1"):
+            write_snapshots(file, [])
+        file.seek(0)
+
+        with pytest.raises(ValueError, match="written with mypy 0.1"):
+            read_snapshots(file)
+
+    def test_read_truncated_snapshots(self) -> None:
+        handwritten, _ = self.get_snapshots()
+        file = BytesIO()
+        write_snapshots(file, handwritten)
+        file.seek(0)
+        pickle.load(file)
+        header_size = file.tell()
+        file.truncate(header_size + (len(file.getvalue()) - header_size) // 2)
+        file.seek(0)
+
+        with pytest.raises(ValueError, match="could not be read"):
+            read_snapshots(file)
@@ -0,0 +1,276 @@
+"""
+On-disk cache of the reference stubs generated by stubgen.
+
+The stubs are cached per top-level package. The cache key consists of the version of
+the installed distribution providing the package, the mypy (and thereby stubgen)
+version, the Python version, whether private definitions are included and the list of
+generated modules. When any of those change, the stubs are generated again.
+
+The cache can be inspected and pruned from the command line::
+
+    python -m stubalyzer.stubcache list CACHE_DIR
+    python -m stubalyzer.stubcache prune [--all] CACHE_DIR
+"""
+import json
+import sys
+from argparse import ArgumentParser
+from functools import lru_cache
+from hashlib import sha256
+from importlib.metadata import Distribution, distributions
+from os import replace
+from pathlib import Path
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+from typing import Dict, List, NamedTuple, Optional
+
+from mypy.version import __version__ as mypy_version
+
+STUBGEN_CACHE_NAMESPACE = "stubgen"
+METADATA_FILE_NAME = "metadata.json"
+STUBS_DIR_NAME = "stubs"
+MODULE_SUFFIXES = (".py", ".pyi", ".so", ".pyd")
+
+
+class StubCacheEntry(NamedTuple):
+    path: Path
+    package: str
+    version: str
+    mypy_version: str
+    python_version: str
+    include_private: bool
+    modules: List[str]
+    created: float
+
+
+@lru_cache(maxsize=None)
+def _get_top_level_distributions() -> Dict[str, Distribution]:
+    """
+    Map the names of all installed top-level packages and modules to the distribution
+    providing them.
+
+    If multiple distributions provide a package, the first one found on ``sys.path``
+    is used, as that is the one that gets imported.
+    """
+    result: Dict[str, Distribution] = {}
+    for distribution in distributions():
+        top_level = distribution.read_text("top_level.txt")
+        if top_level is not None:
+            names = set(top_level.split())
+        else:
+            names = set()
+            for file in distribution.files or []:
+                name = file.parts[0]
+                if name.endswith(MODULE_SUFFIXES):
+                    names.add(name.split(".")[0])
+                elif "." not in name and len(file.parts) > 1:
+                    names.add(name)
+        for name in names:
+            result.setdefault(name, distribution)
+    return result
+
+
+def get_distribution_version(package: str) -> Optional[str]:
+    """
+    Get the version of the installed distribution that provides the given top-level
+    package.
+
+    :param package: name of the top-level package or module
+    :return: the version or None, if the package is not provided by a distribution
+        (e.g. if it is part of the standard library or not installed)
+    """
+    distribution = _get_top_level_distributions().get(package)
+    return distribution.version if distribution is not None else None
+
+
+def get_python_version() -> str:
+    """Get the major and minor version of the running Python interpreter."""
+    return f"{sys.version_info.major}.{sys.version_info.minor}"
+
+
+class StubCache:
+    """
+    Cache for the reference stubs generated by stubgen.
+
+    :param cache_dir: the cache directory of stubalyzer, the stubs are stored in the
+        subdirectory ``STUBGEN_CACHE_NAMESPACE`` of it
+    """
+
+    def __init__(self, cache_dir: str):
+        self.path = Path(cache_dir, STUBGEN_CACHE_NAMESPACE)
+
+    def get_entry_path(
+        self, package: str, modules: List[str], include_private: bool
+    ) -> Optional[Path]:
+        """
+        Get the directory in which the stubs for the given modules are cached.
+
+        :param package: name of the top-level package of the modules
+        :param modules: names of the modules stubgen generates stubs for
+        :param include_private: whether stubgen includes private definitions
+        :return: the path or None, if the stubs of the package can't be cached since
+            its version is unknown
+        """
+        version = get_distribution_version(package)
+        if version is None:
+            return None
+
+        key = sha256(
+            json.dumps(
+                [
+                    package,
+                    version,
+                    mypy_version,
+                    get_python_version(),
+                    include_private,
+                    sorted(modules),
+                ]
+            ).encode()
+        ).hexdigest()[:16]
+        return self.path / f"{package}-{key}"
+
+    def load(
+        self, package: str, modules: List[str], include_private: bool
+    ) -> Optional[Dict[str, str]]:
+        """
+        Load the cached stubs of a package.
+
+        See :py:func:`StubCache.get_entry_path` for a description of the parameters.
+
+        :return: the text of the stubs by their path relative to the stubs directory,
+            or None if they are not cached
+        """
+        entry_path = self.get_entry_path(package, modules, include_private)
+        if entry_path is None or not (entry_path / METADATA_FILE_NAME).is_file():
+            return None
+
+        stubs_path = entry_path / STUBS_DIR_NAME
+        return {
+            path.relative_to(stubs_path).as_posix(): path.read_text()
+            for path in sorted(stubs_path.rglob("*.pyi"))
+        }
+
+    def store(
+        self,
+        package: str,
+        modules: List[str],
+        include_private: bool,
+        stubs: Dict[str, str],
+    ) -> None:
+        """
+        Store the stubs stubgen generated for a package.
+
+        See :py:func:`StubCache.get_entry_path` for a description of the parameters.
+
+        :param stubs: the text of the stubs by their path relative to the stubs
+            directory
+        """
+        entry_path = self.get_entry_path(package, modules, include_private)
+        if entry_path is None or entry_path.exists():
+            return
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        # Entries are written to a temporary directory first and then moved in place,
+        # so concurrent runs never see incomplete entries.
+        tmp_path = Path(mkdtemp(prefix=f".{package}-", dir=self.path))
+        for relative_path, text in stubs.items():
+            path = tmp_path / STUBS_DIR_NAME / relative_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(text)
+
+        (tmp_path / METADATA_FILE_NAME).write_text(
+            json.dumps(
+                {
+                    "package": package,
+                    "version": get_distribution_version(package),
+                    "mypy_version": mypy_version,
+                    "python_version": get_python_version(),
+                    "include_private": include_private,
+                    "modules": sorted(modules),
+                    "created": time(),
+                },
+                indent=4,
+            )
+        )
+        try:
+            replace(tmp_path, entry_path)
+        except OSError:
+            # Another run stored the same entry in the meantime
+            rmtree(tmp_path)
+
+    def entries(self) -> List[StubCacheEntry]:
+        """Get all entries of the cache, sorted by package and creation time."""
+        result = []
+        for metadata_path in self.path.glob(f"*/{METADATA_FILE_NAME}"):
+            metadata = json.loads(metadata_path.read_text())
+            result.append(StubCacheEntry(path=metadata_path.parent, **metadata))
+        return sorted(result, key=lambda entry: (entry.package, entry.created))
+
+    def is_stale(self, entry: StubCacheEntry) -> bool:
+        """
+        Check if an entry can no longer be used, since the package or mypy have been
+        updated (or uninstalled) since it was stored.
+
+        :param entry: the entry to check
+        """
+        return entry.path != self.get_entry_path(
+            entry.package, entry.modules, entry.include_private
+        )
+
+    def prune(self, prune_all: bool = False) -> List[StubCacheEntry]:
+        """
+        Remove stale entries from the cache.
+
+        :param prune_all: remove all entries instead
+        :return: the removed entries
+        """
+        removed = [
+            entry for entry in self.entries() if prune_all or self.is_stale(entry)
+        ]
+        for entry in removed:
+            rmtree(entry.path)
+        return removed
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Inspect and prune the stubgen cache")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="List all cached stubs")
+    prune_parser = subparsers.add_parser(
+        "prune",
+        help="Remove cached stubs of packages that have been updated since",
+    )
+    prune_parser.add_argument(
+        "--all",
+        dest="prune_all",
+        default=False,
+        action="store_true",
+        help="Remove all cached stubs",
+    )
+    for command_parser in [list_parser, prune_parser]:
+        command_parser.add_argument(
+            dest="cache_dir",
+            metavar="CACHE_DIR",
+            help="Cache directory given to stubalyzer with --cache-dir",
+        )
+    args = parser.parse_args()
+
+    cache = StubCache(args.cache_dir)
+    if args.command == "list":
+        for entry in cache.entries():
+            print(
+                f"{entry.package} {entry.version} "
+                f"(mypy {entry.mypy_version}, Python {entry.python_version}, "
+                f"{len(entry.modules)} modules"
+                f"{', private' if entry.include_private else ''})"
+                f"{' [stale]' if cache.is_stale(entry) else ''}"
+                f": {entry.path}"
+            )
+    else:
+        for entry in cache.prune(args.prune_all):
+            print(f"Removed {entry.package} {entry.version}: {entry.path}")
+
+
+if __name__ == "__main__":
+    main()
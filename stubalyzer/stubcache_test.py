@@ -0,0 +1,85 @@
+from pathlib import Path
+from unittest.mock import patch
+
+from .analyze import generate_reference_stubs
+from .stubcache import StubCache, get_distribution_version
+
+STUBS = {"attr/__init__.pyi": "x: int\n", "attr/filters.pyi": "y: str\n"}
+
+
+def write_stubs(path: Path) -> None:
+    for relative_path, text in STUBS.items():
+        (path / relative_path).parent.mkdir(parents=True, exist_ok=True)
+        (path / relative_path).write_text(text)
+
+
+def test_get_distribution_version() -> None:
+    assert get_distribution_version("attr") == "19.3.0"
+    assert get_distribution_version("os") is None
+    assert get_distribution_version("not_installed_package") is None
+
+
+class TestStubCache:
+    def test_store_and_load(self, tmp_path: Path) -> None:
+        cache = StubCache(str(tmp_path))
+
+        assert cache.load("attr", ["attr"], False) is None
+
+        cache.store("attr", ["attr"], False, STUBS)
+
+        assert cache.load("attr", ["attr"], False) == STUBS
+        assert cache.load("attr", ["attr"], True) is None
+        assert cache.load("attr", ["attr", "attr.filters"], False) is None
+
+    def test_packages_without_version_are_not_cached(self, tmp_path: Path) -> None:
+        cache = StubCache(str(tmp_path))
+
+        cache.store("os", ["os"], False, {"os.pyi": ""})
+
+        assert cache.entries() == []
+        assert cache.load("os", ["os"], False) is None
+
+    def test_entries_and_prune(self, tmp_path: Path) -> None:
+        cache = StubCache(str(tmp_path))
+        cache.store("attr", ["attr"], False, STUBS)
+        cache.store("attr", ["attr"], True, STUBS)
+
+        entries = cache.entries()
+        assert [(entry.package, entry.version) for entry in entries] == [
+            ("attr", "19.3.0"),
+            ("attr", "19.3.0"),
+        ]
+        assert not any(cache.is_stale(entry) for entry in entries)
+
+        # Simulate an entry of a previously installed version
+        entries[0].path.rename(cache.path / "attr-0000000000000000")
+
+        assert [entry.path for entry in cache.prune()] == [
+            cache.path / "attr-0000000000000000"
+        ]
+        assert [entry.path for entry in cache.entries()] == [entries[1].path]
+        assert [entry.path for entry in cache.prune(prune_all=True)] == [
+            entries[1].path
+        ]
+        assert cache.entries() == []
+
+
+def test_cached_stubs_skip_stubgen(tmp_path: Path) -> None:
+    write_stubs(tmp_path / "handwritten")
+
+    def generate(reference_stubs_path: Path) -> None:
+        generate_reference_stubs(
+            str(tmp_path / "handwritten"),
+            str(reference_stubs_path),
+            cache_dir=str(tmp_path / "cache"),
+        )
+
+    generate(tmp_path / "first")
+    with patch("stubalyzer.analyze.call_stubgen") as call_stubgen:
+        generate(tmp_path / "second")
+
+    call_stubgen.assert_not_called()
+    for path in (tmp_path / "first").rglob("*.pyi"):
+        relative_path = path.relative_to(tmp_path / "first")
+        assert (tmp_path / "second" / relative_path).read_text() == path.read_text()
+    assert len(list((tmp_path / "second").rglob("*.pyi"))) == 2
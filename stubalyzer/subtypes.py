@@ -0,0 +1,452 @@
+"""
+Memoized subtype checks.
+
+Stubs use the same types in many places, e.g. the type of ``self`` in every method
+of a class or a ``Union`` alias for all parameters of a kind. The results of
+:py:func:`mypy.subtypes.is_subtype` are cached by a structural key of the types
+(see :py:func:`type_key`), so checking the same pair of types again is a lookup.
+
+Classes and type aliases are part of the key by identity, so types from different
+mypy builds get different keys. Type aliases are not expanded, which keeps the keys
+of recursive aliases finite.
+
+Most handwritten types are written exactly like the reference types though, so
+before checking for a subtype, the canonical forms of both types are compared (see
+:py:func:`canonical_form`). It refers to classes by their full names and expands
+type aliases, so it is equal for the same types in different builds.
+
+Unions of many literals are checked against other unions by looking their members
+up in a set (see :py:func:`is_flat_union_subtype`), instead of comparing every
+member of one union to every member of the other.
+"""
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from mypy.subtypes import is_subtype
+from mypy.type_visitor import TypeVisitor
+from mypy.types import (
+    AnyType,
+    CallableType,
+    DeletedType,
+    ErasedType,
+    Instance,
+    LiteralType,
+    NoneType,
+    Overloaded,
+    ParamSpecType,
+    PartialType,
+    ProperType,
+    TupleType,
+    Type,
+    TypeAliasType,
+    TypedDictType,
+    TypeType,
+    TypeVarType,
+    UnboundType,
+    UninhabitedType,
+    UnionType,
+    get_proper_type,
+)
+
+TypeKey = Tuple[Hashable, ...]
+"""Hashable key of a type, equal for types that are structurally the same"""
+
+
+class _TypeKeyVisitor(TypeVisitor[Optional[TypeKey]]):
+    """
+    Build the key of a type, or ``None`` if it contains types that can not be
+    compared structurally (e.g. types that are only used during type checking).
+    """
+
+    def keys(self, types: Iterable[Type]) -> Optional[TypeKey]:
+        keys = []
+        for t in types:
+            key = t.accept(self)
+            if key is None:
+                return None
+            keys.append(key)
+        return tuple(keys)
+
+    def optional_key(self, t: Optional[Type]) -> Optional[TypeKey]:
+        return ("",) if t is None else t.accept(self)
+
+    def visit_unbound_type(self, t: UnboundType) -> Optional[TypeKey]:
+        return None
+
+    def visit_any(self, t: AnyType) -> Optional[TypeKey]:
+        return ("Any",)
+
+    def visit_none_type(self, t: NoneType) -> Optional[TypeKey]:
+        return ("None",)
+
+    def visit_uninhabited_type(self, t: UninhabitedType) -> Optional[TypeKey]:
+        return ("Uninhabited", t.is_noreturn)
+
+    def visit_erased_type(self, t: ErasedType) -> Optional[TypeKey]:
+        return None
+
+    def visit_deleted_type(self, t: DeletedType) -> Optional[TypeKey]:
+        return None
+
+    def visit_type_var(self, t: TypeVarType) -> Optional[TypeKey]:
+        values = self.keys(t.values)
+        upper_bound = t.upper_bound.accept(self)
+        if values is None or upper_bound is None:
+            return None
+        return (
+            "TypeVar",
+            t.fullname,
+            t.id.raw_id,
+            t.id.meta_level,
+            t.variance,
+            values,
+            upper_bound,
+        )
+
+    def visit_param_spec(self, t: ParamSpecType) -> Optional[TypeKey]:
+        upper_bound = t.upper_bound.accept(self)
+        if upper_bound is None:
+            return None
+        return (
+            "ParamSpec",
+            t.fullname,
+            t.id.raw_id,
+            t.id.meta_level,
+            t.flavor,
+            upper_bound,
+        )
+
+    def visit_instance(self, t: Instance) -> Optional[TypeKey]:
+        args = self.keys(t.args)
+        last_known_value = self.optional_key(t.last_known_value)
+        if args is None or last_known_value is None:
+            return None
+        return ("Instance", t.type, args, last_known_value)
+
+    def visit_callable_type(self, t: CallableType) -> Optional[TypeKey]:
+        arg_types = self.keys(t.arg_types)
+        ret_type = t.ret_type.accept(self)
+        fallback = t.fallback.accept(self)
+        variables = self.keys(t.variables)
+        type_guard = self.optional_key(t.type_guard)
+        if (
+            arg_types is None
+            or ret_type is None
+            or fallback is None
+            or variables is None
+            or type_guard is None
+        ):
+            return None
+        return (
+            "Callable",
+            arg_types,
+            tuple(t.arg_kinds),
+            tuple(t.arg_names),
+            ret_type,
+            fallback,
+            variables,
+            type_guard,
+            t.is_ellipsis_args,
+            t.special_sig,
+            t.from_type_type,
+        )
+
+    def visit_overloaded(self, t: Overloaded) -> Optional[TypeKey]:
+        items = self.keys(t.items)
+        if items is None:
+            return None
+        return ("Overloaded", items)
+
+    def visit_tuple_type(self, t: TupleType) -> Optional[TypeKey]:
+        items = self.keys(t.items)
+        fallback = t.partial_fallback.accept(self)
+        if items is None or fallback is None:
+            return None
+        return ("Tuple", items, fallback)
+
+    def visit_typeddict_type(self, t: TypedDictType) -> Optional[TypeKey]:
+        items = self.keys(t.items.values())
+        fallback = t.fallback.accept(self)
+        if items is None or fallback is None:
+            return None
+        return (
+            "TypedDict",
+            tuple(t.items),
+            items,
+            frozenset(t.required_keys),
+            fallback,
+        )
+
+    def visit_literal_type(self, t: LiteralType) -> Optional[TypeKey]:
+        fallback = t.fallback.accept(self)
+        if fallback is None:
+            return None
+        # Literal[True] and Literal[1] have equal values
+        return ("Literal", type(t.value).__name__, t.value, fallback)
+
+    def visit_union_type(self, t: UnionType) -> Optional[TypeKey]:
+        items = self.keys(t.items)
+        if items is None:
+            return None
+        return ("Union", items)
+
+    def visit_partial_type(self, t: PartialType) -> Optional[TypeKey]:
+        return None
+
+    def visit_type_type(self, t: TypeType) -> Optional[TypeKey]:
+        item = t.item.accept(self)
+        if item is None:
+            return None
+        return ("Type", item)
+
+    def visit_type_alias_type(self, t: TypeAliasType) -> Optional[TypeKey]:
+        args = self.keys(t.args)
+        if t.alias is None or args is None:
+            return None
+        return ("Alias", t.alias, args)
+
+
+class _CanonicalFormVisitor(_TypeKeyVisitor):
+    """
+    Build the canonical form of a type, which refers to classes by their full name
+    and to type aliases by their expanded target.
+    """
+
+    def __init__(self) -> None:
+        # Full names of the aliases being expanded, to stop at recursive aliases
+        self.expanding: Set[str] = set()
+
+    def visit_instance(self, t: Instance) -> Optional[TypeKey]:
+        if not t.type:
+            # Placeholder for a missing class
+            return None
+        args = self.keys(t.args)
+        last_known_value = self.optional_key(t.last_known_value)
+        if args is None or last_known_value is None:
+            return None
+        return ("Instance", t.type.fullname, args, last_known_value)
+
+    def visit_type_alias_type(self, t: TypeAliasType) -> Optional[TypeKey]:
+        if t.alias is None:
+            return None
+        args = self.keys(t.args)
+        if args is None:
+            return None
+        fullname = t.alias.fullname
+        if fullname in self.expanding:
+            return ("Alias", fullname, args)
+
+        self.expanding.add(fullname)
+        try:
+            target = t.alias.target.accept(self)
+        finally:
+            self.expanding.discard(fullname)
+        if target is None:
+            return None
+        return ("Alias", fullname, args, target)
+
+
+_type_key_visitor = _TypeKeyVisitor()
+
+
+def type_key(t: Type) -> Optional[TypeKey]:
+    """
+    Get a hashable key of the given type, which is equal for types that are
+    structurally the same.
+
+    :param t: type to get the key of
+    :return: the key, or ``None`` if the type can not be compared structurally
+    """
+    return t.accept(_type_key_visitor)
+
+
+def canonical_form(t: Type) -> Optional[TypeKey]:
+    """
+    Get the canonical form of the given type, which is equal for types that are
+    written the same, also if they are from different mypy builds.
+
+    :param t: type to get the canonical form of
+    :return: the canonical form, or ``None`` if the type can not be compared
+        structurally
+    """
+    return t.accept(_CanonicalFormVisitor())
+
+
+def _flat_union_members(t: Type) -> Optional[List[ProperType]]:
+    """
+    Get the members of a union (or of a single type) that only consists of
+    literals, instances of classes without type arguments and ``None``.
+
+    :param t: type to get the members of
+    :return: the members, or ``None`` if the type has other members
+    """
+    proper_type = get_proper_type(t)
+    items = proper_type.items if isinstance(proper_type, UnionType) else [proper_type]
+    members: List[ProperType] = []
+    for item in items:
+        member = get_proper_type(item)
+        if isinstance(member, LiteralType) and not member.fallback.args:
+            members.append(member)
+        elif isinstance(member, Instance) and not member.args and member.type:
+            members.append(member)
+        elif isinstance(member, NoneType):
+            members.append(member)
+        else:
+            return None
+    return members
+
+
+def _member_key(member: ProperType) -> Hashable:
+    """
+    Get the key of a member returned by :py:func:`_flat_union_members`, which is
+    equal for members that :py:func:`mypy.subtypes.is_subtype` considers the same:
+    instances are subtypes of the classes with the same full name, even of another
+    build, but literals are only equal if their classes are the same ``TypeInfo``.
+
+    :param member: literal, instance or ``None`` type
+    """
+    if isinstance(member, LiteralType):
+        # Literal[True] and Literal[1] have equal values
+        return (type(member.value).__name__, member.value, member.fallback.type)
+    if isinstance(member, Instance):
+        fullname: str = member.type.fullname
+        return fullname
+    return None
+
+
+def is_flat_union_subtype(left: Type, right: Type) -> Optional[bool]:
+    """
+    Check if left is a subtype of the union right, if both only consist of
+    literals, instances of classes without type arguments and ``None``.
+
+    Every member of left has to be a subtype of right. Members that are also a
+    member of right, and literals whose class is a member of right, are found in a
+    set of the members of right (see :py:func:`_member_key`). Only the remaining
+    members are checked with :py:func:`mypy.subtypes.is_subtype`, e.g. subclasses
+    of members of right and literals of another build.
+
+    :param left: type to check
+    :param right: union to check against
+    :return: whether left is a subtype of right, or ``None`` if the types are not
+        flat unions
+    """
+    if not isinstance(get_proper_type(right), UnionType):
+        return None
+    left_members = _flat_union_members(left)
+    right_members = _flat_union_members(right)
+    if left_members is None or right_members is None:
+        return None
+
+    right_keys = {_member_key(member) for member in right_members}
+    for member in left_members:
+        if _member_key(member) in right_keys:
+            continue
+        # A literal is a subtype of every union its class is a member of
+        if (
+            isinstance(member, LiteralType)
+            and _member_key(member.fallback) in right_keys
+        ):
+            continue
+        if not is_subtype(member, right):
+            return False
+    return True
+
+
+class SubtypeCacheStats(NamedTuple):
+    hits: int
+    misses: int
+    identical: int = 0
+    """Number of type pairs that were identical, without checking for a subtype"""
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of the checks that were answered from the cache"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class SubtypeCache:
+    """
+    Results of :py:func:`mypy.subtypes.is_subtype` by the keys of the compared
+    types. It is meant to live for a single run, as it keeps the compared classes
+    and type aliases alive.
+    """
+
+    def __init__(self) -> None:
+        self.results: Dict[Tuple[TypeKey, TypeKey], bool] = {}
+        self.hits = 0
+        self.misses = 0
+        self.identical = 0
+
+    def are_identical(self, left: Type, right: Type) -> bool:
+        """
+        Check if both types have the same canonical form (see
+        :py:func:`canonical_form`), which makes left a subtype of right.
+
+        :param left: type to check
+        :param right: type to check against
+        """
+        left_form = canonical_form(left)
+        if left_form is None or left_form != canonical_form(right):
+            return False
+        self.identical += 1
+        return True
+
+    def is_subtype(self, left: Type, right: Type) -> bool:
+        """
+        Check if left is a subtype of right, like :py:func:`mypy.subtypes.is_subtype`.
+
+        :param left: type to check
+        :param right: type to check against
+        """
+        left_key = type_key(left)
+        right_key = type_key(right)
+        if left_key is None or right_key is None:
+            self.misses += 1
+            return self._is_subtype(left, right)
+
+        key = (left_key, right_key)
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
+            result = self.results[key] = self._is_subtype(left, right)
+        else:
+            self.hits += 1
+        return result
+
+    @staticmethod
+    def _is_subtype(left: Type, right: Type) -> bool:
+        flat_union_result = is_flat_union_subtype(left, right)
+        if flat_union_result is not None:
+            return flat_union_result
+        return is_subtype(left, right)
+
+    def stats(self) -> SubtypeCacheStats:
+        """
+        Get the number of cache hits and misses and of identical types since the
+        cache was cleared
+        """
+        return SubtypeCacheStats(self.hits, self.misses, self.identical)
+
+    def add_stats(self, stats: SubtypeCacheStats) -> None:
+        """
+        Add the counts of a cache in another process.
+
+        :param stats: hits, misses and identical types to add
+        """
+        self.hits += stats.hits
+        self.misses += stats.misses
+        self.identical += stats.identical
+
+    def clear_results(self) -> None:
+        """
+        Remove all results, but keep the counters, e.g. once the build of the
+        compared types is not needed anymore.
+        """
+        self.results.clear()
+
+    def clear(self) -> None:
+        """Remove all results and reset the counters"""
+        self.results.clear()
+        self.hits = 0
+        self.misses = 0
+        self.identical = 0
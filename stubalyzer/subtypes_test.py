@@ -0,0 +1,195 @@
+from itertools import product
+from typing import Dict, Optional, Tuple
+
+import pytest
+from mypy.nodes import TypeAlias, Var
+from mypy.subtypes import is_subtype
+from mypy.types import (
+    AnyType,
+    CallableType,
+    NoneType,
+    TypeAliasType,
+    TypeOfAny,
+    UnionType,
+    get_proper_type,
+)
+
+from testing.util import MypyNodeFactory, WithStubTestConfig
+
+from .collect import get_stub_types
+from .subtypes import SubtypeCache, canonical_form, is_flat_union_subtype, type_key
+
+FLAT_UNION_VARS = [
+    "LITERAL_A",
+    "LITERAL_1",
+    "LITERAL_TRUE",
+    "LITERAL_RED",
+    "LITERALS_AB",
+    "LITERALS_ABC",
+    "LITERALS_1_TRUE",
+    "LITERALS_COLORS",
+    "OPTIONAL_LITERALS_AB",
+    "LITERAL_A_OR_INT",
+    "STR",
+    "COLOR",
+    "DERIVED",
+    "STR_OR_INT",
+    "STR_OR_NONE",
+    "BOOL_OR_BYTES",
+    "FLOAT_OR_STR",
+    "BASE_OR_NONE",
+    "DERIVED_OR_LITERAL_1",
+    "COLOR_OR_STR",
+    "OBJECT_OR_NONE",
+]
+
+
+class TestTypeKey:
+    def test_structurally_equal_types_have_equal_keys(
+        self, mypy_nodes: MypyNodeFactory
+    ) -> None:
+        function, _ = mypy_nodes.get_matching_func_node()
+        assert isinstance(function.type, CallableType)
+
+        copy = function.type.copy_modified()
+
+        assert copy is not function.type
+        assert type_key(copy) == type_key(function.type)
+        assert type_key(copy.copy_modified(ret_type=NoneType())) != type_key(copy)
+
+    def test_classes_of_different_builds_have_different_keys(
+        self, mypy_nodes: MypyNodeFactory
+    ) -> None:
+        function, function_generated = mypy_nodes.get_matching_func_node()
+        assert isinstance(function.type, CallableType)
+        assert isinstance(function_generated.type, CallableType)
+        ret_type, ret_type_generated = (
+            function.type.ret_type,
+            function_generated.type.ret_type,
+        )
+
+        assert str(ret_type) == str(ret_type_generated)
+        assert type_key(ret_type) != type_key(ret_type_generated)
+
+    def test_recursive_alias(self) -> None:
+        alias = TypeAlias(AnyType(TypeOfAny.special_form), "module.Alias", -1, -1)
+        alias_type = TypeAliasType(alias, [])
+        alias.target = UnionType([NoneType(), alias_type])
+
+        assert type_key(alias_type) == ("Alias", alias, ())
+        assert type_key(UnionType([alias_type])) == type_key(UnionType([alias_type]))
+
+
+class TestCanonicalForm:
+    def test_same_types_of_different_builds(self, mypy_nodes: MypyNodeFactory) -> None:
+        function, function_generated = mypy_nodes.get_matching_func_node()
+        assert function.type is not None and function_generated.type is not None
+        additional_args, _ = mypy_nodes.get_additional_args_node()
+        assert additional_args.type is not None
+
+        assert canonical_form(function.type) == canonical_form(function_generated.type)
+        assert canonical_form(function.type) != canonical_form(additional_args.type)
+
+    def test_aliases_are_expanded(self) -> None:
+        alias = TypeAlias(NoneType(), "module.Alias", -1, -1)
+        other_alias = TypeAlias(NoneType(), "module.Alias", -1, -1)
+
+        assert canonical_form(TypeAliasType(alias, [])) == canonical_form(
+            TypeAliasType(other_alias, [])
+        )
+
+        other_alias.target = AnyType(TypeOfAny.special_form)
+
+        assert canonical_form(TypeAliasType(alias, [])) != canonical_form(
+            TypeAliasType(other_alias, [])
+        )
+
+    def test_recursive_alias(self) -> None:
+        alias = TypeAlias(AnyType(TypeOfAny.special_form), "module.Alias", -1, -1)
+        alias_type = TypeAliasType(alias, [])
+        alias.target = UnionType([NoneType(), alias_type])
+
+        assert canonical_form(alias_type) == (
+            "Alias",
+            "module.Alias",
+            (),
+            ("Union", (("None",), ("Alias", "module.Alias", ()))),
+        )
+
+
+class TestFlatUnionSubtype(WithStubTestConfig):
+    _vars: Dict[str, Var]
+    _other_build_vars: Dict[str, Var]
+
+    @classmethod
+    def get_vars(cls) -> Dict[str, Var]:
+        return {
+            symbol.name: symbol
+            for symbol, _ in get_stub_types(
+                str(cls._base_dir / "test-stubs" / "test_flat_unions"),
+                cls.get_mypy_config_path(),
+            )
+            if isinstance(symbol, Var)
+        }
+
+    @classmethod
+    def setup_class(cls) -> None:
+        cls._vars = cls.get_vars()
+        cls._other_build_vars = cls.get_vars()
+
+    @pytest.mark.parametrize("other_build", [False, True])  # type: ignore
+    def test_same_results_as_is_subtype(self, other_build: bool) -> None:
+        right_vars = self._other_build_vars if other_build else self._vars
+        results: Dict[Tuple[str, str], Optional[bool]] = {}
+        expected: Dict[Tuple[str, str], Optional[bool]] = {}
+        for left, right in product(FLAT_UNION_VARS, repeat=2):
+            left_type = self._vars[left].type
+            right_type = right_vars[right].type
+            assert left_type is not None and right_type is not None
+            results[left, right] = is_flat_union_subtype(left_type, right_type)
+            if isinstance(get_proper_type(right_type), UnionType):
+                expected[left, right] = is_subtype(left_type, right_type)
+            else:
+                expected[left, right] = None
+
+        assert results == expected
+        assert sum(result is True for result in results.values()) > 20
+        assert sum(result is False for result in results.values()) > 20
+
+
+class TestSubtypeCache:
+    def test_cached_results(self, mypy_nodes: MypyNodeFactory) -> None:
+        int_var = mypy_nodes.get_int_var()
+        bool_var = mypy_nodes.get_bool_var()
+        assert int_var.type is not None and bool_var.type is not None
+        cache = SubtypeCache()
+
+        assert cache.is_subtype(bool_var.type, int_var.type)
+        assert not cache.is_subtype(int_var.type, bool_var.type)
+        assert cache.stats() == (0, 2, 0)
+
+        assert cache.is_subtype(bool_var.type, int_var.type)
+        assert not cache.is_subtype(int_var.type, bool_var.type)
+        assert cache.stats() == (2, 2, 0)
+        assert cache.stats().hit_rate == 0.5
+
+        cache.clear_results()
+
+        assert not cache.results
+        assert cache.stats() == (2, 2, 0)
+
+        cache.clear()
+
+        assert cache.stats() == (0, 0, 0)
+        assert cache.stats().hit_rate == 0.0
+
+    def test_identical_types(self, mypy_nodes: MypyNodeFactory) -> None:
+        function, function_generated = mypy_nodes.get_matching_func_node()
+        assert function.type is not None and function_generated.type is not None
+        additional_args, _ = mypy_nodes.get_additional_args_node()
+        assert additional_args.type is not None
+        cache = SubtypeCache()
+
+        assert cache.are_identical(function.type, function_generated.type)
+        assert not cache.are_identical(function.type, additional_args.type)
+        assert cache.stats() == (0, 0, 1)
@@ -31,3 +31,13 @@ def decorated_function(foo: Any): ...
 def decorated_with_additional_args(foo: Any) -> Any: ...
 @identity_decorator
 def decorated_with_additional_optional_args(foo: Any) -> Any: ...
+@overload
+def overloaded_reordered(foo: bytes, bar: int) -> bytes: ...
+@overload
+def overloaded_reordered(foo: int) -> int: ...
+@overload
+def overloaded_reordered(foo: str) -> str: ...
+@overload
+def overloaded_reordered_mismatching(foo: int) -> int: ...
+@overload
+def overloaded_reordered_mismatching(foo: bytes) -> bytes: ...
@@ -37,3 +37,9 @@ class ClassWithInvalidCustomStub:
     def argument_types_wrong(self, foo: str, bar: bool) -> bool: ...
     def return_type_less_specific(self, foo: int, bar: str) -> Any: ...
     def return_type_wrong(self, foo: int, bar: str) -> str: ...
+
+class ClassWithIdenticalStub:
+    an_attribute: int
+    def a_method(self, foo: int, bar: str = ...) -> str: ...
+    @classmethod
+    def a_classmethod(cls, foo: int) -> ClassWithIdenticalStub: ...
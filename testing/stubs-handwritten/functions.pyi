@@ -32,3 +32,13 @@ def decorated_function(foo: str) -> str: ...
 def decorated_with_additional_args(foo: int, bar: str) -> str: ...
 @identity_decorator
 def decorated_with_additional_optional_args(foo: int, bar: int = 0) -> str: ...
+@overload
+def overloaded_reordered(foo: str) -> str: ...
+@overload
+def overloaded_reordered(foo: int) -> int: ...
+@overload
+def overloaded_reordered(foo: bytes, bar: int) -> bytes: ...
+@overload
+def overloaded_reordered_mismatching(foo: str) -> str: ...
+@overload
+def overloaded_reordered_mismatching(foo: int) -> int: ...
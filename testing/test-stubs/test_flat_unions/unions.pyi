@@ -0,0 +1,31 @@
+from enum import Enum
+from typing import Literal, Optional, Union
+
+class Color(Enum):
+    RED: int
+    GREEN: int
+
+class Base: ...
+class Derived(Base): ...
+
+LITERAL_A: Literal["a"]
+LITERAL_1: Literal[1]
+LITERAL_TRUE: Literal[True]
+LITERAL_RED: Literal[Color.RED]
+LITERALS_AB: Literal["a", "b"]
+LITERALS_ABC: Literal["a", "b", "c"]
+LITERALS_1_TRUE: Literal[1, True]
+LITERALS_COLORS: Literal[Color.RED, Color.GREEN]
+OPTIONAL_LITERALS_AB: Optional[Literal["a", "b"]]
+LITERAL_A_OR_INT: Union[Literal["a"], int]
+STR: str
+COLOR: Color
+DERIVED: Derived
+STR_OR_INT: Union[str, int]
+STR_OR_NONE: Optional[str]
+BOOL_OR_BYTES: Union[bool, bytes]
+FLOAT_OR_STR: Union[float, str]
+BASE_OR_NONE: Optional[Base]
+DERIVED_OR_LITERAL_1: Union[Derived, Literal[1]]
+COLOR_OR_STR: Union[Color, str]
+OBJECT_OR_NONE: Optional[object]
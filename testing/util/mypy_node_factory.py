@@ -132,6 +132,16 @@ class MypyNodeFactory(WithStubTestConfig):
         node_name = "functions.overloaded_additional_optional_args"
         return self.get(node_name, OverloadedFuncDef)
 
+    def get_overloaded_reordered(self) -> Tuple[OverloadedFuncDef, OverloadedFuncDef]:
+        node_name = "functions.overloaded_reordered"
+        return self.get(node_name, OverloadedFuncDef)
+
+    def get_overloaded_reordered_mismatching(
+        self,
+    ) -> Tuple[OverloadedFuncDef, OverloadedFuncDef]:
+        node_name = "functions.overloaded_reordered_mismatching"
+        return self.get(node_name, OverloadedFuncDef)
+
     def get_decorated_function(self) -> Tuple[Decorator, Decorator]:
         node_name = "functions.decorated_function"
         return self.get(node_name, Decorator)
@@ -154,6 +164,10 @@ class MypyNodeFactory(WithStubTestConfig):
         node_name = "classes.AnotherClass"
         return self.get(node_name, TypeInfo)
 
+    def get_class_with_identical_stub(self) -> Tuple[TypeInfo, TypeInfo]:
+        node_name = "classes.ClassWithIdenticalStub"
+        return self.get(node_name, TypeInfo)
+
     def get_method(self) -> Tuple[FuncDef, FuncDef]:
         node_name = "classes.AClass.a_method"
         return self.get(node_name, FuncDef)